@@ -0,0 +1,201 @@
+# asgi_app.py
+# Async serving mode for the code backend: uvicorn asgi_app:app --port 5002
+import asyncio
+import time
+
+import ollama
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from code_backend import (
+    sessions, build_prompt, sse_event, SYSTEM_PROMPT, HISTORY_TOKEN_BUDGET, HISTORY_TRIM_BLOCK, ANALYSIS_TIMEOUT,
+    CHAT_OPTIONS, LLM_MODEL, explanation_messages, metrics_messages, parse_metrics,
+)
+from backpressure import Backpressure, Overloaded
+from session_store import estimate_tokens, trim_history
+
+# Requests past MAX_ACTIVE in flight wait for a slot; past MAX_WAITING queued
+# they are turned away with a 503 instead of piling up
+MAX_ACTIVE = 256
+MAX_WAITING = 512
+llm = ollama.AsyncClient()
+analysis_client = ollama.AsyncClient(timeout=ANALYSIS_TIMEOUT)
+limiter = Backpressure(MAX_ACTIVE, MAX_WAITING)
+
+
+async def explain_optimization(prompt: str, code: str) -> str:
+    explanation = await analysis_client.chat(model=LLM_MODEL, messages=explanation_messages(prompt, code), **CHAT_OPTIONS)
+    return explanation["message"]["content"]
+
+
+async def estimate_metrics(prompt: str, code: str) -> dict:
+    metrics_response = await analysis_client.chat(model=LLM_MODEL, messages=metrics_messages(prompt, code), **CHAT_OPTIONS)
+    return parse_metrics(metrics_response["message"]["content"])
+
+
+async def _named(name, coro):
+    try:
+        return name, await coro, None
+    except Exception as e:
+        return name, None, str(e)
+
+
+# Yield (name, result, error) for each analysis call as it finishes; calls
+# still running at the deadline are cancelled and reported as timed out
+async def collect_analysis(prompt: str, code: str, timeout: float = ANALYSIS_TIMEOUT):
+    tasks = {
+        asyncio.ensure_future(_named("reason", explain_optimization(prompt, code))): "reason",
+        asyncio.ensure_future(_named("metrics", estimate_metrics(prompt, code))): "metrics",
+    }
+    pending = set(tasks)
+    deadline = time.monotonic() + timeout
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                yield task.result()
+        for task in pending:
+            yield tasks[task], None, "timed out"
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def analyze_optimization(prompt: str, code: str):
+    results = {"reason": "", "metrics": {}}
+    errors = {}
+    async for name, result, error in collect_analysis(prompt, code):
+        if error is None:
+            results[name] = result
+        else:
+            errors[name] = error
+    return results["reason"], results["metrics"], errors
+
+
+async def generate_code(request):
+    data = await request.json()
+    prompt = data.get("prompt")
+    optimize = data.get("optimize", False)
+    session_id = data.get("session_id", "default")
+
+    if not prompt:
+        return JSONResponse({"error": "Prompt is required"}, status_code=400)
+
+    try:
+        await limiter.acquire()
+    except Overloaded:
+        return JSONResponse({"error": "Server busy, retry later"}, status_code=503, headers={"Retry-After": "1"})
+
+    streaming = False
+    try:
+        full_prompt = build_prompt(prompt, optimize)
+        user_message = {"role": "user", "content": full_prompt}
+        budget = HISTORY_TOKEN_BUDGET - estimate_tokens(full_prompt)
+        # Session stores may block (SQLite), so they are used from a thread
+        history = await asyncio.to_thread(sessions.get_history, session_id)
+        messages = trim_history([SYSTEM_PROMPT] + history, budget, block=HISTORY_TRIM_BLOCK) + [user_message]
+
+        if str(data.get("stream", "")).lower() in ("1", "true", "yes"):
+            streaming = True
+            return limiter.hold(StreamingResponse(
+                stream_code(prompt, optimize, session_id, messages),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            ))
+
+        response = await llm.chat(model=LLM_MODEL, messages=messages, **CHAT_OPTIONS)
+        code = response["message"]["content"]
+        await asyncio.to_thread(sessions.append, session_id, [user_message, {"role": "assistant", "content": code}])
+
+        reason = ""
+        metrics_data = {}
+        errors = {}
+        if optimize:
+            reason, metrics_data, errors = await analyze_optimization(prompt, code)
+
+        result = {
+            "code": code,
+            "reason": reason,
+            "metrics": metrics_data
+        }
+        if errors:
+            result["analysis_errors"] = errors
+        return JSONResponse(result)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        # Streaming responses hold their slot until the stream finishes
+        if not streaming:
+            limiter.release()
+
+
+async def stream_code(prompt: str, optimize: bool, session_id: str, messages: list):
+    started = time.perf_counter()
+    yield sse_event("metadata", {"optimize": optimize})
+    first_token_ms = None
+    parts = []
+    final = {}
+    try:
+        async for chunk in await llm.chat(model=LLM_MODEL, messages=messages, stream=True, **CHAT_OPTIONS):
+            content = chunk["message"]["content"]
+            if content:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000
+                parts.append(content)
+                yield sse_event("token", {"content": content})
+            if chunk.get("done"):
+                final = chunk
+        code = "".join(parts)
+        await asyncio.to_thread(sessions.append, session_id, [messages[-1], {"role": "assistant", "content": code}])
+        code_ms = (time.perf_counter() - started) * 1000
+
+        results = {"reason": "", "metrics": {}}
+        errors = {}
+        if optimize:
+            async for name, result, error in collect_analysis(prompt, code):
+                if error is None:
+                    results[name] = result
+                    yield sse_event("analysis", {name: result})
+                else:
+                    errors[name] = error
+                    yield sse_event("analysis", {name: None, "error": error})
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+
+    yield sse_event("done", {
+        "code": code,
+        "reason": results["reason"],
+        "metrics": results["metrics"],
+        "analysis_errors": errors,
+        "timings": {
+            "first_token_ms": first_token_ms,
+            "code_ms": code_ms,
+            "total_ms": (time.perf_counter() - started) * 1000,
+            "eval_count": final.get("eval_count"),
+            "eval_ms": (final.get("eval_duration") or 0) / 1e6,
+        },
+    })
+
+
+async def clear_session(request):
+    data = await request.json()
+    await asyncio.to_thread(sessions.clear, data.get("session_id", "default"))
+    return JSONResponse({"status": "cleared"})
+
+
+app = Starlette(
+    routes=[
+        Route("/api/code", generate_code, methods=["POST"]),
+        Route("/api/clear", clear_session, methods=["POST"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+)
@@ -1,13 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import ollama
 import re
 import json
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+from session_store import create_session_store, estimate_tokens, trim_history
 
 app = Flask(__name__)
 CORS(app)
 
-conversations = {}
+# Session history: in-process LRU by default, SQLite when shared across workers
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "3000"))
+# Keep the model loaded between requests, always with the same context size
+# (a different num_ctx makes Ollama reload it), and trim history in blocks of
+# messages so the server's cached prompt prefix survives several turns
+HISTORY_TRIM_BLOCK = int(os.environ.get("HISTORY_TRIM_BLOCK", "8"))
+LLM_MODEL = "llama3"
+CHAT_OPTIONS = {
+    "keep_alive": os.environ.get("OLLAMA_KEEP_ALIVE", "30m"),
+    "options": {"num_ctx": int(os.environ.get("OLLAMA_NUM_CTX", "8192"))},
+}
+sessions = create_session_store(SESSION_BACKEND, path="code_sessions.db", max_sessions=1000, ttl=3600, max_messages=100,
+                                 trim_block=HISTORY_TRIM_BLOCK)
+
+SYSTEM_PROMPT = {
+    "role": "system",
+    "content": (
+        "You are a helpful coding assistant. "
+        "When users ask for code, return only the code wrapped in triple backticks (```). "
+        "Do not add any extra explanation unless specifically asked to explain."
+    )
+}
 
 # Utility: Detect intent based on prompt
 def detect_intent(prompt: str) -> str:
@@ -56,41 +83,60 @@ def generate_code():
     try:
         full_prompt = build_prompt(prompt, optimize)
 
-        # Initialize session
-        if session_id not in conversations:
-            conversations[session_id] = [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a helpful coding assistant. "
-                        "When users ask for code, return only the code wrapped in triple backticks (```). "
-                        "Do not add any extra explanation unless specifically asked to explain."
-                    )
-                }
-            ]
-
-        conversations[session_id].append({"role": "user", "content": full_prompt})
+        user_message = {"role": "user", "content": full_prompt}
+        # Older turns are dropped once the history outgrows the token budget
+        budget = HISTORY_TOKEN_BUDGET - estimate_tokens(full_prompt)
+        messages = trim_history(
+            [SYSTEM_PROMPT] + sessions.get_history(session_id), budget, block=HISTORY_TRIM_BLOCK
+        ) + [user_message]
+
+        if str(data.get("stream", "")).lower() in ("1", "true", "yes"):
+            return stream_code(prompt, optimize, session_id, messages)
 
         # Get code from LLM
-        response = ollama.chat(model="llama3", messages=conversations[session_id])
+        response = ollama.chat(model=LLM_MODEL, messages=messages, **CHAT_OPTIONS)
         code = response["message"]["content"]
-        conversations[session_id].append({"role": "assistant", "content": code})
+        sessions.append(session_id, [user_message, {"role": "assistant", "content": code}])
 
         reason = ""
         metrics_data = {}
+        errors = {}
 
         # If optimization requested, explain and evaluate
         if optimize:
-            # Explanation: Why optimized version is better
-            explanation_prompt = (
-                f"Compare the original and optimized code below and explain the improvements:\n\n"
-                f"Original Code:\n{prompt}\n\nOptimized Code:\n{code}"
-            )
-            explanation = ollama.chat(model="llama3", messages=[{"role": "user", "content": explanation_prompt}])
-            reason = explanation["message"]["content"]
-
-            # Metrics: Estimate time/space complexity
-            metrics_prompt = f"""
+            reason, metrics_data, errors = analyze_optimization(prompt, code)
+
+        result = {
+            "code": code,
+            "reason": reason,
+            "metrics": metrics_data
+        }
+        if errors:
+            result["analysis_errors"] = errors
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Analysis calls in optimize mode run concurrently; each has its own deadline
+ANALYSIS_TIMEOUT = 60
+analysis_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="analysis")
+# The client-side timeout aborts the HTTP request, so timed-out calls do not
+# keep holding a model slot
+analysis_client = ollama.Client(timeout=ANALYSIS_TIMEOUT)
+
+# Analysis prompts and parsing, shared with the async app (asgi_app.py)
+def explanation_messages(prompt: str, code: str) -> list:
+    # Explanation: Why optimized version is better
+    content = (
+        f"Compare the original and optimized code below and explain the improvements:\n\n"
+        f"Original Code:\n{prompt}\n\nOptimized Code:\n{code}"
+    )
+    return [{"role": "user", "content": content}]
+
+def metrics_messages(prompt: str, code: str) -> list:
+    # Metrics: Estimate time/space complexity
+    content = f"""
 Estimate and compare the runtime performance and memory usage (space complexity) between the following two versions of code. Give the result as a JSON:
 {{
   "time_complexity": {{ "original": "...", "optimized": "..." }},
@@ -104,28 +150,124 @@ Original Code:
 Optimized Code:
 {code}
 """
-            metrics_response = ollama.chat(model="llama3", messages=[{"role": "user", "content": metrics_prompt}])
-            metrics_text = metrics_response["message"]["content"]
+    return [{"role": "user", "content": content}]
+
+def parse_metrics(text: str) -> dict:
+    try:
+        return json.loads(text.strip())
+    except json.JSONDecodeError:
+        return {"error": "Failed to parse metrics"}
+
+def explain_optimization(prompt: str, code: str) -> str:
+    explanation = analysis_client.chat(model=LLM_MODEL, messages=explanation_messages(prompt, code), **CHAT_OPTIONS)
+    return explanation["message"]["content"]
+
+def estimate_metrics(prompt: str, code: str) -> dict:
+    metrics_response = analysis_client.chat(model=LLM_MODEL, messages=metrics_messages(prompt, code), **CHAT_OPTIONS)
+    return parse_metrics(metrics_response["message"]["content"])
+
+# Start both analysis calls; they only depend on the prompt and the generated code
+def start_analysis(prompt: str, code: str) -> dict:
+    return {
+        analysis_pool.submit(explain_optimization, prompt, code): "reason",
+        analysis_pool.submit(estimate_metrics, prompt, code): "metrics",
+    }
 
+# Yield (name, result, error) for each analysis call as it finishes. Calls
+# still running at the deadline are cancelled and reported as timed out.
+def collect_analysis(futures: dict, timeout: float = ANALYSIS_TIMEOUT):
+    try:
+        for future in as_completed(futures, timeout=timeout):
             try:
-                metrics_data = json.loads(metrics_text.strip())
-            except json.JSONDecodeError:
-                metrics_data = {"error": "Failed to parse metrics"}
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, str(e)
+    except FuturesTimeout:
+        for future, name in futures.items():
+            if not future.done():
+                future.cancel()
+                yield name, None, "timed out"
+
+# Explanation and complexity metrics for an optimized snippet; failed calls
+# leave their default and are listed in the returned errors
+def analyze_optimization(prompt: str, code: str):
+    results = {"reason": "", "metrics": {}}
+    errors = {}
+    for name, result, error in collect_analysis(start_analysis(prompt, code)):
+        if error is None:
+            results[name] = result
+        else:
+            errors[name] = error
+    return results["reason"], results["metrics"], errors
+
+# Server-sent event framing
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        return jsonify({
+# Streaming variant of /api/code: `token` events while the code is generated,
+# then one `analysis` event per finished analysis call (optimize mode only)
+# and a final `done` event with timings
+def stream_code(prompt: str, optimize: bool, session_id: str, messages: list) -> Response:
+    started = time.perf_counter()
+
+    def generate():
+        yield sse_event("metadata", {"optimize": optimize})
+        first_token_ms = None
+        parts = []
+        final = {}
+        try:
+            for chunk in ollama.chat(model=LLM_MODEL, messages=messages, stream=True, **CHAT_OPTIONS):
+                content = chunk["message"]["content"]
+                if content:
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                    parts.append(content)
+                    yield sse_event("token", {"content": content})
+                if chunk.get("done"):
+                    final = chunk
+            code = "".join(parts)
+            sessions.append(session_id, [messages[-1], {"role": "assistant", "content": code}])
+            code_ms = (time.perf_counter() - started) * 1000
+
+            results = {"reason": "", "metrics": {}}
+            errors = {}
+            if optimize:
+                for name, result, error in collect_analysis(start_analysis(prompt, code)):
+                    if error is None:
+                        results[name] = result
+                        yield sse_event("analysis", {name: result})
+                    else:
+                        errors[name] = error
+                        yield sse_event("analysis", {name: None, "error": error})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+
+        yield sse_event("done", {
             "code": code,
-            "reason": reason,
-            "metrics": metrics_data
+            "reason": results["reason"],
+            "metrics": results["metrics"],
+            "analysis_errors": errors,
+            "timings": {
+                "first_token_ms": first_token_ms,
+                "code_ms": code_ms,
+                "total_ms": (time.perf_counter() - started) * 1000,
+                "eval_count": final.get("eval_count"),
+                "eval_ms": (final.get("eval_duration") or 0) / 1e6,
+            },
         })
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # Clear session history
 @app.route("/api/clear", methods=["POST"])
 def clear_session():
     session_id = request.get_json().get("session_id", "default")
-    conversations.pop(session_id, None)
+    sessions.clear(session_id)
     return jsonify({"status": "cleared"})
 
 # Run server
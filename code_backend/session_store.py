@@ -0,0 +1,225 @@
+# session_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def estimate_tokens(text):
+    """
+    Rough token count (~4 characters per token for English text with the
+    llama tokenizer); good enough for budgeting prompt history.
+    """
+    return len(text) // 4 + 1
+
+
+def trim_history(messages, budget, block=1):
+    """
+    Keep the most recent messages whose estimated size fits in `budget`
+    tokens, dropping the oldest first. Leading system messages are always
+    kept and count against the budget. With `block` > 1 the number of
+    dropped messages is rounded up to a multiple of it, so the history
+    keeps starting at the same message for several turns. That only holds
+    if the stored history itself starts on a block boundary, which session
+    stores created with the same `trim_block` guarantee.
+    """
+    system = []
+    while len(system) < len(messages) and messages[len(system)]["role"] == "system":
+        system.append(messages[len(system)])
+    rest = messages[len(system):]
+
+    used = sum(estimate_tokens(m["content"]) for m in system)
+    kept = []
+    for message in reversed(rest):
+        cost = estimate_tokens(message["content"])
+        if used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    dropped = len(rest) - len(kept)
+    if dropped and block > 1:
+        cut = -(-dropped // block) * block  # rounded up to a whole block
+        kept = rest[cut:]
+    # Don't start the history with an orphaned assistant reply
+    while kept and kept[0]["role"] == "assistant":
+        kept.pop(0)
+    return system + kept
+
+
+def _overflow(count, max_messages, block):
+    # Oldest messages to drop: enough to get under max_messages, in whole blocks
+    excess = count - max_messages
+    return -(-excess // block) * block if excess > 0 else 0
+
+
+class MemorySessionStore:
+    """
+    Per-process LRU of session histories. Sessions expire `ttl` seconds after
+    their last use, at most `max_sessions` are kept, and each keeps at most
+    `max_messages` messages. Old messages are dropped `trim_block` at a
+    time, so a history always starts at a multiple of `trim_block` counted
+    from the session's first message, and trim_history's block boundaries
+    stay put as the session grows.
+    """
+
+    def __init__(self, max_sessions=1000, ttl=3600, max_messages=100, trim_block=1):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.trim_block = trim_block
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_history(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if time.time() - entry[0] > self.ttl:
+                del self._sessions[session_id]
+                return []
+            self._sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def append(self, session_id, messages):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            history = entry[1] if entry is not None and now - entry[0] <= self.ttl else []
+            history.extend(messages)
+            del history[:_overflow(len(history), self.max_messages, self.trim_block)]
+            self._sessions[session_id] = (now, history)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict(self, now):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        # Oldest entries are at the front, so expired ones come off first
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self._sessions[session_id]
+
+
+class SQLiteSessionStore:
+    """
+    Session histories in a SQLite file, shared by every worker process that
+    points at the same path. Same limits as MemorySessionStore.
+    """
+
+    def __init__(self, path, max_sessions=1000, ttl=3600, max_messages=100, trim_block=1):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.trim_block = trim_block
+        self._local = threading.local()
+        self._appends = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+            CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used);
+        """)
+
+    def _db(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front; a failed statement
+        # must roll back or the thread's connection stays inside it
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def get_history(self, session_id):
+        db = self._db()
+        row = db.execute("SELECT last_used FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return []
+        rows = db.execute(
+            "SELECT message FROM (SELECT id, message FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?) "
+            "ORDER BY id",
+            (session_id, self.max_messages),
+        ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def append(self, session_id, messages):
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT last_used FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is not None and now - row[0] > self.ttl:
+                db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            db.execute(
+                "INSERT INTO sessions (session_id, last_used) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_used = excluded.last_used",
+                (session_id, now),
+            )
+            db.executemany(
+                "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                [(session_id, json.dumps(m)) for m in messages],
+            )
+            count = db.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+            overflow = _overflow(count, self.max_messages, self.trim_block)
+            if overflow:
+                db.execute(
+                    "DELETE FROM messages WHERE id IN "
+                    "(SELECT id FROM messages WHERE session_id = ? ORDER BY id LIMIT ?)",
+                    (session_id, overflow),
+                )
+
+        self._appends += 1
+        if self._appends % 100 == 0:
+            self._evict(now)
+
+    def clear(self, session_id):
+        with self._transaction() as db:
+            db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _evict(self, now):
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM sessions WHERE last_used < ? OR session_id IN "
+                "(SELECT session_id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (now - self.ttl, self.max_sessions),
+            )
+            db.execute("DELETE FROM messages WHERE session_id NOT IN (SELECT session_id FROM sessions)")
+
+
+def create_session_store(backend="memory", path=None, **limits):
+    if backend == "sqlite":
+        return SQLiteSessionStore(path or "sessions.db", **limits)
+    if backend == "memory":
+        return MemorySessionStore(**limits)
+    raise ValueError(f"Unknown session backend: {backend!r}")
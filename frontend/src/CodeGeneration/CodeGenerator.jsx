@@ -1,6 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import './CodeGenerator.css';
 import { Chart } from 'chart.js/auto';
+import { readEventStream } from '../sse';
 
 const CodeGenerator = ({ onLogout, onPdfQaNavigate }) => {
   const [prompt, setPrompt] = useState('');
@@ -25,12 +26,28 @@ const CodeGenerator = ({ onLogout, onPdfQaNavigate }) => {
       const res = await fetch('http://localhost:5002/api/code', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ prompt, session_id: sessionId.current })
+        body: JSON.stringify({ prompt, session_id: sessionId.current, stream: true })
       });
 
-      const data = await res.json();
-      setResponse(data.code || '');
-      setHistory(prev => [...prev, { prompt, response: data.code }]);
+      if (!res.ok) {
+        const data = await res.json();
+        console.error('Error:', data.error);
+        return;
+      }
+      setResponse('');
+      let streamed = '';
+      await readEventStream(res, (event, data) => {
+        if (event === 'token') {
+          streamed += data.content;
+          setResponse(streamed);
+          setLoading(false);
+        } else if (event === 'done') {
+          setResponse(data.code || '');
+          setHistory(prev => [...prev, { prompt, response: data.code }]);
+        } else if (event === 'error') {
+          console.error('Error:', data.error);
+        }
+      });
     } catch (err) {
       console.error('Error:', err);
     } finally {
@@ -1,5 +1,6 @@
 import React, { useState, useRef } from 'react';
 import './PdfQa.css';
+import { readEventStream } from '../sse';
 
 const PdfQa = ({ onLogout, onCodeGeneratorNavigate }) => {
   const [pdfFile, setPdfFile] = useState(null);
@@ -11,6 +12,7 @@ const PdfQa = ({ onLogout, onCodeGeneratorNavigate }) => {
   const [loading, setLoading] = useState(false);
   const [copied, setCopied] = useState(false);
   const [history, setHistory] = useState([]);
+  const [documentId, setDocumentId] = useState(null);
   const sessionId = useRef(Date.now().toString());
 
   const handleFileChange = (e) => {
@@ -21,33 +23,76 @@ const PdfQa = ({ onLogout, onCodeGeneratorNavigate }) => {
     setQuestion('');
     setSummary('');
     setMetadata({});
+    setDocumentId(null);
     setCopied(false);
   };
 
+  // Large PDFs are indexed in the background: a 202 carries the ingestion
+  // job, which is polled until done before the request is retried by id
+  const postDocumentForm = async (url, fields) => {
+    const buildForm = (docId) => {
+      const formData = new FormData();
+      if (docId) {
+        formData.append('document_id', docId);
+      } else {
+        formData.append('file', pdfFile);
+      }
+      Object.entries(fields).forEach(([key, value]) => formData.append(key, value));
+      return formData;
+    };
+
+    const res = await fetch(url, { method: 'POST', body: buildForm(documentId) });
+    if (res.status !== 202) return res;
+
+    let { job } = await res.json();
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      job = await (await fetch(`http://localhost:5001/api/ingest/${job.job_id}`)).json();
+    }
+    if (job.status !== 'done') throw new Error(job.error || 'Indexing failed');
+    setDocumentId(job.document_id);
+    return fetch(url, { method: 'POST', body: buildForm(job.document_id) });
+  };
+
   const handleAsk = async () => {
   if (!pdfFile || !question.trim()) return;
   setLoading(true);
   setCopied(false);
 
-  const formData = new FormData();
-  formData.append('file', pdfFile);
-  formData.append('question', question);
-  formData.append('session_id', sessionId.current);
-
   try {
-    const res = await fetch('http://localhost:5001/api/pdfqa', {
-      method: 'POST',
-      body: formData,
-    });
-    const data = await res.json();
-    setAnswerEn(data.answer?.en || '');
-    setAnswerMni(data.answer?.mni || '');
-    setMetadata(data.metadata || {});
-    setHistory((prev) => [...prev, {
+    const res = await postDocumentForm('http://localhost:5001/api/pdfqa', {
       question,
-      answer_en: data.answer?.en || '',
-      answer_mni: data.answer?.mni || ''
-    }]);
+      session_id: sessionId.current,
+      stream: 'true',
+    });
+    if (!res.ok) {
+      const data = await res.json();
+      console.error('Error:', data.error);
+      return;
+    }
+    setAnswerEn('');
+    setAnswerMni('');
+    let streamed = '';
+    await readEventStream(res, (event, data) => {
+      if (event === 'metadata') {
+        setMetadata(data.metadata || {});
+        if (data.document_id) setDocumentId(data.document_id);
+        setLoading(false);
+      } else if (event === 'token') {
+        streamed += data.content;
+        setAnswerEn(streamed);
+      } else if (event === 'done') {
+        setAnswerEn(data.answer?.en || '');
+        setAnswerMni(data.answer?.mni || '');
+        setHistory((prev) => [...prev, {
+          question,
+          answer_en: data.answer?.en || '',
+          answer_mni: data.answer?.mni || ''
+        }]);
+      } else if (event === 'error') {
+        console.error('Error:', data.error);
+      }
+    });
   } catch (err) {
     console.error('Error:', err);
   } finally {
@@ -60,17 +105,13 @@ const PdfQa = ({ onLogout, onCodeGeneratorNavigate }) => {
     if (!pdfFile) return;
     setLoading(true);
 
-    const formData = new FormData();
-    formData.append('file', pdfFile);
-    formData.append('session_id', sessionId.current);
-
     try {
-      const res = await fetch('http://localhost:5001/api/summary', {
-        method: 'POST',
-        body: formData,
+      const res = await postDocumentForm('http://localhost:5001/api/summary', {
+        session_id: sessionId.current,
       });
       const data = await res.json();
       setSummary(data.summary || '');
+      if (data.document_id) setDocumentId(data.document_id);
     } catch (err) {
       console.error('Summary error:', err);
     } finally {
@@ -1,99 +1,524 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from translator import translate_to_english, is_transliterated_manipuri
-from rag_engine import chunk_pdf_text, build_faiss_index, retrieve_chunks
-import fitz  # PyMuPDF
+from translator import translate_to_english, registry as translator_registry
+from lang_router import is_manipuri, router as lang_router
+from reranker import dedupe, pack, select_context
+from pdf_parser import parse_pdf_stream, start_pool as start_parse_pool
+from index_cache import index_cache
+from query_cache import query_cache
+from embedding_service import embedding_service
+from document_store import resolve_request_document, get_document, document_pdf_path
+from image_extractor import image_extractor
+from ingest_queue import IngestQueue, ACTIVE_STATUSES
+from summarizer import summarize_document, pinned_summary
+from prompt_builder import build_prompt, chat_options
+import metrics
+from metrics import span
+from collection_store import get_collection, is_valid_collection_name
+from session_store import create_session_store
+from config import (
+    SESSION_BACKEND, SESSION_DB_PATH, SESSION_MAX_SESSIONS, SESSION_TTL, SESSION_MAX_MESSAGES, HISTORY_TRIM_BLOCK,
+    LLM_MODEL, TRANSLATOR_PRELOAD, TRANSLATOR_WARMUP,
+    CONTEXT_CANDIDATES, CONTEXT_TOKEN_BUDGET,
+    EXTRACT_IMAGES, INGEST_DB_PATH, INGEST_WORKERS, INGEST_MAX_ATTEMPTS, INGEST_RETRY_DELAY, INGEST_LEASE, INGEST_WAIT_SECONDS,
+    INGEST_JOB_RETENTION,
+)
 import ollama
-import tempfile
+import json
 import os
+import time
 
 app = Flask(__name__)
 CORS(app)
 
-conversations = {}
+# Fork the page-parsing workers before any background thread exists
+start_parse_pool()
+
+# Translation models load on first Manipuri query unless asked for earlier:
+# preload before a pre-forking server (e.g. gunicorn --preload) starts workers
+# so they share the weights, or warm up in the background after startup
+if TRANSLATOR_PRELOAD:
+    translator_registry.preload()
+elif TRANSLATOR_WARMUP:
+    translator_registry.warm_up()
+
+sessions = create_session_store(
+    SESSION_BACKEND,
+    path=SESSION_DB_PATH,
+    max_sessions=SESSION_MAX_SESSIONS,
+    ttl=SESSION_TTL,
+    max_messages=SESSION_MAX_MESSAGES,
+    trim_block=HISTORY_TRIM_BLOCK,
+)
+
+# New uploads are indexed by background workers; requests wait up to
+# INGEST_WAIT_SECONDS (or the `wait` form field) and then get a 202 with the
+# job to poll
+ingest_jobs = IngestQueue(
+    INGEST_DB_PATH,
+    lambda pdf_path, data=None: index_pdf(pdf_path, data),
+    workers=INGEST_WORKERS,
+    max_attempts=INGEST_MAX_ATTEMPTS,
+    retry_delay=INGEST_RETRY_DELAY,
+    lease=INGEST_LEASE,
+    retention=INGEST_JOB_RETENTION,
+)
+ingest_jobs.start()
+
+# Every request gets a trace for its stage timings; clients see the breakdown
+# when they send `timings=true` (form field) or an `X-Timings: 1` header
+@app.before_request
+def begin_trace():
+    metrics.start_trace()
+
+@app.after_request
+def record_request(response):
+    # For streamed responses this is the time until the stream starts
+    trace = metrics.current_trace()
+    if trace is not None:
+        metrics.request_seconds.observe(
+            time.perf_counter() - trace.started,
+            endpoint=request.endpoint or "unknown",
+            status=response.status_code,
+        )
+    return response
+
+def wants_timings():
+    return wants_stream(request.form.get('timings')) or wants_stream(request.headers.get('X-Timings'))
+
+def timing_breakdown():
+    return metrics.current_trace().breakdown() if wants_timings() else None
 
 @app.route('/api/pdfqa', methods=['POST'])
 def handle_pdf_qa():
-    file = request.files['file']
+    started = time.perf_counter()
     question = request.form['question']
     session_id = request.form['session_id']
+    try:
+        options = retrieval_options(request.form)
+    except ValueError:
+        return jsonify({"error": INVALID_RETRIEVAL_OPTIONS}), 400
 
-    if session_id not in conversations:
-        conversations[session_id] = []
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp:
-        file.save(temp.name)
-        pdf_path = temp.name
-
-    text = extract_pdf_text(pdf_path)
-    metadata = extract_pdf_metadata(pdf_path)
-    chunks = chunk_pdf_text(text)
-    build_faiss_index(chunks, session_id)
+    with span("resolve_document"):
+        document, error = resolve_request_document(request, index_pdf, queue=ingest_jobs, wait=ingest_wait(request.form))
+    if error:
+        return jsonify(error[0]), error[1]
+    doc_id = document['document_id']
+    metadata = document['metadata']
 
    
-    if is_transliterated_manipuri(question):
+    if is_manipuri(question, session_id):
         try:
-            question = translate_to_english(question)
+            with span("translate"):
+                question = translate_to_english(question)
         except Exception as e:
             print("Translation error:", e)
             return jsonify({"error": "Translation failed"}), 500
 
-    retrieved_chunks = retrieve_chunks(question, session_id)
-    context_text = "\n\n".join([chunk['text'] for chunk in retrieved_chunks])
+    # Repeated or near-identical questions reuse the earlier answer; on a miss
+    # the query embedding computed for the semantic check is reused below.
+    # A follow-up ("why?", "tell me more") depends on the conversation, so
+    # only questions that open a session share answers.
+    history = sessions.get_history(session_id)
+    cached, cache_level, query_vec = None, None, None
+    if not history:
+        with span("query_cache"):
+            cached, cache_level, query_vec = query_cache.lookup(
+                doc_id, question, embedding_service.encode_query, options
+            )
+        metrics.cache_lookups.inc(cache="query", result=cache_level or "miss")
+    if cached:
+        retrieved_chunks = cached['chunks']
+    else:
+        with span("retrieve"):
+            retrieved_chunks = select_context(question, doc_id, query_vec=query_vec, **options)
+        metrics.chunks_retrieved.inc(len(retrieved_chunks))
+    header = {
+        "document_id": doc_id,
+        "metadata": metadata,
+        "retrieved_pages": [chunk.get('page_num') for chunk in retrieved_chunks],
+        "cached": cache_level,
+    }
+
+    if cached:
+        remember_turn(session_id, question, cached['answer'])
+        if wants_stream(request.form.get('stream')):
+            return stream_cached(cached['answer'], header, started)
+        return jsonify(with_timings({
+            "answer": {
+                "en": cached['answer'],
+                "mni": None
+            },
+            "metadata": metadata,
+            "document_id": doc_id,
+            "cached": cache_level
+        }))
+
+    with span("build_prompt"):
+        context_text = "\n\n".join([chunk['text'] for chunk in retrieved_chunks])
+        prompt = build_prompt(
+            context_text, question, history,
+            metadata=metadata, summary=pinned_summary(doc_id),
+        )
+
+    def on_answer(answer_en):
+        remember_turn(session_id, question, answer_en)
+        if not history:
+            query_cache.put(doc_id, question, query_vec, answer_en, retrieved_chunks, options)
 
-    prompt = build_prompt(context_text, question, conversations[session_id])
-    response = ollama.chat(model='llama3', messages=prompt)
+    if wants_stream(request.form.get('stream')):
+        return stream_chat(prompt, header, started, on_answer)
+
+    with span("llm"):
+        response = ollama.chat(model=LLM_MODEL, messages=prompt, **chat_options(LLM_MODEL))
+    metrics.record_llm_response(response, prompt)
     answer_en = response['message']['content'].strip()
+    on_answer(answer_en)
+
+    return jsonify(with_timings({
+        "answer": {
+            "en": answer_en,
+            "mni": None
+        },
+        "metadata": metadata,
+        "document_id": doc_id,
+        "cached": None
+    }))
+
+def with_timings(payload):
+    breakdown = timing_breakdown()
+    if breakdown is not None:
+        payload["timings"] = breakdown
+    return payload
+
+INVALID_RETRIEVAL_OPTIONS = "dense_weight and lexical_weight must be non-negative numbers, context_tokens a positive integer"
+
+def retrieval_options(form):
+    # Optional per-query retrieval settings: mode (hybrid/dense/lexical), RRF
+    # weights, cross-encoder reranking and the context token budget. Raises
+    # ValueError for values that are not numbers or are out of range
+    options = {}
+    if form.get('retrieval_mode') in ('hybrid', 'dense', 'lexical'):
+        options['mode'] = form['retrieval_mode']
+    for name in ('dense_weight', 'lexical_weight'):
+        if form.get(name):
+            options[name] = float(form[name])
+            if not 0 <= options[name] < float('inf'):
+                raise ValueError(name)
+    if form.get('rerank'):
+        options['rerank'] = wants_stream(form['rerank'])
+    if form.get('context_tokens'):
+        options['token_budget'] = int(form['context_tokens'])
+        if options['token_budget'] <= 0:
+            raise ValueError('context_tokens')
+    return options
+
+def ingest_wait(form):
+    # Seconds a request may block on a document that is still being indexed
+    try:
+        return max(0.0, min(float(form.get('wait', INGEST_WAIT_SECONDS)), 300.0))
+    except ValueError:
+        return INGEST_WAIT_SECONDS
+
+def remember_turn(session_id, question, answer):
+    sessions.append(session_id, [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer},
+    ])
+
+def wants_stream(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chat(prompt, header, started, on_answer):
+    """
+    Server-sent events: a `metadata` event with retrieval results, one `token`
+    event per streamed piece of the answer, then `done` with the full answer
+    and timing stats (or `error`). `on_answer` receives the complete answer.
+    """
+    trace = metrics.current_trace() if wants_timings() else None
+
+    def generate():
+        yield sse_event("metadata", header)
+        request_ms = (time.perf_counter() - started) * 1000
+        first_token_ms = None
+        parts = []
+        final = {}
+        try:
+            with span("llm"):
+                for chunk in ollama.chat(model=LLM_MODEL, messages=prompt, stream=True, **chat_options(LLM_MODEL)):
+                    content = chunk['message']['content']
+                    if content:
+                        if first_token_ms is None:
+                            first_token_ms = (time.perf_counter() - started) * 1000
+                            metrics.llm_first_token_seconds.observe(first_token_ms / 1000)
+                        parts.append(content)
+                        yield sse_event("token", {"content": content})
+                    if chunk.get('done'):
+                        final = chunk
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+
+        metrics.record_llm_response(final, prompt, trace)
+        answer_en = "".join(parts).strip()
+        on_answer(answer_en)
+        timings = {
+            "pre_llm_ms": request_ms,
+            "first_token_ms": first_token_ms,
+            "total_ms": (time.perf_counter() - started) * 1000,
+            "prompt_eval_count": final.get('prompt_eval_count'),
+            "prompt_eval_ms": (final.get('prompt_eval_duration') or 0) / 1e6,
+            "eval_count": final.get('eval_count'),
+            "eval_ms": (final.get('eval_duration') or 0) / 1e6,
+        }
+        if trace is not None:
+            timings["stages_ms"] = trace.breakdown()["stages_ms"]
+        yield sse_event("done", {
+            "answer": {"en": answer_en, "mni": None},
+            "timings": timings,
+        })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
-    conversations[session_id].append({"role": "user", "content": question})
-    conversations[session_id].append({"role": "assistant", "content": answer_en})
+def stream_cached(answer_en, header, started):
+    # Same event sequence as stream_chat, for answers served from the cache
+    def generate():
+        yield sse_event("metadata", header)
+        yield sse_event("token", {"content": answer_en})
+        yield sse_event("done", {
+            "answer": {"en": answer_en, "mni": None},
+            "timings": {"total_ms": (time.perf_counter() - started) * 1000},
+        })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/api/summary', methods=['POST'])
+def summarize_pdf():
+    document, error = resolve_request_document(request, index_pdf, queue=ingest_jobs, wait=ingest_wait(request.form))
+    if error:
+        return jsonify(error[0]), error[1]
+    doc_id = document['document_id']
+
+    try:
+        scope = summary_scope(request.form)
+    except ValueError:
+        return jsonify({"error": "page_from and page_to must be integers"}), 400
+    with span("summarize"):
+        result = summarize_document(doc_id, document['metadata'], **scope)
+    if not result['sections']:
+        return jsonify({"error": "No matching section"}), 404
+
+    return jsonify(with_timings({
+        "summary": result['summary'],
+        "sections": result['sections'],
+        "document_id": doc_id
+    }))
+
+def summary_scope(form):
+    # Optional `section` heading text and page range to narrow a summary to
+    page_from = form.get('page_from')
+    page_to = form.get('page_to')
+    return {
+        "section": form.get('section') or None,
+        "page_from": int(page_from) if page_from else None,
+        "page_to": int(page_to) if page_to else None,
+    }
+
+@app.route('/api/ingest', methods=['POST'])
+def submit_ingest():
+    if 'file' not in request.files:
+        return jsonify({"error": "File is required"}), 400
+    job = ingest_jobs.submit(request.files['file'].read())
+    return jsonify(job), 200 if job['status'] == 'done' else 202
+
+@app.route('/api/ingest/<job_id>', methods=['GET'])
+def get_ingest(job_id):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route('/api/ingest/<job_id>/events', methods=['GET'])
+def ingest_events(job_id):
+    # `progress` events whenever the job changes, then one `done` or `failed`
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def generate(job):
+        last = None
+        while True:
+            if job != last:
+                last = job
+                if job['status'] not in ACTIVE_STATUSES:
+                    yield sse_event(job['status'], job)
+                    return
+                yield sse_event("progress", job)
+            time.sleep(ingest_jobs.poll_interval)
+            job = ingest_jobs.get(job_id)
+
+    return Response(
+        stream_with_context(generate(job)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/api/documents/<document_id>/images', methods=['GET'])
+def list_document_images(document_id):
+    if get_document(document_id) is None:
+        return jsonify({"error": "Unknown document_id"}), 404
+    payload, status = image_listing(document_id)
+    return jsonify(payload), status
+
+def image_listing(document_id):
+    # Images are extracted in the background: right after indexing when
+    # EXTRACT_IMAGES is set, otherwise on the first request for them
+    images = image_extractor.images_for(document_id)
+    if images is None:
+        image_extractor.submit(document_id, document_pdf_path(document_id))
+        return {"status": "extracting"}, 202
+    return {
+        "document_id": document_id,
+        "images": [dict(image, url=f"/api/images/{image['file']}") for image in images]
+    }, 200
+
+@app.route('/api/images/<name>', methods=['GET'])
+def get_image(name):
+    image_extractor.touch(name)
+    return send_from_directory(os.path.abspath(image_extractor.folder), name, max_age=86400)
+
+@app.route('/api/collections/<name>', methods=['GET'])
+def list_collection(name):
+    if not is_valid_collection_name(name):
+        return jsonify({"error": "Invalid collection name"}), 400
+    return jsonify({"name": name, "documents": get_collection(name).list_documents()})
+
+@app.route('/api/collections/<name>/documents', methods=['POST'])
+def add_to_collection(name):
+    if not is_valid_collection_name(name):
+        return jsonify({"error": "Invalid collection name"}), 400
+    document, error = resolve_request_document(request, index_pdf, queue=ingest_jobs, wait=ingest_wait(request.form))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    added = get_collection(name).add_document(document['document_id'])
+    return jsonify({
+        "document_id": document['document_id'],
+        "metadata": document['metadata'],
+        "added": added
+    })
+
+@app.route('/api/collections/<name>/documents/<document_id>', methods=['DELETE'])
+def remove_from_collection(name, document_id):
+    if not is_valid_collection_name(name):
+        return jsonify({"error": "Invalid collection name"}), 400
+    if not get_collection(name).remove_document(document_id):
+        return jsonify({"error": "Document not in collection"}), 404
+    return jsonify({"status": "removed"})
+
+@app.route('/api/collections/<name>/query', methods=['POST'])
+def query_collection(name):
+    if not is_valid_collection_name(name):
+        return jsonify({"error": "Invalid collection name"}), 400
+    data = request.get_json()
+    question = data.get('question')
+    session_id = data.get('session_id', 'default')
+    if not question:
+        return jsonify({"error": "Question is required"}), 400
+
+    retrieved_chunks, context_text = collection_context(name, question, data)
+    prompt = build_prompt(context_text, question, sessions.get_history(session_id))
+    response = ollama.chat(model=LLM_MODEL, messages=prompt, **chat_options(LLM_MODEL))
+    metrics.record_llm_response(response, prompt)
+    answer_en = response['message']['content'].strip()
+    remember_turn(session_id, question, answer_en)
 
     return jsonify({
         "answer": {
             "en": answer_en,
             "mni": None
         },
-        "metadata": metadata
+        "sources": collection_sources(retrieved_chunks)
     })
 
-@app.route('/api/summary', methods=['POST'])
-def summarize_pdf():
-    file = request.files['file']
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp:
-        file.save(temp.name)
-        pdf_path = temp.name
+def collection_context(name, question, data):
+    # Search a collection with the request's filters and pack the hits into
+    # the context budget; returns (chunks, context text)
+    top_k = int(data.get('top_k', 5))
+    candidates = get_collection(name).search(
+        question,
+        top_k=top_k * CONTEXT_CANDIDATES,
+        document_ids=data.get('document_ids'),
+        page_from=data.get('page_from'),
+        page_to=data.get('page_to'),
+        title=data.get('title'),
+        author=data.get('author'),
+    )
+    # Chunks from different documents have no neighbours to expand into
+    retrieved_chunks = pack(dedupe(list(enumerate(candidates))), candidates, top_k, CONTEXT_TOKEN_BUDGET, expand=0)
+    context_text = "\n\n".join(
+        f"[{chunk['title']}, page {chunk['page_num']}]\n{chunk['text']}" for chunk in retrieved_chunks
+    )
+    return retrieved_chunks, context_text
 
-    text = extract_pdf_text(pdf_path)
-    prompt = f"Summarize the following PDF content:\n\n{text}"
+def collection_sources(chunks):
+    return [
+        {"document_id": c['document_id'], "title": c['title'], "page_num": c['page_num']}
+        for c in chunks
+    ]
 
-    response = ollama.chat(model='llama3', messages=[
-        {"role": "system", "content": "You are a helpful assistant that summarizes PDF content."},
-        {"role": "user", "content": prompt}
-    ])
-    summary = response['message']['content'].strip()
+@app.route('/api/clear', methods=['POST'])
+def clear_session():
+    session_id = request.get_json().get('session_id', 'default')
+    sessions.clear(session_id)
+    lang_router.forget(session_id)
+    return jsonify({"status": "cleared"})
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    for cache, stats in (("index", index_cache.stats()), ("query", query_cache.stats())):
+        for stat, value in stats.items():
+            metrics.cache_stats.set(value, cache=cache, stat=stat)
+    for status, count in ingest_jobs.stats().items():
+        metrics.ingest_jobs.set(count, status=status)
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
     return jsonify({
-        "summary": summary
+        "index_cache": index_cache.stats(),
+        "query_cache": query_cache.stats(),
+        "ingest_jobs": ingest_jobs.stats(),
     })
 
-def extract_pdf_text(path):
-    doc = fitz.open(path)
-    return "\n".join(page.get_text() for page in doc).strip()
+def index_pdf(pdf_path, data=None):
+    # A single open of the document (from memory when the upload bytes are at
+    # hand) serves both the metadata and the page text
+    chunks, metadata = parse_pdf_stream(pdf_path, data=data, metadata_fn=extract_pdf_metadata)
+    if EXTRACT_IMAGES:
+        image_extractor.submit(os.path.splitext(os.path.basename(pdf_path))[0], pdf_path)
+    return chunks, metadata
 
-def extract_pdf_metadata(path):
-    doc = fitz.open(path)
-    meta = doc.metadata
+def extract_pdf_metadata(doc):
+    meta = doc.metadata or {}
     return {
         "title": meta.get('title', ''),
         "author": meta.get('author', ''),
         "subject": meta.get('subject', ''),
         "keywords": meta.get('keywords', ''),
+        "page_count": doc.page_count,
     }
 
-def build_prompt(context, question, chat_history):
-    system_prompt = {"role": "system", "content": "You are an expert PDF question answering assistant."}
-    messages = [system_prompt] + chat_history + [{"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}]
-    return messages
-
 if __name__ == '__main__':
     app.run(port=5001)
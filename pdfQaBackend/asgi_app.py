@@ -0,0 +1,513 @@
+# asgi_app.py
+"""
+Async serving mode for the PDF QA backend:
+
+    uvicorn asgi_app:app --port 5001
+
+Requests wait on the model server without holding a thread. Parsing,
+embedding and retrieval run on a bounded thread pool, and requests beyond
+ASGI_MAX_ACTIVE in flight plus ASGI_MAX_WAITING queued get a 503. It
+serves the same routes as app.py, sharing its helpers.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ollama
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from app import (
+    sessions, ingest_jobs, ingest_wait, summary_scope, remember_turn,
+    retrieval_options, INVALID_RETRIEVAL_OPTIONS, sse_event, wants_stream, image_listing, collection_context,
+    collection_sources,
+)
+from backpressure import Backpressure, Overloaded
+from collection_store import get_collection, is_valid_collection_name
+from config import ASGI_CPU_WORKERS, ASGI_IO_WORKERS, ASGI_MAX_ACTIVE, ASGI_MAX_WAITING, LLM_MODEL
+from document_store import get_document
+from embedding_service import embedding_service
+from image_extractor import image_extractor
+import metrics
+from index_cache import index_cache
+from ingest_queue import ACTIVE_STATUSES
+from metrics import span
+from query_cache import query_cache
+from reranker import select_context
+from prompt_builder import build_prompt, chat_options
+from summarizer import summarize_document, pinned_summary
+from translator import translate_to_english
+from lang_router import is_manipuri, router as lang_router
+
+cpu_executor = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix="asgi-cpu")
+# Blocking I/O (SQLite sessions and jobs, summary files) gets its own pool so
+# a lock wait never holds up CPU work
+io_executor = ThreadPoolExecutor(max_workers=ASGI_IO_WORKERS, thread_name_prefix="asgi-io")
+llm = ollama.AsyncClient()
+limiter = Backpressure(ASGI_MAX_ACTIVE, ASGI_MAX_WAITING)
+
+
+async def _run_in(executor, func, *args, **kwargs):
+    # The copied context carries the request's trace into the worker thread
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, lambda: context.run(func, *args, **kwargs)
+    )
+
+
+async def run_cpu(func, *args, **kwargs):
+    return await _run_in(cpu_executor, func, *args, **kwargs)
+
+
+async def run_io(func, *args, **kwargs):
+    return await _run_in(io_executor, func, *args, **kwargs)
+
+
+class RequestMetrics:
+    """
+    ASGI middleware that starts a trace per request and records its latency,
+    including the whole body for streamed responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = metrics.start_trace()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.request_seconds.observe(
+                time.perf_counter() - trace.started,
+                endpoint=getattr(scope.get("endpoint"), "__name__", "unknown"),
+                status=status[0],
+            )
+
+
+def wants_timings(request, form):
+    return wants_stream(form.get('timings')) or wants_stream(request.headers.get('X-Timings'))
+
+
+def overloaded():
+    return JSONResponse({"error": "Server busy, retry later"}, status_code=503, headers={"Retry-After": "1"})
+
+
+async def resolve_document(form):
+    """
+    Async counterpart of document_store.resolve_request_document: uploads go
+    through the ingestion queue, and a document still indexing after the
+    request's wait time comes back as a 202 with its job.
+    """
+    doc_id = form.get('document_id')
+    upload = form.get('file')
+    if doc_id and upload is None:
+        document = await run_io(get_document, doc_id)
+        if document is not None:
+            return document, None
+        job = await run_io(ingest_jobs.job_for_document, doc_id)
+        if job is None:
+            return None, JSONResponse({"error": "Unknown document_id"}, status_code=404)
+    elif upload is None:
+        return None, JSONResponse({"error": "Either file or document_id is required"}, status_code=400)
+    else:
+        data = await upload.read()
+        job = await run_cpu(ingest_jobs.submit, data)
+
+    deadline = time.monotonic() + ingest_wait(form)
+    while job['status'] in ACTIVE_STATUSES and time.monotonic() < deadline:
+        await asyncio.sleep(ingest_jobs.poll_interval)
+        job = await run_io(ingest_jobs.get, job['job_id'])
+
+    if job['status'] == 'done':
+        return await run_io(get_document, job['document_id']), None
+    if job['status'] == 'failed':
+        return None, JSONResponse({"error": "Indexing failed", "job": job}, status_code=500)
+    return None, JSONResponse({"status": "indexing", "job": job}, status_code=202)
+
+
+async def handle_pdf_qa(request):
+    started = time.perf_counter()
+    try:
+        await limiter.acquire()
+    except Overloaded:
+        return overloaded()
+
+    streaming = False
+    try:
+        form = await request.form()
+        question = form['question']
+        session_id = form['session_id']
+        try:
+            options = retrieval_options(form)
+        except ValueError:
+            return JSONResponse({"error": INVALID_RETRIEVAL_OPTIONS}, status_code=400)
+
+        with span("resolve_document"):
+            document, error = await resolve_document(form)
+        if error:
+            return error
+        doc_id = document['document_id']
+        metadata = document['metadata']
+
+        if is_manipuri(question, session_id):
+            try:
+                with span("translate"):
+                    question = await run_cpu(translate_to_english, question)
+            except Exception as e:
+                print("Translation error:", e)
+                return JSONResponse({"error": "Translation failed"}, status_code=500)
+
+        # Only questions that open a session share cached answers; a follow-up
+        # depends on the conversation before it
+        history = await run_io(sessions.get_history, session_id)
+        cached, cache_level, query_vec = None, None, None
+        if not history:
+            with span("query_cache"):
+                cached, cache_level, query_vec = await run_cpu(
+                    query_cache.lookup, doc_id, question, embedding_service.encode_query, options
+                )
+            metrics.cache_lookups.inc(cache="query", result=cache_level or "miss")
+        if cached:
+            retrieved_chunks = cached['chunks']
+        else:
+            with span("retrieve"):
+                retrieved_chunks = await run_cpu(
+                    select_context, question, doc_id, query_vec=query_vec, **options
+                )
+            metrics.chunks_retrieved.inc(len(retrieved_chunks))
+        timings = wants_timings(request, form)
+        header = {
+            "document_id": doc_id,
+            "metadata": metadata,
+            "retrieved_pages": [chunk.get('page_num') for chunk in retrieved_chunks],
+            "cached": cache_level,
+        }
+
+        if cached:
+            await run_io(remember_turn, session_id, question, cached['answer'])
+            answer_en = cached['answer']
+        else:
+            summary = await run_io(pinned_summary, doc_id)
+            with span("build_prompt"):
+                context_text = "\n\n".join([chunk['text'] for chunk in retrieved_chunks])
+                prompt = build_prompt(
+                    context_text, question, history,
+                    metadata=metadata, summary=summary,
+                )
+
+            def on_answer(answer):
+                remember_turn(session_id, question, answer)
+                if not history:
+                    query_cache.put(doc_id, question, query_vec, answer, retrieved_chunks, options)
+
+            if wants_stream(form.get('stream')):
+                streaming = True
+                return limiter.hold(StreamingResponse(
+                    stream_chat(prompt, header, started, on_answer, metrics.current_trace() if timings else None),
+                    media_type='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+                ))
+
+            with span("llm"):
+                response = await llm.chat(model=LLM_MODEL, messages=prompt, **chat_options(LLM_MODEL))
+            metrics.record_llm_response(response, prompt)
+            answer_en = response['message']['content'].strip()
+            await run_io(on_answer, answer_en)
+
+        if wants_stream(form.get('stream')):
+            streaming = True
+            return limiter.hold(StreamingResponse(
+                stream_cached(answer_en, header, started),
+                media_type='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+            ))
+        payload = {
+            "answer": {
+                "en": answer_en,
+                "mni": None
+            },
+            "metadata": metadata,
+            "document_id": doc_id,
+            "cached": cache_level
+        }
+        if timings:
+            payload["timings"] = metrics.current_trace().breakdown()
+        return JSONResponse(payload)
+    finally:
+        # Streaming responses hold their slot until the stream finishes
+        if not streaming:
+            limiter.release()
+
+
+async def stream_chat(prompt, header, started, on_answer, trace=None):
+    yield sse_event("metadata", header)
+    request_ms = (time.perf_counter() - started) * 1000
+    first_token_ms = None
+    parts = []
+    final = {}
+    try:
+        with span("llm"):
+            async for chunk in await llm.chat(model=LLM_MODEL, messages=prompt, stream=True, **chat_options(LLM_MODEL)):
+                content = chunk['message']['content']
+                if content:
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                        metrics.llm_first_token_seconds.observe(first_token_ms / 1000)
+                    parts.append(content)
+                    yield sse_event("token", {"content": content})
+                if chunk.get('done'):
+                    final = chunk
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+
+    metrics.record_llm_response(final, prompt, trace)
+    answer_en = "".join(parts).strip()
+    await run_io(on_answer, answer_en)
+    timings = {
+        "pre_llm_ms": request_ms,
+        "first_token_ms": first_token_ms,
+        "total_ms": (time.perf_counter() - started) * 1000,
+        "prompt_eval_count": final.get('prompt_eval_count'),
+        "prompt_eval_ms": (final.get('prompt_eval_duration') or 0) / 1e6,
+        "eval_count": final.get('eval_count'),
+        "eval_ms": (final.get('eval_duration') or 0) / 1e6,
+    }
+    if trace is not None:
+        timings["stages_ms"] = trace.breakdown()["stages_ms"]
+    yield sse_event("done", {
+        "answer": {"en": answer_en, "mni": None},
+        "timings": timings,
+    })
+
+
+async def stream_cached(answer_en, header, started):
+    yield sse_event("metadata", header)
+    yield sse_event("token", {"content": answer_en})
+    yield sse_event("done", {
+        "answer": {"en": answer_en, "mni": None},
+        "timings": {"total_ms": (time.perf_counter() - started) * 1000},
+    })
+
+
+async def summarize_pdf(request):
+    try:
+        await limiter.acquire()
+    except Overloaded:
+        return overloaded()
+    try:
+        form = await request.form()
+        document, error = await resolve_document(form)
+        if error:
+            return error
+        doc_id = document['document_id']
+
+        try:
+            scope = summary_scope(form)
+        except ValueError:
+            return JSONResponse({"error": "page_from and page_to must be integers"}, status_code=400)
+        # The summarizer mostly waits on its own bounded pool of model calls,
+        # so it runs on the I/O pool and leaves the CPU workers to retrieval
+        with span("summarize"):
+            result = await run_io(summarize_document, doc_id, document['metadata'], **scope)
+        if not result['sections']:
+            return JSONResponse({"error": "No matching section"}, status_code=404)
+        payload = {
+            "summary": result['summary'],
+            "sections": result['sections'],
+            "document_id": doc_id
+        }
+        if wants_timings(request, form):
+            payload["timings"] = metrics.current_trace().breakdown()
+        return JSONResponse(payload)
+    finally:
+        limiter.release()
+
+
+async def submit_ingest(request):
+    form = await request.form()
+    upload = form.get('file')
+    if upload is None:
+        return JSONResponse({"error": "File is required"}, status_code=400)
+    job = await run_cpu(ingest_jobs.submit, await upload.read())
+    return JSONResponse(job, status_code=200 if job['status'] == 'done' else 202)
+
+
+async def get_ingest(request):
+    job = await run_io(ingest_jobs.get, request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+    return JSONResponse(job)
+
+
+async def ingest_events(request):
+    # `progress` events whenever the job changes, then one `done` or `failed`
+    job_id = request.path_params['job_id']
+    job = await run_io(ingest_jobs.get, job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+
+    async def generate(job):
+        last = None
+        while True:
+            if job != last:
+                last = job
+                if job['status'] not in ACTIVE_STATUSES:
+                    yield sse_event(job['status'], job)
+                    return
+                yield sse_event("progress", job)
+            await asyncio.sleep(ingest_jobs.poll_interval)
+            job = await run_io(ingest_jobs.get, job_id)
+
+    return StreamingResponse(
+        generate(job),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+async def list_document_images(request):
+    document_id = request.path_params['document_id']
+    if await run_io(get_document, document_id) is None:
+        return JSONResponse({"error": "Unknown document_id"}, status_code=404)
+    payload, status = await run_io(image_listing, document_id)
+    return JSONResponse(payload, status_code=status)
+
+
+async def get_image(request):
+    path = image_extractor.image_path(request.path_params['name'])
+    if not os.path.isfile(path):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    await run_io(image_extractor.touch, request.path_params['name'])
+    return FileResponse(path, headers={'Cache-Control': 'public, max-age=86400'})
+
+
+async def list_collection(request):
+    name = request.path_params['name']
+    if not is_valid_collection_name(name):
+        return JSONResponse({"error": "Invalid collection name"}, status_code=400)
+    return JSONResponse({"name": name, "documents": await run_io(get_collection(name).list_documents)})
+
+
+async def add_to_collection(request):
+    name = request.path_params['name']
+    if not is_valid_collection_name(name):
+        return JSONResponse({"error": "Invalid collection name"}, status_code=400)
+    document, error = await resolve_document(await request.form())
+    if error:
+        return error
+
+    added = await run_cpu(get_collection(name).add_document, document['document_id'])
+    return JSONResponse({
+        "document_id": document['document_id'],
+        "metadata": document['metadata'],
+        "added": added
+    })
+
+
+async def remove_from_collection(request):
+    name = request.path_params['name']
+    if not is_valid_collection_name(name):
+        return JSONResponse({"error": "Invalid collection name"}, status_code=400)
+    if not await run_cpu(get_collection(name).remove_document, request.path_params['document_id']):
+        return JSONResponse({"error": "Document not in collection"}, status_code=404)
+    return JSONResponse({"status": "removed"})
+
+
+async def query_collection(request):
+    name = request.path_params['name']
+    if not is_valid_collection_name(name):
+        return JSONResponse({"error": "Invalid collection name"}, status_code=400)
+    data = await request.json()
+    question = data.get('question')
+    session_id = data.get('session_id', 'default')
+    if not question:
+        return JSONResponse({"error": "Question is required"}, status_code=400)
+
+    try:
+        await limiter.acquire()
+    except Overloaded:
+        return overloaded()
+    try:
+        retrieved_chunks, context_text = await run_cpu(collection_context, name, question, data)
+        history = await run_io(sessions.get_history, session_id)
+        prompt = build_prompt(context_text, question, history)
+        response = await llm.chat(model=LLM_MODEL, messages=prompt, **chat_options(LLM_MODEL))
+        metrics.record_llm_response(response, prompt)
+        answer_en = response['message']['content'].strip()
+        await run_io(remember_turn, session_id, question, answer_en)
+    finally:
+        limiter.release()
+
+    return JSONResponse({
+        "answer": {
+            "en": answer_en,
+            "mni": None
+        },
+        "sources": collection_sources(retrieved_chunks)
+    })
+
+
+async def clear_session(request):
+    data = await request.json()
+    session_id = data.get('session_id', 'default')
+    await run_io(sessions.clear, session_id)
+    lang_router.forget(session_id)
+    return JSONResponse({"status": "cleared"})
+
+
+async def metrics_endpoint(request):
+    for cache, stats in (("index", index_cache.stats()), ("query", query_cache.stats())):
+        for stat, value in stats.items():
+            metrics.cache_stats.set(value, cache=cache, stat=stat)
+    for status, count in (await run_io(ingest_jobs.stats)).items():
+        metrics.ingest_jobs.set(count, status=status)
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def cache_stats(request):
+    return JSONResponse({
+        "index_cache": index_cache.stats(),
+        "query_cache": query_cache.stats(),
+        "ingest_jobs": await run_io(ingest_jobs.stats),
+        "backpressure": {"waiting": limiter.waiting, "max_waiting": limiter.max_waiting},
+    })
+
+
+app = Starlette(
+    routes=[
+        Route('/api/pdfqa', handle_pdf_qa, methods=['POST']),
+        Route('/api/summary', summarize_pdf, methods=['POST']),
+        Route('/api/ingest', submit_ingest, methods=['POST']),
+        Route('/api/ingest/{job_id}', get_ingest, methods=['GET']),
+        Route('/api/ingest/{job_id}/events', ingest_events, methods=['GET']),
+        Route('/api/documents/{document_id}/images', list_document_images, methods=['GET']),
+        Route('/api/images/{name}', get_image, methods=['GET']),
+        Route('/api/collections/{name}', list_collection, methods=['GET']),
+        Route('/api/collections/{name}/documents', add_to_collection, methods=['POST']),
+        Route('/api/collections/{name}/documents/{document_id}', remove_from_collection, methods=['DELETE']),
+        Route('/api/collections/{name}/query', query_collection, methods=['POST']),
+        Route('/api/clear', clear_session, methods=['POST']),
+        Route('/api/cache/stats', cache_stats, methods=['GET']),
+        Route('/metrics', metrics_endpoint, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(RequestMetrics),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    ],
+)
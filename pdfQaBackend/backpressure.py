@@ -0,0 +1,45 @@
+# backpressure.py
+# Request limiter for the ASGI app (code_backend keeps its own copy)
+import asyncio
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Backpressure:
+    """
+    Caps concurrently served requests; once `max_waiting` requests are
+    already queued for a slot, new ones are rejected instead of queued.
+    """
+
+    def __init__(self, max_active, max_waiting):
+        self._slots = asyncio.Semaphore(max_active)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+
+    async def acquire(self):
+        if self._slots.locked() and self.waiting >= self.max_waiting:
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._slots.release()
+
+    def hold(self, response):
+        """
+        Wrap an ASGI response so its request keeps the slot until the
+        response is done, however it ends. A streaming body's own cleanup is
+        not enough: its generator never starts if the client goes away or
+        the send fails before the first chunk.
+        """
+        async def app(scope, receive, send):
+            try:
+                await response(scope, receive, send)
+            finally:
+                self.release()
+        return app
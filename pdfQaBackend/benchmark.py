@@ -0,0 +1,382 @@
+# benchmark.py
+"""
+End-to-end benchmark of the PDF QA and code backends, with no Ollama server
+or model downloads needed:
+
+    python benchmark.py [--sizes 5,50,200] [--requests 40] [--concurrency 1,4,16]
+                        [--baseline bench/baseline.json] [--save-baseline] [--tolerance 0.2]
+
+A fake Ollama (fake_ollama.py) answers every chat call with a fixed latency
+profile, and embeddings come from the hashing embedder
+(EMBEDDING_BACKEND=hash). Both Flask apps are served over real HTTP in this
+process. The corpus is generated PDFs of each size in --sizes (page counts).
+
+The benchmark reports:
+- index build time and stage breakdown per document size
+- end-to-end and per-stage p50/p95/p99 latency and requests per second for
+  /api/pdfqa, /api/summary and /api/code at each concurrency level
+- peak RSS
+
+Results are compared with the stored baseline. The run exits non-zero when
+a latency or throughput figure regresses by more than --tolerance;
+--save-baseline replaces the baseline with the new results. A baseline
+recorded with different load settings is not compared against.
+
+The figures depend on the machine, so the baseline is not committed: record
+one locally (`python benchmark.py --save-baseline`) before the change being
+measured and compare the runs after it against that. bench/ is ignored by git.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Settings that change the measured load; a baseline only applies to runs with the same ones
+LOAD_SETTINGS = ("sizes", "requests", "concurrency", "prefill_ms", "token_ms", "tokens")
+
+SUBJECTS = ["The controller", "Each worker node", "The storage layer", "Module", "The scheduler", "Region"]
+VERBS = ["records", "replicates", "compresses", "validates", "forwards", "aggregates"]
+OBJECTS = ["sensor readings", "audit events", "billing records", "index segments", "cached pages", "log batches"]
+PLACES = ["north cluster", "east gateway", "archive tier", "primary site", "backup vault", "edge cache"]
+
+
+def make_sentence(rng):
+    return (
+        f"{rng.choice(SUBJECTS)} {rng.randint(100, 9999)} {rng.choice(VERBS)} {rng.randint(2, 500)} "
+        f"{rng.choice(OBJECTS)} in the {rng.choice(PLACES)} every {rng.randint(2, 90)} seconds."
+    )
+
+
+def generate_pdf(path, pages, seed=1234):
+    """
+    Write a `pages`-page PDF with a numbered section heading every three pages
+    and paragraphs of generated sentences; returns the sentences used.
+    """
+    import fitz
+
+    rng = random.Random(seed + pages)
+    sentences = []
+    doc = fitz.open()
+    doc.set_metadata({"title": f"Benchmark corpus ({pages} pages)", "author": "benchmark.py"})
+    for page_no in range(pages):
+        page = doc.new_page()
+        y = 72
+        if page_no % 3 == 0:
+            page.insert_text((72, y), f"{page_no // 3 + 1}. Section {page_no // 3 + 1}", fontsize=16)
+            y += 32
+        for _ in range(5):
+            paragraph = [make_sentence(rng) for _ in range(4)]
+            sentences.extend(paragraph)
+            rect = fitz.Rect(72, y, page.rect.width - 72, y + 120)
+            page.insert_textbox(rect, " ".join(paragraph), fontsize=10)
+            y += 125
+    doc.save(path)
+    doc.close()
+    return sentences
+
+
+def percentiles(values):
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(values), [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def stage_percentiles(breakdowns):
+    stages = {}
+    for breakdown in breakdowns:
+        for stage, ms in breakdown.items():
+            stages.setdefault(stage, []).append(ms)
+    return {stage: percentiles(values) for stage, values in sorted(stages.items())}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def post_form(url, fields):
+    data = urllib.parse.urlencode(fields).encode("utf-8")
+    return urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=600)
+
+
+def post_json(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    return urllib.request.urlopen(request, timeout=600)
+
+
+def read_events(response):
+    # Yield (event, data, arrival time) for each server-sent event
+    event = None
+    for raw in response:
+        line = raw.decode("utf-8").rstrip("\n")
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):]), time.perf_counter()
+
+
+def run_load(fn, jobs, concurrency):
+    """
+    Run fn(job) for every job on `concurrency` client threads. Returns the
+    per-request results and requests per second.
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fn, jobs))
+    wall = time.perf_counter() - started
+    return results, len(jobs) / wall if wall else None
+
+
+def serve(flask_app):
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def bench_ingest(app, document_store, metrics, path):
+    with open(path, "rb") as f:
+        data = f.read()
+    trace = metrics.start_trace()
+    started = time.perf_counter()
+    document = document_store.get_or_create_document(data, app.index_pdf)
+    return document, {
+        "build_ms": (time.perf_counter() - started) * 1000,
+        "chunks": document["num_chunks"],
+        "stages_ms": trace.breakdown()["stages_ms"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_qa(base_url, doc_id, sentences, requests, concurrency, seed):
+    rng = random.Random(seed)
+    # Distinct questions in separate sessions, so neither the answer cache nor
+    # a growing chat history skews the numbers
+    jobs = [
+        (f"Which part of the document says: {rng.choice(sentences)} ({i})", f"bench-{seed}-{i}")
+        for i in range(requests)
+    ]
+
+    def ask(job):
+        question, session_id = job
+        started = time.perf_counter()
+        first_token = None
+        stages = {}
+        with post_form(f"{base_url}/api/pdfqa", {
+            "document_id": doc_id, "question": question, "session_id": session_id,
+            "stream": "true", "timings": "true",
+        }) as response:
+            for event, data, arrived in read_events(response):
+                if event == "token" and first_token is None:
+                    first_token = arrived
+                elif event == "done":
+                    stages = data["timings"].get("stages_ms", {})
+                elif event == "error":
+                    raise RuntimeError(data["error"])
+        finished = time.perf_counter()
+        return (finished - started) * 1000, ((first_token or finished) - started) * 1000, stages
+
+    results, rps = run_load(ask, jobs, concurrency)
+    report = percentiles([r[0] for r in results])
+    report["ttft_p50_ms"] = percentiles([r[1] for r in results])["p50_ms"]
+    report["rps"] = rps
+    report["stages"] = stage_percentiles([r[2] for r in results])
+    return report
+
+
+def bench_summary(base_url, doc_id):
+    report = {}
+    for label in ("cold", "warm"):
+        started = time.perf_counter()
+        with post_form(f"{base_url}/api/summary", {"document_id": doc_id, "timings": "true"}) as response:
+            body = json.loads(response.read())
+        report[f"{label}_ms"] = (time.perf_counter() - started) * 1000
+        report[f"{label}_stages_ms"] = body.get("timings", {}).get("stages_ms", {})
+    return report
+
+
+def bench_code(base_url, requests, concurrency, seed, optimize=False):
+    jobs = [
+        {"prompt": f"Write a function in python that sorts list number {seed}-{i}", "optimize": optimize,
+         "session_id": f"code-{seed}-{i}"}
+        for i in range(requests)
+    ]
+
+    def generate(payload):
+        started = time.perf_counter()
+        with post_json(f"{base_url}/api/code", payload) as response:
+            response.read()
+        return (time.perf_counter() - started) * 1000
+
+    latencies, rps = run_load(generate, jobs, concurrency)
+    report = percentiles(latencies)
+    report["rps"] = rps
+    return report
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, tolerance, floor_ms=1.0):
+    """
+    Figures that got worse than the baseline by more than `tolerance`:
+    latencies (_ms, _s) and memory (_mb) going up, throughput (rps) going
+    down. Latencies under `floor_ms` in both runs are ignored as noise.
+    """
+    regressions = []
+    old_flat, new_flat = flatten(baseline), flatten(results)
+    for name, new in sorted(new_flat.items()):
+        old = old_flat.get(name)
+        if not old:
+            continue
+        if name.endswith("rps"):
+            worse = new < old * (1 - tolerance)
+        elif name.endswith(("_ms", "_s", "_mb")):
+            if name.endswith("_ms") and max(old, new) < floor_ms:
+                continue
+            worse = new > old * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append((name, old, new))
+    return regressions
+
+
+def print_report(results):
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            print(f"{key}: {value:.1f}" if isinstance(value, float) else f"{key}: {value}")
+            continue
+        figures = ", ".join(
+            f"{name}={v:.1f}" if isinstance(v, float) else f"{name}={v}"
+            for name, v in value.items() if not isinstance(v, dict)
+        )
+        print(f"{key}: {figures}")
+        stages = value.get("stages") or value.get("stages_ms") or value.get("cold_stages_ms")
+        for stage, figures in (stages or {}).items():
+            if isinstance(figures, dict):
+                print(f"    {stage:<18} p50={figures['p50_ms']:.1f} p95={figures['p95_ms']:.1f} p99={figures['p99_ms']:.1f}")
+            else:
+                print(f"    {stage:<18} {figures:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="5,50,200", help="document sizes in pages")
+    parser.add_argument("--requests", type=int, default=40, help="requests per load level")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--prefill-ms", type=float, default=150.0)
+    parser.add_argument("--token-ms", type=float, default=15.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--workdir", help="defaults to a fresh temporary directory")
+    parser.add_argument("--baseline", default=os.path.join(HERE, "bench", "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    from fake_ollama import FakeOllama
+
+    fake = FakeOllama(port=0, prefill_ms=args.prefill_ms, token_ms=args.token_ms, tokens=args.tokens).start()
+
+    # The backends read these at import time, and keep their indexes,
+    # caches and databases relative to the working directory
+    os.environ["OLLAMA_HOST"] = fake.url
+    os.environ["EMBEDDING_BACKEND"] = "hash"
+    os.environ["SESSION_BACKEND"] = "memory"
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="pdfqa-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    sys.path.append(os.path.join(HERE, "..", "code_backend"))
+
+    import app
+    import code_backend
+    import document_store
+    import metrics
+
+    _, pdf_url = serve(app.app)
+    _, code_url = serve(code_backend.app)
+    print(f"Working directory: {workdir}")
+
+    results = {}
+    os.makedirs("corpus", exist_ok=True)
+    for pages in sizes:
+        path = os.path.join("corpus", f"corpus_{pages}p.pdf")
+        sentences = generate_pdf(path, pages)
+        document, results[f"ingest/{pages}p"] = bench_ingest(app, document_store, metrics, path)
+        doc_id = document["document_id"]
+        for concurrency in levels:
+            results[f"qa/{pages}p/c{concurrency}"] = bench_qa(
+                pdf_url, doc_id, sentences, args.requests, concurrency, seed=pages * 1000 + concurrency
+            )
+        results[f"summary/{pages}p"] = bench_summary(pdf_url, doc_id)
+
+    for concurrency in levels:
+        results[f"code/c{concurrency}"] = bench_code(code_url, args.requests, concurrency, seed=concurrency)
+    results["code_optimize/c1"] = bench_code(code_url, max(1, args.requests // 4), 1, seed=0, optimize=True)
+    results["peak_rss_mb"] = peak_rss_mb()
+    results["llm_requests"] = fake.requests
+
+    print_report(results)
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    exit_code = 0
+    settings = {name: getattr(args, name) for name in LOAD_SETTINGS}
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline["settings"] != settings:
+            print(f"Not comparing: {baseline_path} was recorded with {baseline['settings']}")
+        else:
+            regressions = compare(results, baseline["results"], args.tolerance)
+            for name, old, new in regressions:
+                print(f"REGRESSION {name}: {old:.1f} -> {new:.1f}")
+            if regressions:
+                exit_code = 1
+            else:
+                print(f"No regressions beyond {args.tolerance:.0%} against {baseline_path}")
+    elif not args.save_baseline:
+        print(f"No baseline at {baseline_path}; record one with --save-baseline")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {baseline_path}")
+    fake.stop()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
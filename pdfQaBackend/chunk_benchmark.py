@@ -0,0 +1,126 @@
+# chunk_benchmark.py
+"""
+Compare chunking strategies on one or more PDFs:
+
+    python chunk_benchmark.py manual.pdf [more.pdf ...] [--queries 200] [--top-k 5]
+
+For each strategy it reports chunk count and size, index size, build time
+(embedding + indexing) and retrieval quality. Queries are sentences sampled
+from the document; a query counts as found when a retrieved chunk contains
+at least 80% of its words.
+"""
+import argparse
+import random
+import re
+import time
+
+import faiss
+import fitz
+
+from chunker import count_tokens
+from embedding_service import embedding_service
+from index_factory import build_index, search
+from pdf_parser import parse_pdf
+
+
+def lines_strategy(path):
+    # Former pdf_parser.parse_pdf: one chunk per text line over 30 chars
+    chunks = []
+    with fitz.open(path) as doc:
+        for page_num, page in enumerate(doc):
+            for block in page.get_text("dict")['blocks']:
+                if block['type'] == 0:
+                    for line in block['lines']:
+                        text = ' '.join(span['text'].strip() for span in line['spans'])
+                        if len(text) > 30:
+                            chunks.append({"text": text, "page_num": page_num + 1})
+    return chunks
+
+
+def words500_strategy(path):
+    # Former rag_engine.chunk_pdf_text: fixed 500-word windows
+    with fitz.open(path) as doc:
+        words = "\n".join(page.get_text() for page in doc).split()
+    return [{"text": ' '.join(words[i:i + 500])} for i in range(0, len(words), 500)]
+
+
+def structured_strategy(path):
+    return parse_pdf(path)[0]
+
+
+STRATEGIES = {
+    "lines": lines_strategy,
+    "words500": words500_strategy,
+    "structured": structured_strategy,
+}
+
+
+def sample_queries(path, n, seed=1234):
+    with fitz.open(path) as doc:
+        text = ' '.join("\n".join(page.get_text() for page in doc).split())
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", text) if 8 <= count_tokens(s) <= 40]
+    random.Random(seed).shuffle(sentences)
+    return sentences[:n]
+
+
+def _words(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def evaluate(path, strategy, queries, top_k):
+    start = time.perf_counter()
+    chunks = STRATEGIES[strategy](path)
+    parse_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embeddings = embedding_service.encode_documents([c['text'] for c in chunks])
+    index = build_index(embeddings)
+    build_s = time.perf_counter() - start
+
+    chunk_words = [_words(c['text']) for c in chunks]
+    hits = 0
+    reciprocal_ranks = 0.0
+    query_vecs = embedding_service.encode_documents(queries)
+    _, found = search(index, query_vecs, top_k)
+    for query, row in zip(queries, found):
+        wanted = _words(query)
+        for rank, i in enumerate(row):
+            if i >= 0 and len(wanted & chunk_words[i]) >= 0.8 * len(wanted):
+                hits += 1
+                reciprocal_ranks += 1.0 / (rank + 1)
+                break
+
+    sizes = [count_tokens(c['text']) for c in chunks]
+    return {
+        "strategy": strategy,
+        "chunks": len(chunks),
+        "mean_tokens": sum(sizes) / len(sizes) if sizes else 0,
+        "max_tokens": max(sizes, default=0),
+        "index_kb": faiss.serialize_index(index).nbytes / 1024,
+        "parse_s": parse_s,
+        "build_s": build_s,
+        f"hit@{top_k}": hits / len(queries) if queries else 0,
+        "mrr": reciprocal_ranks / len(queries) if queries else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunking strategies")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=list(STRATEGIES))
+    args = parser.parse_args()
+
+    columns = ["strategy", "chunks", "mean_tokens", "max_tokens", "index_kb", "parse_s", "build_s", f"hit@{args.top_k}", "mrr"]
+    for path in args.pdfs:
+        queries = sample_queries(path, args.queries)
+        print(f"\n{path}: {len(queries)} queries")
+        print(''.join(f"{c:>12}" for c in columns))
+        for strategy in args.strategies:
+            row = evaluate(path, strategy, queries, args.top_k)
+            print(''.join(f"{row[c]:>12.3f}" if isinstance(row[c], float) else f"{row[c]:>12}" for c in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# chunk_store.py
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"CHNKSTR1"
+ALIGN = 8
+
+# Column kinds: "str" (offsets table + utf-8 blob), "int", "float", "vec"
+# (fixed-width float32 rows, e.g. bbox) and "json" (anything else, stored as
+# serialized strings). Columns missing from some chunks carry a presence mask.
+
+
+def _column_kind(values):
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, str) for v in present):
+        return "str", None
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return "int", None
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return "float", None
+    if all(isinstance(v, (list, tuple)) and all(isinstance(x, (int, float)) for x in v) for v in present):
+        widths = {len(v) for v in present}
+        if len(widths) == 1:
+            return "vec", widths.pop()
+    return "json", None
+
+
+def _encode_strings(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def write_chunk_store(path, chunks):
+    """
+    Write chunk dicts to a columnar binary file that ChunkStore can memory-map.
+    The file is written to a temporary path and renamed into place.
+    """
+    count = len(chunks)
+    names = []
+    for chunk in chunks:
+        for name in chunk:
+            if name not in names:
+                names.append(name)
+
+    columns = []
+    buffers = []
+    position = 0
+
+    def add_buffer(data):
+        nonlocal position
+        pad = (-position) % ALIGN
+        buffers.append(b"\0" * pad)
+        position += pad
+        offset = position
+        buffers.append(data)
+        position += len(data)
+        return offset
+
+    for name in names:
+        values = [chunk.get(name) for chunk in chunks]
+        kind, width = _column_kind(values)
+        column = {"name": name, "kind": kind}
+        if any(v is None for v in values):
+            column["mask"] = add_buffer(np.array([v is not None for v in values], dtype=np.uint8).tobytes())
+
+        if kind in ("str", "json"):
+            strings = [
+                "" if v is None else (v if kind == "str" else json.dumps(v, ensure_ascii=False))
+                for v in values
+            ]
+            offsets, blob = _encode_strings(strings)
+            column["offsets"] = add_buffer(offsets.tobytes())
+            column["blob"] = add_buffer(blob)
+        elif kind == "int":
+            column["data"] = add_buffer(np.array([v or 0 for v in values], dtype=np.int64).tobytes())
+        elif kind == "float":
+            column["data"] = add_buffer(np.array([v or 0.0 for v in values], dtype=np.float32).tobytes())
+        else:
+            column["width"] = width
+            rows = [v if v is not None else [0.0] * width for v in values]
+            column["data"] = add_buffer(np.array(rows, dtype=np.float32).reshape(count, width).tobytes())
+        columns.append(column)
+
+    header = json.dumps({"count": count, "columns": columns}).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * ((-len(prefix)) % ALIGN)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix)
+        for data in buffers:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a file written by write_chunk_store.
+    Only the offsets and bytes of the requested records are touched, so a
+    top-k lookup costs O(k) regardless of document size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._buf = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+        if bytes(self._buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a chunk store")
+        (header_len,) = struct.unpack("<I", bytes(self._buf[len(MAGIC):len(MAGIC) + 4]))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(self._buf[start:start + header_len]).decode("utf-8"))
+        self._base = start + header_len + ((-(start + header_len)) % ALIGN)
+        self._count = header["count"]
+        self._columns = [self._open_column(c) for c in header["columns"]]
+
+    def _view(self, offset, dtype, count):
+        start = self._base + offset
+        return self._buf[start:start + count * np.dtype(dtype).itemsize].view(dtype)
+
+    def _open_column(self, column):
+        n = self._count
+        opened = {"name": column["name"], "kind": column["kind"], "mask": None}
+        if "mask" in column:
+            opened["mask"] = self._view(column["mask"], np.uint8, n)
+        if column["kind"] in ("str", "json"):
+            opened["offsets"] = self._view(column["offsets"], np.uint64, n + 1)
+            opened["blob"] = self._base + column["blob"]
+        elif column["kind"] == "int":
+            opened["data"] = self._view(column["data"], np.int64, n)
+        elif column["kind"] == "float":
+            opened["data"] = self._view(column["data"], np.float32, n)
+        else:
+            opened["data"] = self._view(column["data"], np.float32, n * column["width"]).reshape(n, column["width"])
+        return opened
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._record(i)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._record(j) for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self._record(i)
+
+    def get(self, indices):
+        return [self[int(i)] for i in indices]
+
+    def _record(self, i):
+        record = {}
+        for column in self._columns:
+            if column["mask"] is not None and not column["mask"][i]:
+                continue
+            kind = column["kind"]
+            if kind in ("str", "json"):
+                start, end = int(column["offsets"][i]), int(column["offsets"][i + 1])
+                text = bytes(self._buf[column["blob"] + start:column["blob"] + end]).decode("utf-8")
+                record[column["name"]] = text if kind == "str" else json.loads(text)
+            elif kind == "int":
+                record[column["name"]] = int(column["data"][i])
+            elif kind == "float":
+                record[column["name"]] = float(column["data"][i])
+            else:
+                record[column["name"]] = column["data"][i].tolist()
+        return record
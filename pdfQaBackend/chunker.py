@@ -0,0 +1,215 @@
+# chunker.py
+import re
+from collections import Counter
+from functools import lru_cache
+
+from config import CHUNK_SIZE, CHUNK_OVERLAP, MIN_TEXT_LENGTH, HEADING_SIZE_RATIO
+
+# CHUNK_SIZE and CHUNK_OVERLAP count the embedding model's own tokens, so a
+# chunk (heading included) fits its input limit and the tail is not silently
+# truncated: MiniLM takes 128 word pieces including the two special tokens,
+# and multilingual text often needs two or three pieces per word. Embedders
+# without a tokenizer (the hash backend) count one token per word.
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।꯫])\s+")
+# About 20 words of English in MiniLM word pieces
+_HEADING_MAX_TOKENS = 32
+
+
+@lru_cache(maxsize=None)
+def _tokenizer():
+    # Imported on first use: pdf_parser's worker processes import this
+    # module for page_blocks and must not load the embedding model
+    from embedding_service import embedding_model
+    return getattr(embedding_model, 'tokenizer', None)
+
+
+@lru_cache(maxsize=65536)
+def word_tokens(word):
+    tokenizer = _tokenizer()
+    if tokenizer is None:
+        return 1
+    return max(1, len(tokenizer.tokenize(word)))
+
+
+def count_tokens(text):
+    return sum(word_tokens(word) for word in text.split())
+
+
+def page_blocks(page, page_num):
+    """
+    Text blocks of a PyMuPDF page as paragraph records: joined text, the
+    dominant font size, whether it is all bold, bbox and 1-based page number.
+    """
+    blocks = []
+    for block in page.get_text("dict")['blocks']:
+        if block['type'] != 0:
+            continue
+        lines = []
+        sizes = Counter()
+        bold = True
+        for line in block['lines']:
+            text = ' '.join(span['text'].strip() for span in line['spans'] if span['text'].strip())
+            if not text:
+                continue
+            for span in line['spans']:
+                if span['text'].strip():
+                    sizes[round(span['size'], 1)] += len(span['text'])
+                    bold = bold and bool(span['flags'] & 16)
+            lines.append(text)
+        if not lines:
+            continue
+        blocks.append({
+            "text": _join_lines(lines),
+            "font_size": sizes.most_common(1)[0][0],
+            "bold": bold,
+            "bbox": list(block['bbox']),
+            "page_num": page_num + 1,
+        })
+    return blocks
+
+
+def _join_lines(lines):
+    # Re-join words hyphenated across line breaks
+    text = lines[0]
+    for line in lines[1:]:
+        if text.endswith('-') and not text.endswith(' -'):
+            text = text[:-1] + line
+        else:
+            text = f"{text} {line}"
+    return text
+
+
+def _split_long(text, max_tokens):
+    # Sentence-aligned pieces, falling back to word windows for run-ons
+    pieces = []
+    for sentence in _SENTENCE_END.split(text):
+        piece = []
+        used = 0
+        for word in sentence.split():
+            cost = word_tokens(word)
+            if piece and used + cost > max_tokens:
+                pieces.append(' '.join(piece))
+                piece = []
+                used = 0
+            piece.append(word)
+            used += cost
+        if piece:
+            pieces.append(' '.join(piece))
+    return pieces
+
+
+def _tail(costs, budget):
+    # How many trailing words fit in `budget` tokens
+    used = 0
+    for n, cost in enumerate(reversed(costs)):
+        used += cost
+        if used > budget:
+            return n
+    return len(costs)
+
+
+class _Packer:
+    # Accumulates paragraphs of one section into token-bounded chunks
+
+    def __init__(self, chunk_size, overlap):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.section = None
+        self.limit = chunk_size
+        self.words = []
+        self.costs = []
+        self.pages = None
+        self.fresh = False
+
+    def _keep(self, count):
+        # Keep only the last `count` words
+        self.words = self.words[len(self.words) - count:]
+        self.costs = self.costs[len(self.costs) - count:]
+
+    def start_section(self, heading):
+        yield from self.flush()
+        self.section = heading
+        # The heading is repeated in every chunk of its section
+        self.limit = max(self.chunk_size - count_tokens(heading), self.chunk_size // 2)
+        self._keep(0)
+        self.pages = None
+
+    def add(self, text, page_num):
+        for piece in _split_long(text, self.limit):
+            words = piece.split()
+            costs = [word_tokens(word) for word in words]
+            if self.fresh and sum(self.costs) + sum(costs) > self.limit:
+                yield from self.flush()
+            if not self.fresh:
+                # Only as much overlap as still leaves room for this piece
+                self._keep(_tail(self.costs, self.limit - sum(costs)))
+            if self.pages is None:
+                self.pages = [page_num, page_num]
+            self.pages[1] = page_num
+            self.words.extend(words)
+            self.costs.extend(costs)
+            self.fresh = True
+
+    def flush(self):
+        if not self.fresh:
+            return
+        text = ' '.join(self.words)
+        if self.section:
+            text = f"{self.section}\n{text}"
+        yield {
+            "text": text,
+            "page_num": self.pages[0],
+            "page_start": self.pages[0],
+            "page_end": self.pages[1],
+            "section": self.section,
+        }
+        # Carry the tail into the next chunk of the same section
+        self._keep(_tail(self.costs, self.overlap))
+        self.pages = [self.pages[1], self.pages[1]]
+        self.fresh = False
+
+
+def chunk_blocks(blocks, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, min_length=MIN_TEXT_LENGTH):
+    """
+    Turn a stream of paragraph records (see page_blocks) into chunks of at
+    most `chunk_size` tokens that never straddle a heading. Consecutive
+    chunks of a section share `overlap` tokens, and each chunk records the
+    section heading and the pages it spans. Body font size is the running
+    most common size, so this works on a stream.
+    """
+    packer = _Packer(chunk_size, overlap)
+    size_weights = Counter()
+
+    for block in blocks:
+        text = block['text'].strip()
+        if not text:
+            continue
+        size = block.get('font_size')
+        tokens = count_tokens(text)
+        if size is not None:
+            body_size = size_weights.most_common(1)[0][0] if size_weights else size
+            is_heading = tokens <= _HEADING_MAX_TOKENS and not text.endswith('.') and (
+                size >= body_size * HEADING_SIZE_RATIO or (block.get('bold') and size >= body_size)
+            )
+            size_weights[size] += len(text)
+            if is_heading:
+                yield from packer.start_section(text)
+                continue
+        if len(text) < min_length:
+            continue
+        yield from packer.add(text, block.get('page_num'))
+
+    yield from packer.flush()
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, min_length=MIN_TEXT_LENGTH):
+    """
+    Chunk plain text (no layout information); paragraphs are separated by
+    blank lines.
+    """
+    paragraphs = [' '.join(p.split()) for p in re.split(r"\n\s*\n", text)]
+    blocks = ({"text": p, "page_num": None} for p in paragraphs)
+    for chunk in chunk_blocks(blocks, chunk_size, overlap, min_length):
+        # No page information without layout
+        yield {"text": chunk["text"]}
@@ -0,0 +1,273 @@
+# collection_store.py
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+from config import COLLECTION_FOLDER, COLLECTION_INDEX_SPEC
+from document_store import get_document
+from embedding_service import embedding_service
+from index_factory import build_id_index, search as search_index
+from rag_engine import load_chunks
+
+# Vector ids pack the document's sequence number in the collection with the
+# chunk's position in that document, so a whole document is one id range.
+DOC_SHIFT = 32
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_id TEXT UNIQUE NOT NULL,
+    title TEXT,
+    author TEXT,
+    metadata TEXT,
+    num_chunks INTEGER,
+    added_at REAL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    doc_seq INTEGER NOT NULL,
+    page_num INTEGER,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_doc_page ON chunks (doc_seq, page_num);
+"""
+
+
+def is_valid_collection_name(name):
+    return bool(_NAME_RE.match(name or ""))
+
+
+class Collection:
+    """
+    Many documents in one ID-mapped FAISS index, with chunk text and
+    document metadata in SQLite for filtering. Documents are added and
+    removed incrementally; nothing is rebuilt. The index is built from
+    `index_spec` (an index_factory string; it must support remove_ids, so
+    Flat or IVF). An IVF index needs training data from across the
+    collection, so vectors are kept in an exact Flat index until there are
+    enough of them to train it.
+    """
+
+    def __init__(self, name, folder=COLLECTION_FOLDER, index_spec=COLLECTION_INDEX_SPEC):
+        self.name = name
+        self.index_spec = index_spec
+        self.dir = os.path.join(folder, name)
+        self.index_path = os.path.join(self.dir, "vectors.index")
+        self.db_path = os.path.join(self.dir, "collection.db")
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        with self._read() as db:
+            db.executescript(_SCHEMA)
+        self._index = None
+        self._index_mtime = None
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @contextmanager
+    def _read(self):
+        db = self._connect()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _write(self):
+        # BEGIN IMMEDIATE takes SQLite's write lock, which also serializes
+        # index rewrites between worker processes sharing the collection
+        with self._lock, self._read() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def _load_index(self):
+        # Reload when another worker process has rewritten the index
+        mtime = os.stat(self.index_path).st_mtime_ns if os.path.exists(self.index_path) else None
+        if self._index is None or mtime != self._index_mtime:
+            if mtime is None:
+                self._index = build_id_index(embedding_service.dimension, self.index_spec)
+                if not self._index.is_trained:
+                    self._index = build_id_index(embedding_service.dimension, "Flat")
+            else:
+                self._index = faiss.read_index(self.index_path)
+            self._index_mtime = mtime
+        return self._index
+
+    def _train_index(self):
+        # Swap the staging Flat index for the configured IVF one once it holds
+        # at least 39 vectors per list, training on everything added so far
+        index = self._index
+        if faiss.try_extract_index_ivf(index) is not None:
+            return
+        trained = build_id_index(embedding_service.dimension, self.index_spec)
+        if trained.is_trained or index.ntotal < faiss.extract_index_ivf(trained).nlist * 39:
+            return
+        ids = faiss.vector_to_array(index.id_map)
+        vectors = index.reconstruct_batch(ids)
+        trained.train(vectors)
+        trained.add_with_ids(vectors, ids)
+        self._index = trained
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        faiss.write_index(self._index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def list_documents(self):
+        with self._read() as db:
+            rows = db.execute(
+                "SELECT document_id, title, author, num_chunks, added_at FROM documents ORDER BY doc_seq"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def add_document(self, document_id):
+        """
+        Add an indexed document from the document store. Adding a document
+        that is already in the collection is a no-op.
+        """
+        record = get_document(document_id)
+        if record is None:
+            raise KeyError(document_id)
+        chunks = list(load_chunks(document_id))
+        metadata = record.get("metadata") or {}
+        # Vectors come from the embedding cache, so this rarely re-encodes
+        embeddings = embedding_service.encode_cached([c["text"] for c in chunks]) if chunks else None
+
+        with self._write() as db:
+            existing = db.execute(
+                "SELECT doc_seq FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            if existing is not None:
+                return False
+
+            cur = db.execute(
+                "INSERT INTO documents (document_id, title, author, metadata, num_chunks, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (document_id, metadata.get("title"), metadata.get("author"),
+                 json.dumps(metadata), len(chunks), time.time()),
+            )
+            doc_seq = cur.lastrowid
+            ids = np.array([(doc_seq << DOC_SHIFT) | i for i in range(len(chunks))], dtype=np.int64)
+            db.executemany(
+                "INSERT INTO chunks (id, doc_seq, page_num, text) VALUES (?, ?, ?, ?)",
+                [(int(i), doc_seq, c.get("page_num"), c["text"]) for i, c in zip(ids, chunks)],
+            )
+            if chunks:
+                self._load_index().add_with_ids(embeddings, ids)
+                self._train_index()
+                self._save_index()
+        return True
+
+    def remove_document(self, document_id):
+        with self._write() as db:
+            row = db.execute(
+                "SELECT doc_seq FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            doc_seq = row["doc_seq"]
+            db.execute("DELETE FROM chunks WHERE doc_seq = ?", (doc_seq,))
+            db.execute("DELETE FROM documents WHERE doc_seq = ?", (doc_seq,))
+            index = self._load_index()
+            index.remove_ids(faiss.IDSelectorRange(doc_seq << DOC_SHIFT, (doc_seq + 1) << DOC_SHIFT))
+            self._save_index()
+        return True
+
+    def _allowed_ids(self, db, document_ids, page_from, page_to, title, author):
+        clauses, args = [], []
+        if document_ids:
+            clauses.append(f"d.document_id IN ({','.join('?' * len(document_ids))})")
+            args.extend(document_ids)
+        if page_from is not None:
+            clauses.append("c.page_num >= ?")
+            args.append(page_from)
+        if page_to is not None:
+            clauses.append("c.page_num <= ?")
+            args.append(page_to)
+        if title:
+            clauses.append("d.title LIKE ?")
+            args.append(f"%{title}%")
+        if author:
+            clauses.append("d.author LIKE ?")
+            args.append(f"%{author}%")
+        if not clauses:
+            return None
+        rows = db.execute(
+            "SELECT c.id FROM chunks c JOIN documents d ON d.doc_seq = c.doc_seq WHERE " + " AND ".join(clauses),
+            args,
+        ).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def search(self, query, top_k=5, document_ids=None, page_from=None, page_to=None, title=None, author=None):
+        """
+        Search the whole collection, optionally restricted to some documents,
+        a page range, or documents whose title/author contain the given text.
+        """
+        with self._read() as db:
+            allowed = self._allowed_ids(db, document_ids, page_from, page_to, title, author)
+            if allowed is not None and len(allowed) == 0:
+                return []
+
+            query_vec = embedding_service.encode_query(query)
+            with self._lock:
+                index = self._load_index()
+                if index.ntotal == 0:
+                    return []
+                sel = None if allowed is None else faiss.IDSelectorBatch(allowed)
+                distances, ids = search_index(index, query_vec, top_k, sel=sel)
+
+            hits = [(int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0]
+            if not hits:
+                return []
+            rows = db.execute(
+                f"SELECT c.id, c.page_num, c.text, d.document_id, d.title FROM chunks c "
+                f"JOIN documents d ON d.doc_seq = c.doc_seq WHERE c.id IN ({','.join('?' * len(hits))})",
+                [i for i, _ in hits],
+            ).fetchall()
+
+        by_id = {row["id"]: row for row in rows}
+        results = []
+        for chunk_id, distance in hits:
+            row = by_id.get(chunk_id)
+            if row is None:
+                continue
+            results.append({
+                "text": row["text"],
+                "page_num": row["page_num"],
+                "document_id": row["document_id"],
+                "title": row["title"],
+                "distance": distance,
+            })
+        return results
+
+
+_collections = {}
+_collections_lock = threading.Lock()
+
+
+def get_collection(name):
+    if not is_valid_collection_name(name):
+        raise ValueError(f"Invalid collection name: {name!r}")
+    with _collections_lock:
+        collection = _collections.get(name)
+        if collection is None:
+            collection = _collections[name] = Collection(name)
+        return collection
@@ -1,6 +1,94 @@
 # config.py
+import os
+
 UPLOAD_FOLDER = 'uploaded_pdfs'
 INDEX_FOLDER = 'indexes'
 CHUNK_SIZE = 100
 MIN_TEXT_LENGTH = 30
 MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+DOCUMENT_FOLDER = 'documents'
+INDEX_CACHE_MAX_ENTRIES = 32
+INDEX_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+PARSE_WORKERS = os.cpu_count() or 1
+PARSE_PAGES_PER_TASK = 16
+PARSE_MIN_PAGES_FOR_POOL = 32
+EMBED_BATCH_SIZE = 64
+EMBED_MAX_WAIT_MS = 5
+EMBED_STREAM_WINDOW = 1024
+EMBED_CACHE_FOLDER = 'embedding_cache'
+ANN_MIN_VECTORS = 20000
+HNSW_MAX_VECTORS = 2000000
+INDEX_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024
+IVF_NPROBE = 16
+HNSW_EF_SEARCH = 64
+COLLECTION_FOLDER = 'collections'
+COLLECTION_INDEX_SPEC = 'Flat'
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'memory')
+SESSION_DB_PATH = 'sessions.db'
+SESSION_MAX_SESSIONS = 1000
+SESSION_TTL = 3600
+SESSION_MAX_MESSAGES = 100
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '3000'))
+TRANSLATOR_PRELOAD = os.environ.get('TRANSLATOR_PRELOAD', '0') == '1'
+TRANSLATOR_WARMUP = os.environ.get('TRANSLATOR_WARMUP', '0') == '1'
+TRANSLATOR_IDLE_UNLOAD = 1800
+TRANSLATION_BATCH_SIZE = 16
+TRANSLATION_NUM_BEAMS = 1
+TRANSLATION_MAX_NEW_TOKENS = 256
+TRANSLATION_CACHE_SIZE = 4096
+QUERY_CACHE_MAX_ENTRIES = 2048
+QUERY_CACHE_MAX_PER_DOCUMENT = 256
+QUERY_CACHE_TTL = 3600
+QUERY_CACHE_SIMILARITY = 0.92
+CHUNK_OVERLAP = 20
+HEADING_SIZE_RATIO = 1.15
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+HYBRID_CANDIDATES = 4
+ASGI_CPU_WORKERS = 4
+ASGI_IO_WORKERS = 16
+ASGI_MAX_ACTIVE = 256
+ASGI_MAX_WAITING = 512
+INGEST_DB_PATH = 'ingest.db'
+INGEST_WORKERS = 2
+INGEST_MAX_ATTEMPTS = 3
+INGEST_RETRY_DELAY = 5
+INGEST_LEASE = 120
+INGEST_WAIT_SECONDS = 20
+INGEST_JOB_RETENTION = 7 * 24 * 3600
+SUMMARY_FOLDER = 'summaries'
+SUMMARY_MODEL = 'llama3'
+SUMMARY_CONCURRENCY = 4
+SUMMARY_GROUP_TOKENS = 1500
+SUMMARY_MIN_TOKENS = 60
+# "hash" swaps the sentence-transformers model for a deterministic hashing
+# embedder (no model download); meant for benchmarks and offline runs
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "sentence-transformers")
+HASH_EMBEDDING_DIM = 384
+# Embedded images are only extracted when asked for, in the background, into
+# a scratch folder whose least recently used files go first past the cap
+EXTRACT_IMAGES = os.environ.get("EXTRACT_IMAGES", "0") == "1"
+IMAGE_FOLDER = 'images'
+IMAGE_SCRATCH_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_MIN_BYTES = 2048
+# Query-time context selection: over-fetch, dedupe, optionally rerank with a
+# cross-encoder, then pack into a token budget with neighbouring chunks
+CONTEXT_CANDIDATES = 4
+CONTEXT_TOKEN_BUDGET = 1500
+CONTEXT_DEDUPE_OVERLAP = 0.8
+CONTEXT_EXPAND_NEIGHBORS = 1
+RERANK_ENABLED = os.environ.get("RERANK", "0") == "1"
+RERANK_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+# Language routing: decisions cached per question text and per session; a
+# mean per-word score inside +/- the margin counts as "no signal"
+LANG_ROUTE_CACHE_SIZE = 4096
+LANG_ROUTE_MARGIN = 0.5
+# Ollama: keep models loaded between requests and give each one a fixed
+# context size (a different num_ctx forces a reload). History is trimmed in
+# blocks of messages so the cached prompt prefix survives several turns.
+LLM_MODEL = 'llama3'
+LLM_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+LLM_NUM_CTX = {LLM_MODEL: int(os.environ.get("OLLAMA_NUM_CTX", "8192"))}
+LLM_DEFAULT_NUM_CTX = 4096
+HISTORY_TRIM_BLOCK = int(os.environ.get("HISTORY_TRIM_BLOCK", "8"))
@@ -0,0 +1,17 @@
+# conftest.py
+import os
+import shutil
+import tempfile
+
+# Tests use the hashing embedder, so no model is downloaded
+os.environ.setdefault("EMBEDDING_BACKEND", "hash")
+
+# The stores write to folders relative to the working directory (indexes/,
+# documents/, embedding_cache/), some of them opened at import time, so the
+# whole run happens in a scratch directory
+_workdir = tempfile.mkdtemp(prefix="pdfqa-tests-")
+os.chdir(_workdir)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_workdir, ignore_errors=True)
@@ -0,0 +1,178 @@
+# document_store.py
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import DOCUMENT_FOLDER
+from metrics import chunks_indexed, span
+from rag_engine import build_faiss_index
+
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def document_id_for(data):
+    """
+    Content hash of the raw PDF bytes, used as the document id.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def _pdf_path(doc_id):
+    return os.path.join(DOCUMENT_FOLDER, f"{doc_id}.pdf")
+
+
+def _info_path(doc_id):
+    return os.path.join(DOCUMENT_FOLDER, f"{doc_id}.json")
+
+
+def _lock_for(doc_id):
+    with _build_locks_guard:
+        return _build_locks.setdefault(doc_id, threading.Lock())
+
+
+def is_valid_document_id(doc_id):
+    return isinstance(doc_id, str) and len(doc_id) == 64 and all(c in "0123456789abcdef" for c in doc_id)
+
+
+def get_document(doc_id):
+    """
+    Return the stored record for a document id, or None if it was never indexed.
+    The info file is written last, so its presence means the index is complete.
+    """
+    if not is_valid_document_id(doc_id):
+        return None
+    try:
+        with open(_info_path(doc_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def store_pdf(data):
+    """
+    Save the raw PDF bytes under their content hash and return the document id.
+    """
+    doc_id = document_id_for(data)
+    pdf_path = _pdf_path(doc_id)
+    if not os.path.exists(pdf_path):
+        os.makedirs(DOCUMENT_FOLDER, exist_ok=True)
+        with span("store_pdf"):
+            _write_atomic(pdf_path, data, mode='wb')
+    return doc_id
+
+
+def build_document(doc_id, build, progress=None, data=None):
+    """
+    Index a PDF previously saved with store_pdf, unless that already happened.
+
+    `build(pdf_path, data=None)` must return `(chunks, metadata)`, where chunks
+    may be a generator; `data` is the PDF's bytes when the caller still has
+    them, so the builder can open the document from memory. `progress`, if
+    given, is called with keyword updates (`pages_total`, `pages_parsed`,
+    `chunks_embedded`) while the document is indexed.
+    """
+    record = get_document(doc_id)
+    if record is not None:
+        return record
+
+    with _lock_for(doc_id):
+        record = get_document(doc_id)
+        if record is not None:
+            return record
+
+        pdf_path = _pdf_path(doc_id)
+        # Parsing is lazy and interleaved with embedding, so "ingest" minus
+        # the embed and index_build stages is roughly the parse time
+        with span("ingest"):
+            chunks, metadata = build(pdf_path, data=data)
+            if progress is not None:
+                progress(pages_total=metadata.get('page_count'))
+                chunks = _track_pages(chunks, progress)
+                on_embedded = lambda n: progress(chunks_embedded=n)
+            else:
+                on_embedded = None
+            chunks = build_faiss_index(chunks, doc_id, on_progress=on_embedded)
+        chunks_indexed.inc(len(chunks))
+
+        record = {
+            "document_id": doc_id,
+            "metadata": metadata,
+            "num_chunks": len(chunks),
+            "size_bytes": os.path.getsize(pdf_path),
+            "created_at": time.time(),
+        }
+        _write_atomic(_info_path(doc_id), json.dumps(record), mode='w')
+        return record
+
+
+def _track_pages(chunks, progress):
+    for chunk in chunks:
+        page = chunk.get('page_end', chunk.get('page_num'))
+        if page is not None:
+            progress(pages_parsed=page)
+        yield chunk
+
+
+def get_or_create_document(data, build):
+    """
+    Look up a PDF by content hash and index it only the first time it is seen.
+    `build` is called at most once per distinct file, even when several
+    sessions upload the same PDF at once.
+    """
+    record = get_document(document_id_for(data))
+    if record is not None:
+        return record
+    return build_document(store_pdf(data), build, data=data)
+
+
+def document_pdf_path(doc_id):
+    return _pdf_path(doc_id)
+
+
+def _write_atomic(path, payload, mode):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    encoding = None if 'b' in mode else 'utf-8'
+    with open(tmp_path, mode, encoding=encoding) as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def resolve_request_document(req, build, queue=None, wait=0):
+    """
+    Find the indexed document for a Flask request, either by `document_id` or by
+    hashing an uploaded `file`. Returns (document, error) where error is a
+    (payload, status) pair.
+
+    Without a `queue` new uploads are indexed inline. With one they are handed
+    to the ingestion queue and waited on for up to `wait` seconds; a document
+    still indexing after that comes back as a 202 carrying its job status.
+    """
+    doc_id = req.form.get('document_id')
+    if doc_id and 'file' not in req.files:
+        document = get_document(doc_id)
+        if document is not None:
+            return document, None
+        job = queue.job_for_document(doc_id) if queue is not None else None
+        if job is None:
+            return None, ({"error": "Unknown document_id"}, 404)
+        return _await_job(queue, job, wait)
+
+    if 'file' not in req.files:
+        return None, ({"error": "Either file or document_id is required"}, 400)
+
+    data = req.files['file'].read()
+    if queue is None:
+        return get_or_create_document(data, build), None
+    return _await_job(queue, queue.submit(data), wait)
+
+
+def _await_job(queue, job, wait):
+    job = queue.wait(job['job_id'], wait)
+    if job['status'] == 'done':
+        return get_document(job['document_id']), None
+    if job['status'] == 'failed':
+        return None, ({"error": "Indexing failed", "job": job}, 500)
+    return None, ({"status": "indexing", "job": job}, 202)
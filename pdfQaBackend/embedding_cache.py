@@ -0,0 +1,146 @@
+# embedding_cache.py
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from config import EMBED_CACHE_FOLDER
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within this process
+    fcntl = None
+
+KEY_SIZE = 16
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(model_name, text):
+    return hashlib.blake2b(
+        f"{model_name}\0{normalize_text(text)}".encode("utf-8"), digest_size=KEY_SIZE
+    ).digest()
+
+
+class EmbeddingCache:
+    """
+    Append-only on-disk embedding cache for one model. Vectors live in a
+    memory-mapped float32 file and `keys.bin` holds the matching 16-byte
+    text hashes in row order, so the hash -> row index is rebuilt on open.
+    Vectors are always written before their keys, so a key never points at a
+    missing row.
+    """
+
+    def __init__(self, model_name, dim, folder=EMBED_CACHE_FOLDER):
+        self.model_name = model_name
+        self.dim = dim
+        self.dir = os.path.join(folder, re.sub(r"[^A-Za-z0-9._-]", "_", model_name))
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.lock_path = os.path.join(self.dir, ".lock")
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._keys_offset = 0
+        self._vectors = None
+        with self._lock:
+            self._refresh()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def lookup(self, texts):
+        """
+        Return (embeddings, missing) where embeddings has a row per text
+        (zeros for misses) and missing lists the indices not in the cache.
+        """
+        keys = [text_key(self.model_name, t) for t in texts]
+        embeddings = np.zeros((len(texts), self.dim), dtype='float32')
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                self._refresh()
+            hit_pos, hit_rows, missing = [], [], []
+            for i, key in enumerate(keys):
+                row = self._rows.get(key)
+                if row is None:
+                    missing.append(i)
+                else:
+                    hit_pos.append(i)
+                    hit_rows.append(row)
+            if hit_rows:
+                embeddings[hit_pos] = self._vectors[hit_rows]
+        return embeddings, missing
+
+    def store(self, texts, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        with self._lock, _FileLock(self.lock_path):
+            self._refresh()
+            new_keys, new_rows = [], []
+            for text, vector in zip(texts, vectors):
+                key = text_key(self.model_name, text)
+                if key in self._rows or key in new_keys:
+                    continue
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+
+            # Drop a torn key or vectors left behind by a writer that died
+            # before writing its keys, so rows and keys stay aligned
+            row_bytes = 4 * self.dim
+            with open(self.keys_path, "ab") as f:
+                if f.tell() % KEY_SIZE:
+                    f.truncate(f.tell() - f.tell() % KEY_SIZE)
+            with open(self.vectors_path, "ab") as f:
+                n_keys = self._keys_offset // KEY_SIZE
+                if f.tell() > n_keys * row_bytes:
+                    f.truncate(n_keys * row_bytes)
+                f.write(np.stack(new_rows).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            self._refresh()
+
+    def _refresh(self):
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        usable = len(data) - len(data) % KEY_SIZE
+        row = self._keys_offset // KEY_SIZE
+        for pos in range(0, usable, KEY_SIZE):
+            self._rows[data[pos:pos + KEY_SIZE]] = row
+            row += 1
+        self._keys_offset += usable
+
+        n_rows = min(os.path.getsize(self.vectors_path) // (4 * self.dim), self._keys_offset // KEY_SIZE)
+        if self._vectors is None or self._vectors.shape[0] != n_rows:
+            self._vectors = np.memmap(self.vectors_path, dtype='float32', mode='r', shape=(n_rows, self.dim)) if n_rows else None
+
+
+class _FileLock:
+    # Serializes appends across worker processes sharing the cache directory
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._f = open(self.path, "a")
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._f is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
@@ -0,0 +1,152 @@
+# embedding_service.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import hashlib
+import re
+
+import numpy as np
+
+from config import EMBED_BATCH_SIZE, EMBED_MAX_WAIT_MS, MODEL_NAME, EMBEDDING_BACKEND, HASH_EMBEDDING_DIM
+from embedding_cache import EmbeddingCache
+
+
+class HashingEmbedder:
+    """
+    Deterministic stand-in for a SentenceTransformer: each word and word
+    bigram is hashed to a signed dimension and the result is L2-normalized.
+    Texts sharing words land close together, which is enough to exercise
+    retrieval without downloading a model.
+    """
+
+    def __init__(self, dim=HASH_EMBEDDING_DIM):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True):
+        vectors = np.zeros((len(texts), self.dim), dtype='float32')
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+if EMBEDDING_BACKEND == "hash":
+    embedding_model = HashingEmbedder()
+    embedding_model_name = f"hash-{HASH_EMBEDDING_DIM}"
+else:
+    from sentence_transformers import SentenceTransformer
+    embedding_model = SentenceTransformer(MODEL_NAME)
+    embedding_model_name = MODEL_NAME
+
+
+class EmbeddingService:
+    """
+    Front door for all embedding calls. Single query encodes from concurrent
+    requests are collected for up to `max_wait_ms` and encoded as one
+    micro-batch; document encodes are length-sorted so each batch pads to
+    similar lengths.
+    """
+
+    def __init__(self, model, model_name, batch_size=EMBED_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.model = model
+        self.model_name = model_name
+        self.cache = EmbeddingCache(model_name, self.dimension)
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def submit(self, text):
+        """
+        Queue a single text for the next micro-batch; returns a Future that
+        resolves to a float32 vector.
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode_query(self, text):
+        return self.submit(text).result()[np.newaxis, :]
+
+    def encode_cached(self, texts):
+        """
+        Like encode_documents, but only texts missing from the on-disk
+        embedding cache are encoded; new vectors are added to the cache.
+        """
+        embeddings, missing = self.cache.lookup(texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            vectors = self.encode_documents(missing_texts)
+            embeddings[missing] = vectors
+            self.cache.store(missing_texts, vectors)
+        return embeddings
+
+    def encode_documents(self, texts, batch_size=None):
+        """
+        Encode a list of texts, longest first, and return embeddings in the
+        original order as a float32 array.
+        """
+        batch_size = batch_size or self.batch_size
+        if not texts:
+            return np.zeros((0, self.dimension), dtype='float32')
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        embeddings = np.empty((len(texts), self.dimension), dtype='float32')
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self.model.encode(
+                [texts[i] for i in rows], batch_size=batch_size, convert_to_numpy=True
+            )
+        return embeddings
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                vectors = self.model.encode(
+                    [text for text, _ in batch], batch_size=self.batch_size, convert_to_numpy=True
+                ).astype('float32')
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+embedding_service = EmbeddingService(embedding_model, embedding_model_name)
@@ -0,0 +1,188 @@
+# fake_ollama.py
+"""
+Deterministic stand-in for the Ollama server, for benchmarks and offline runs:
+
+    python fake_ollama.py [--port 11434] [--prefill-ms 150] [--token-ms 15] [--tokens 64]
+    OLLAMA_HOST=http://127.0.0.1:11434 python app.py
+
+Serves /api/chat, blocking and streamed (NDJSON). A reply costs a prefill
+delay (fixed part plus a per-prompt-token part) and then one delay per
+generated token. The reply text depends only on the prompt, and the final
+message carries the usual token counts and durations.
+
+Like the real server, the last few prompts are kept as a prefix cache:
+only the part of a prompt after the longest prefix shared with one of them
+is "evaluated" and costs prefill time (prompt_eval_duration), while
+prompt_eval_count is the whole prompt.
+Prompts are tokenized into words and punctuation, deliberately not with the
+chars/4 estimate the backends use for budgeting.
+"""
+import argparse
+import collections
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "the document describes a method for measuring results across several sections and "
+    "reports that performance depends on input size configuration and available memory while "
+    "later chapters compare alternatives and summarize key findings"
+).split()
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+class FakeOllama:
+    def __init__(self, host="127.0.0.1", port=11434, prefill_ms=150.0, prefill_us_per_token=50.0,
+                 token_ms=15.0, tokens=64, cache_slots=4):
+        self.prefill_ms = prefill_ms
+        self.prefill_us_per_token = prefill_us_per_token
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.requests = 0
+        self._prompts = collections.deque(maxlen=cache_slots)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reply(self, messages):
+        """
+        Reply tokens, prompt tokens, and how many of those to evaluate (the
+        ones past the longest cached prefix) for a message list.
+        """
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        pieces = [("" if i == 0 else " ") + rng.choice(WORDS) for i in range(self.tokens)]
+        tokens = _TOKEN.findall(prompt)
+        with self._lock:
+            cached = max((len(os.path.commonprefix([tokens, seen])) for seen in self._prompts), default=0)
+            self._prompts.append(tokens)
+        # The last token is always evaluated, as on the real server
+        return pieces, len(tokens), max(1, len(tokens) - cached)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    self._send_json({"version": "0.0.0-fake"})
+                elif self.path == "/api/tags":
+                    self._send_json({"models": []})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if self.path != "/api/chat":
+                    self._send_json({"error": "not found"}, status=404)
+                    return
+                with fake._lock:
+                    fake.requests += 1
+
+                started = time.perf_counter()
+                pieces, prompt_tokens, evaluated = fake.reply(body.get("messages", []))
+                prefill_s = (fake.prefill_ms + evaluated * fake.prefill_us_per_token / 1000) / 1000
+                time.sleep(prefill_s)
+                model = body.get("model", "fake")
+
+                if body.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for piece in pieces:
+                        time.sleep(fake.token_ms / 1000)
+                        self._write_chunk(self._message(model, piece, done=False))
+                    self._write_chunk(self._final(model, "", started, prefill_s, prompt_tokens, len(pieces)))
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    time.sleep(fake.token_ms * len(pieces) / 1000)
+                    self._send_json(self._final(model, "".join(pieces), started, prefill_s, prompt_tokens, len(pieces)))
+
+            def _message(self, model, content, done):
+                return {
+                    "model": model,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "message": {"role": "assistant", "content": content},
+                    "done": done,
+                }
+
+            def _final(self, model, content, started, prefill_s, prompt_tokens, eval_tokens):
+                total_ns = int((time.perf_counter() - started) * 1e9)
+                prefill_ns = int(prefill_s * 1e9)
+                return dict(
+                    self._message(model, content, done=True),
+                    done_reason="stop",
+                    total_duration=total_ns,
+                    load_duration=0,
+                    prompt_eval_count=prompt_tokens,
+                    prompt_eval_duration=prefill_ns,
+                    eval_count=eval_tokens,
+                    eval_duration=max(0, total_ns - prefill_ns),
+                )
+
+            def _write_chunk(self, payload):
+                data = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--prefill-ms", type=float, default=150.0)
+    parser.add_argument("--prefill-us-per-token", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=15.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--cache-slots", type=int, default=4)
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        args.host, args.port, args.prefill_ms, args.prefill_us_per_token, args.token_ms, args.tokens, args.cache_slots
+    )
+    print(f"Fake Ollama listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# image_extractor.py
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz
+
+from config import IMAGE_FOLDER, IMAGE_MIN_BYTES, IMAGE_SCRATCH_MAX_BYTES
+
+
+class ImageExtractor:
+    """
+    Extracts a document's embedded images on a background thread into a
+    shared scratch folder.
+
+    Each image is read once per document (images reused on several pages
+    share an xref) and stored under its content hash, so identical images
+    across documents are written once. images/{document_id}.json lists where
+    each image appears. Once the folder grows past `max_bytes`, the least
+    recently used image files are deleted (serving an image counts as a
+    use, see touch()), except those of the document just extracted. A
+    document whose files were evicted is extracted again on its next request.
+    """
+
+    def __init__(self, folder=IMAGE_FOLDER, max_bytes=IMAGE_SCRATCH_MAX_BYTES, min_bytes=IMAGE_MIN_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="images")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, doc_id, pdf_path=None, data=None):
+        """
+        Queue extraction for a document, read from `pdf_path` or from the
+        PDF bytes in `data`, unless it is already queued or its images are
+        all on disk.
+        """
+        with self._lock:
+            if doc_id in self._pending or self.images_for(doc_id) is not None:
+                return False
+            self._pending.add(doc_id)
+        self._pool.submit(self._run, doc_id, pdf_path, data)
+        return True
+
+    def images_for(self, doc_id):
+        """
+        Manifest entries for a document, or None if extraction has not
+        finished or some of its image files have since been evicted.
+        """
+        try:
+            with open(self._manifest_path(doc_id), 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return None
+        if not all(os.path.exists(self.image_path(entry['file'])) for entry in entries):
+            return None
+        return entries
+
+    def image_path(self, name):
+        return os.path.join(self.folder, os.path.basename(name))
+
+    def touch(self, name):
+        """
+        Mark an image as used so eviction keeps recently served files.
+        """
+        try:
+            os.utime(self.image_path(name))
+        except FileNotFoundError:
+            pass
+
+    def _manifest_path(self, doc_id):
+        return os.path.join(self.folder, f"{doc_id}.json")
+
+    def _run(self, doc_id, pdf_path, data=None):
+        try:
+            entries = self._extract(doc_id, pdf_path, data)
+            self._enforce_cap(keep={entry['file'] for entry in entries})
+        except Exception as e:
+            print(f"Image extraction failed for {doc_id}:", e)
+        finally:
+            with self._lock:
+                self._pending.discard(doc_id)
+
+    def _extract(self, doc_id, pdf_path, data=None):
+        os.makedirs(self.folder, exist_ok=True)
+        entries = []
+        files = {}
+        with (fitz.open(pdf_path) if data is None else fitz.open(stream=data, filetype="pdf")) as doc:
+            for page_num, page in enumerate(doc):
+                for img in page.get_images(full=True):
+                    xref = img[0]
+                    if xref not in files:
+                        files[xref] = self._save(doc, xref)
+                    if files[xref] is not None:
+                        entries.append(dict(files[xref], page_num=page_num + 1, xref=xref))
+
+        tmp_path = f"{self._manifest_path(doc_id)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self._manifest_path(doc_id))
+        return entries
+
+    def _save(self, doc, xref):
+        image = doc.extract_image(xref)
+        if not image or len(image['image']) < self.min_bytes:
+            return None  # icons, rules and other decoration
+        name = f"{hashlib.sha256(image['image']).hexdigest()[:32]}.{image['ext']}"
+        path = self.image_path(name)
+        if os.path.exists(path):
+            os.utime(path)  # counts as a use for eviction
+        else:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(image['image'])
+            os.replace(tmp_path, path)
+        return {"file": name, "width": image.get('width'), "height": image.get('height')}
+
+    def _enforce_cap(self, keep=()):
+        # Never evict the document just extracted, or it would be
+        # re-extracted on every request once it is bigger than the cap alone
+        files = []
+        total = 0
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith(('.json', '.tmp')):
+                stat = entry.stat()
+                total += stat.st_size
+                if entry.name not in keep:
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+image_extractor = ImageExtractor()
@@ -0,0 +1,92 @@
+# index_cache.py
+import os
+import threading
+from collections import OrderedDict
+
+from config import INDEX_CACHE_MAX_ENTRIES, INDEX_CACHE_MAX_BYTES
+
+
+class IndexCache:
+    """
+    Thread-safe LRU of loaded indexes and their chunk metadata, bounded by both
+    entry count and total on-disk size. An entry is reloaded when any of its
+    files changes on disk, so rebuilt indexes are never served stale.
+    """
+
+    def __init__(self, max_entries=INDEX_CACHE_MAX_ENTRIES, max_bytes=INDEX_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, paths, loader, charged_paths=None):
+        """
+        Return the cached value for `key`, calling `loader()` on a miss.
+        `paths` are the files backing the entry; their mtime and size form
+        the entry's version. Only `charged_paths` (default: all of them)
+        count towards the byte budget.
+        """
+        version = _file_version(paths)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = loader()
+        charged = set(charged_paths if charged_paths is not None else paths)
+        size = sum(v[1] for path, v in zip(paths, version) if path in charged)
+        with self._lock:
+            self._remove(key)
+            if size <= self.max_bytes:
+                self._entries[key] = (version, value, size)
+                self._bytes += size
+                self._evict()
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[2]
+            self.evictions += 1
+
+
+def _file_version(paths):
+    version = []
+    for path in paths:
+        st = os.stat(path)
+        version.append((st.st_mtime_ns, st.st_size))
+    return tuple(version)
+
+
+index_cache = IndexCache()
@@ -0,0 +1,152 @@
+# index_factory.py
+import math
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from config import ANN_MIN_VECTORS, HNSW_MAX_VECTORS, INDEX_MEMORY_BUDGET, IVF_NPROBE, HNSW_EF_SEARCH
+
+HNSW_M = 32
+
+
+def _nlist_for(n):
+    # ~4*sqrt(n) lists, but at least 39 training points per centroid
+    return int(max(16, min(65536, 4 * math.sqrt(n), n // 39)))
+
+
+def _pq_m_for(n, dim, memory_budget):
+    # Largest sub-quantizer count that divides dim and fits the budget
+    for m in (64, 48, 32, 24, 16, 12, 8, 4):
+        if dim % m == 0 and n * (m + 8) <= memory_budget:
+            return m
+    return 4 if dim % 4 == 0 else 1
+
+
+def choose_index_spec(n, dim, memory_budget=INDEX_MEMORY_BUDGET):
+    """
+    Pick a faiss index_factory string for `n` vectors of size `dim`:
+    exact Flat for small corpora, HNSW while the graph fits the memory budget,
+    IVF-Flat beyond that, and IVF-PQ when raw vectors no longer fit.
+    """
+    if n < ANN_MIN_VECTORS:
+        return "Flat"
+
+    raw_bytes = n * dim * 4
+    nlist = _nlist_for(n)
+    if raw_bytes + n * HNSW_M * 2 * 4 <= memory_budget and n <= HNSW_MAX_VECTORS:
+        return f"HNSW{HNSW_M}"
+    if raw_bytes <= memory_budget:
+        return f"IVF{nlist},Flat"
+    return f"IVF{nlist},PQ{_pq_m_for(n, dim, memory_budget)}"
+
+
+def build_index(embeddings, spec=None, memory_budget=INDEX_MEMORY_BUDGET, train_sample=None, seed=1234):
+    n, dim = embeddings.shape
+    spec = spec or choose_index_spec(n, dim, memory_budget)
+    index = faiss.index_factory(dim, spec)
+
+    if not index.is_trained:
+        ivf = faiss.extract_index_ivf(index)
+        sample_size = min(n, train_sample or max(ivf.nlist * 64, 10000))
+        rng = np.random.default_rng(seed)
+        sample = embeddings[rng.choice(n, sample_size, replace=False)] if sample_size < n else embeddings
+        index.train(np.ascontiguousarray(sample))
+
+    index.add(embeddings)
+    return index
+
+
+def build_id_index(dim, spec="Flat"):
+    """
+    Empty index from an index_factory string that stores caller-chosen ids.
+    IVF indexes keep ids themselves; anything else is wrapped in IDMap2
+    unless the spec already starts with an IDMap.
+    """
+    index = faiss.index_factory(dim, spec)
+    if not spec.startswith("IDMap") and faiss.try_extract_index_ivf(index) is None:
+        index = faiss.IndexIDMap2(index)
+    return index
+
+
+def search_params(index, nprobe=None, ef_search=None, sel=None):
+    """
+    Per-query search parameters for the index type, or None for exact
+    indexes searched without an id selector. Passed to index.search so
+    concurrent queries on a shared index can use different settings.
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe or IVF_NPROBE, sel=sel)
+    if isinstance(faiss.downcast_index(index), faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or HNSW_EF_SEARCH, sel=sel)
+    return faiss.SearchParameters(sel=sel) if sel is not None else None
+
+
+def search(index, query_vecs, top_k, nprobe=None, ef_search=None, sel=None):
+    params = search_params(index, nprobe, ef_search, sel)
+    if params is None:
+        return index.search(query_vecs, top_k)
+    return index.search(query_vecs, top_k, params=params)
+
+
+def recall_report(embeddings, specs=None, top_k=10, n_queries=200, nprobes=(4, 16, 64), ef_searches=(32, 64, 128), seed=1234):
+    """
+    Measure recall@top_k and mean per-query latency of candidate index types
+    against exact flat search, using a sample of the corpus as queries.
+    """
+    n, dim = embeddings.shape
+    rng = np.random.default_rng(seed)
+    queries = np.ascontiguousarray(embeddings[rng.choice(n, min(n_queries, n), replace=False)])
+
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(embeddings)
+    start = time.perf_counter()
+    _, truth = flat.search(queries, top_k)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    rows = [{"spec": "Flat", "param": None, "recall": 1.0, "ms_per_query": flat_ms, "build_s": 0.0}]
+    specs = specs or sorted({choose_index_spec(n, dim), f"HNSW{HNSW_M}", f"IVF{_nlist_for(n)},Flat"} - {"Flat"})
+    for spec in specs:
+        start = time.perf_counter()
+        index = build_index(embeddings, spec)
+        build_s = time.perf_counter() - start
+
+        if faiss.try_extract_index_ivf(index) is not None:
+            settings = [{"nprobe": v} for v in nprobes]
+        elif isinstance(faiss.downcast_index(index), faiss.IndexHNSW):
+            settings = [{"ef_search": v} for v in ef_searches]
+        else:
+            settings = [{}]
+
+        for setting in settings:
+            start = time.perf_counter()
+            _, found = search(index, queries, top_k, **setting)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+            rows.append({
+                "spec": spec,
+                "param": setting or None,
+                "recall": hits / truth.size,
+                "ms_per_query": ms,
+                "build_s": build_s,
+            })
+    return rows
+
+
+def _vectors_from_index(path):
+    index = faiss.read_index(path)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("usage: python index_factory.py <flat .index file> [top_k]")
+        sys.exit(1)
+    vectors = _vectors_from_index(sys.argv[1])
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"{vectors.shape[0]} vectors, dim {vectors.shape[1]}, chosen: {choose_index_spec(*vectors.shape)}")
+    print(f"{'spec':<20}{'param':<22}{'recall@' + str(k):>10}{'ms/query':>10}{'build s':>10}")
+    for row in recall_report(vectors, top_k=k):
+        param = ", ".join(f"{key}={value}" for key, value in (row['param'] or {}).items())
+        print(f"{row['spec']:<20}{param:<22}{row['recall']:>10.3f}{row['ms_per_query']:>10.3f}{row['build_s']:>10.2f}")
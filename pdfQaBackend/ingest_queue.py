@@ -0,0 +1,240 @@
+# ingest_queue.py
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from document_store import build_document, document_id_for, get_document, store_pdf
+
+ACTIVE_STATUSES = ("queued", "running")
+_FIELDS = (
+    "job_id", "document_id", "status", "attempts", "pages_total", "pages_parsed",
+    "chunks_embedded", "error", "created_at", "updated_at",
+)
+
+
+class IngestQueue:
+    """
+    Persistent queue of PDF indexing jobs in a SQLite file, worked off by a
+    pool of background threads.
+
+    A running job holds a lease that progress updates keep extending; if its
+    worker dies (or the whole process does) the lease runs out and another
+    worker picks the job up again. Failed jobs are retried with exponential
+    backoff until `max_attempts` is reached. Finished (done or failed) jobs
+    are deleted `retention` seconds after their last update.
+    """
+
+    def __init__(self, path, build, workers=2, max_attempts=3, retry_delay=5, lease=120, poll_interval=0.5,
+                 retention=7 * 24 * 3600):
+        self.path = path
+        self.build = build
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._submits = 0
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._threads = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                pages_total INTEGER,
+                pages_parsed INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                run_after REAL NOT NULL,
+                lease_until REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_document ON jobs (document_id, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, run_after);
+        """)
+
+    def _db(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return db
+
+    def start(self):
+        """
+        Start the worker threads; safe to call more than once.
+        """
+        if self._threads:
+            return
+        self.prune()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, data):
+        """
+        Queue the PDF in `data` for indexing and return its job. A PDF that is
+        already indexed or queued reuses the existing job instead of starting
+        another one.
+        """
+        doc_id = document_id_for(data)
+        job = self.job_for_document(doc_id)
+        if job is not None and job["status"] != "failed":
+            return job
+
+        indexed = get_document(doc_id) is not None
+        if not indexed:
+            store_pdf(data)  # stored by content hash, so a racing upload writes the same file
+        # Check again under the write lock so concurrent uploads of the same
+        # PDF end up sharing one job
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            job = self.job_for_document(doc_id)
+            if job is None or job["status"] == "failed":
+                job_id = uuid.uuid4().hex
+                db.execute(
+                    "INSERT INTO jobs (job_id, document_id, status, created_at, updated_at, run_after) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, doc_id, "done" if indexed else "queued", now, now, now),
+                )
+                job = self.get(job_id)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        self._wakeup.set()
+        self._submits += 1
+        if self._submits % 100 == 0:
+            self.prune()
+        return job
+
+    def get(self, job_id):
+        row = self._db().execute(
+            f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return dict(zip(_FIELDS, row)) if row else None
+
+    def job_for_document(self, doc_id):
+        """
+        Most recent job for a document id, or None.
+        """
+        row = self._db().execute(
+            f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE document_id = ? ORDER BY created_at DESC LIMIT 1",
+            (doc_id,),
+        ).fetchone()
+        return dict(zip(_FIELDS, row)) if row else None
+
+    def wait(self, job_id, timeout):
+        """
+        Poll a job until it finishes or `timeout` seconds pass; returns its
+        latest state either way.
+        """
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and job["status"] in ACTIVE_STATUSES and time.monotonic() < deadline:
+            time.sleep(min(self.poll_interval, max(0, deadline - time.monotonic())))
+            job = self.get(job_id)
+        return job
+
+    def prune(self):
+        """
+        Delete finished jobs not updated in the last `retention` seconds.
+        """
+        self._db().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - self.retention,),
+        )
+
+    def stats(self):
+        rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def _claim(self):
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT job_id FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'running' AND lease_until < ?) ORDER BY run_after LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (now + self.lease, now, row[0]),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return self.get(row[0]) if row else None
+
+    def _update(self, job_id, **fields):
+        now = time.time()
+        fields["updated_at"] = now
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._db().execute(
+            f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id)
+        )
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.OperationalError as e:
+                print("Ingest queue error:", e)
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job["job_id"]
+        last_write = [0.0]
+
+        def progress(**fields):
+            # Progress arrives per chunk; write it (and extend the lease) at most
+            # a few times a second, but never drop the page total
+            now = time.monotonic()
+            if "pages_total" in fields or now - last_write[0] >= self.poll_interval:
+                last_write[0] = now
+                self._update(job_id, lease_until=time.time() + self.lease, **fields)
+
+        try:
+            record = build_document(job["document_id"], self.build, progress=progress)
+        except Exception as e:
+            print(f"Ingest job {job_id} failed:", e)
+            if job["attempts"] < self.max_attempts:
+                delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+                self._update(job_id, status="queued", error=str(e), run_after=time.time() + delay, lease_until=None)
+            else:
+                self._update(job_id, status="failed", error=str(e), lease_until=None)
+            return
+
+        page_count = record["metadata"].get("page_count")
+        self._update(
+            job_id,
+            status="done",
+            error=None,
+            lease_until=None,
+            pages_total=page_count,
+            pages_parsed=page_count or 0,
+            chunks_embedded=record["num_chunks"],
+        )
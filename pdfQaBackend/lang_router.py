@@ -0,0 +1,169 @@
+# lang_router.py
+"""
+Decides whether a question needs the Manipuri -> English translation pass,
+which costs two IndicTrans2 1B generations, so a wrong "Manipuri" call is
+the most expensive mistake a query can hit. In order of cost:
+
+1. Script: any Meetei Mayek or Bengali letter means Manipuri in that script.
+2. Known words: the romanized clue words route straight to Manipuri.
+3. A character trigram naive Bayes model over the remaining words, trained
+   on the clue lists plus a handful of common romanized Manipuri words
+   against common English question vocabulary.
+
+Decisions are cached per text, and each session remembers its last
+confident decision, which settles questions that carry no signal either
+way ("ok", "3?", a bare name).
+"""
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from config import LANG_ROUTE_CACHE_SIZE, LANG_ROUTE_MARGIN
+
+ENGLISH = "en"
+MANIPURI_LATIN = "mni-Latn"
+MANIPURI_MEETEI = "mni-Mtei"
+MANIPURI_BENGALI = "mni-Beng"
+
+# Clue words the translator and the old answer path each keyed on
+MANIPURI_CLUES = (
+    "houjikti", "nahakki", "eemagi", "khallabani", "nattraga",
+    "hou", "eikhoigi", "phangjaba", "houjik",
+)
+MANIPURI_WORDS = MANIPURI_CLUES + (
+    "eigi", "nahak", "mahak", "eikhoi", "kari", "karigi", "kadaida", "karamna", "kanano",
+    "amasung", "adu", "asi", "lairik", "lairikki", "ngasi", "toubiyu", "hairiba", "yaoriba",
+    "leibra", "leitre", "leire", "oiba", "oibra", "thabak", "houba", "tamba", "haibiyu",
+    "pibiyu", "khangba", "khangbra", "matam", "makhoi", "wahang", "paojel", "mayam",
+)
+ENGLISH_WORDS = (
+    "what", "which", "who", "whom", "whose", "when", "where", "why", "how", "is", "are", "was",
+    "were", "be", "been", "do", "does", "did", "can", "could", "should", "would", "will", "the",
+    "a", "an", "of", "in", "on", "at", "to", "for", "from", "by", "with", "about", "and", "or",
+    "not", "this", "that", "these", "those", "it", "its", "there", "their", "they", "he", "she",
+    "you", "your", "me", "my", "we", "our", "i", "document", "paper", "page", "pages", "section",
+    "chapter", "title", "author", "summary", "summarize", "explain", "describe", "list", "give",
+    "tell", "show", "find", "main", "key", "point", "points", "result", "results", "method",
+    "methods", "table", "figure", "data", "number", "hours", "house", "though",
+    "through", "thousand", "shoulder", "however", "without", "during", "between", "mentioned",
+    "according", "compare", "difference", "purpose", "conclusion", "introduction", "report",
+    "year", "date", "name", "people", "time", "first", "last", "many", "much", "more", "most",
+)
+
+_SCRIPTS = (
+    (MANIPURI_MEETEI, re.compile(r"[\uABC0-\uABFF\uAAE0-\uAAFF]")),
+    (MANIPURI_BENGALI, re.compile(r"[\u0980-\u09FF]")),
+)
+_WORD = re.compile(r"[a-z]+")
+
+
+class TrigramClassifier:
+    """
+    Naive Bayes over character trigrams of " word " with add-one smoothing.
+    score(word) is the mean per-trigram log-likelihood ratio, positive for
+    Manipuri-looking words.
+    """
+
+    def __init__(self, manipuri, english):
+        self._counts = {
+            MANIPURI_LATIN: Counter(g for w in manipuri for g in self._grams(w)),
+            ENGLISH: Counter(g for w in english for g in self._grams(w)),
+        }
+        vocabulary = len(set(self._counts[MANIPURI_LATIN]) | set(self._counts[ENGLISH]))
+        self._denominators = {
+            label: sum(counts.values()) + vocabulary for label, counts in self._counts.items()
+        }
+
+    @staticmethod
+    def _grams(word):
+        padded = f" {word} "
+        return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    def _log_prob(self, gram, label):
+        return math.log((self._counts[label][gram] + 1) / self._denominators[label])
+
+    def score(self, word):
+        grams = self._grams(word)
+        return sum(self._log_prob(g, MANIPURI_LATIN) - self._log_prob(g, ENGLISH) for g in grams) / len(grams)
+
+
+class LanguageRouter:
+    def __init__(self, max_entries=LANG_ROUTE_CACHE_SIZE, margin=LANG_ROUTE_MARGIN):
+        self.max_entries = max_entries
+        self.margin = margin
+        self.classifier = TrigramClassifier(MANIPURI_WORDS, ENGLISH_WORDS)
+        self._manipuri = set(MANIPURI_WORDS)
+        self._english = set(ENGLISH_WORDS)
+        self._decisions = OrderedDict()
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, entries, key, value):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def classify(self, text):
+        """
+        (language tag, confident) for a piece of text, without any caching.
+        """
+        for tag, pattern in _SCRIPTS:
+            if pattern.search(text):
+                return tag, True
+
+        words = _WORD.findall(text.lower())
+        if not words:
+            return ENGLISH, False
+        score = 0.0
+        for word in words:
+            if word in self._manipuri:
+                score += 2.0
+            elif word in self._english:
+                score -= 2.0
+            elif len(word) > 2:
+                score += self.classifier.score(word)
+        score /= len(words)
+        if abs(score) < self.margin:
+            return ENGLISH, False
+        return (MANIPURI_LATIN if score > 0 else ENGLISH), True
+
+    def route(self, text, session_id=None):
+        """
+        Language tag for a question: ENGLISH, or one of the MANIPURI_* tags
+        for Manipuri written in Latin, Meetei Mayek or Bengali script.
+        """
+        key = text.strip().lower()
+        with self._lock:
+            decision = self._decisions.get(key)
+            if decision is not None:
+                self._decisions.move_to_end(key)
+        if decision is None:
+            decision = self.classify(text)
+            self._remember(self._decisions, key, decision)
+
+        tag, confident = decision
+        if session_id is None:
+            return tag
+        if confident:
+            self._remember(self._sessions, session_id, tag)
+            return tag
+        with self._lock:
+            return self._sessions.get(session_id, tag)
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+router = LanguageRouter()
+
+
+def route_query(text, session_id=None):
+    return router.route(text, session_id)
+
+
+def is_manipuri(text, session_id=None):
+    return router.route(text, session_id) != ENGLISH
@@ -0,0 +1,133 @@
+# lexical_index.py
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from config import BM25_K1, BM25_B
+
+# Identifiers like "MCA491P", "3.2.1" or "AB-1234/x" are kept whole, and
+# their parts are indexed too so "1234" still matches "AB-1234"
+_TOKEN = re.compile(r"\w+(?:[.\-/:]\w+)*")
+_PART = re.compile(r"\w+")
+_IDENTIFIER = re.compile(r"^(?=.*\d)\w+(?:[.\-/:]\w+)*$|^\w+(?:[.\-/:]\w+)+$")
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def identifier_terms(query):
+    """
+    Tokens of the query that look like identifiers: part numbers, section
+    numbers, codes. These are what dense retrieval tends to miss.
+    """
+    return [t for t in _TOKEN.findall(query.lower()) if _IDENTIFIER.match(t)]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index. Postings for all terms are stored back to back in
+    two flat arrays (document ids and term frequencies), with an offsets
+    table indexed by term id.
+    """
+
+    def __init__(self, terms, offsets, doc_ids, freqs, doc_lengths):
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self._term_list = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.freqs = freqs
+        self.doc_lengths = doc_lengths
+        self.num_docs = len(doc_lengths)
+        self.avg_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+
+    @classmethod
+    def build(cls, texts):
+        postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings[t]) for t in terms], out=offsets[1:])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        freqs = np.empty(offsets[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            docs, tfs = zip(*postings[term])
+            doc_ids[offsets[i]:offsets[i + 1]] = docs
+            freqs[offsets[i]:offsets[i + 1]] = tfs
+        return cls(terms, offsets, doc_ids, freqs, doc_lengths)
+
+    def save(self, path):
+        blob = np.frombuffer("\n".join(self._term_list).encode("utf-8"), dtype=np.uint8)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, terms=blob, offsets=self.offsets, doc_ids=self.doc_ids,
+                 freqs=self.freqs, doc_lengths=self.doc_lengths)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            blob = data["terms"].tobytes().decode("utf-8")
+            terms = blob.split("\n") if blob else []
+            return cls(terms, data["offsets"], data["doc_ids"], data["freqs"], data["doc_lengths"])
+
+    def search(self, query, top_k):
+        """
+        Return (doc_ids, scores) of the best `top_k` documents by BM25.
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.freqs[start:end]
+            df = end - start
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.avg_length)
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return order, scores[order]
+
+    def contains_all(self, doc_id, terms):
+        # Whether every term has a posting for doc_id
+        for term in terms:
+            term_id = self.terms.get(term)
+            if term_id is None:
+                return False
+            docs = self.doc_ids[self.offsets[term_id]:self.offsets[term_id + 1]]
+            pos = np.searchsorted(docs, doc_id)
+            if pos >= len(docs) or docs[pos] != doc_id:
+                return False
+        return True
+
+
+def reciprocal_rank_fusion(rankings, weights, k):
+    """
+    Fuse ranked lists of ids: each list contributes weight / (k + rank).
+    Returns ids ordered by fused score.
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
@@ -18,60 +18,43 @@
 #     return response['message']['content']
 
 import ollama
-from langdetect import detect
+from lang_router import ENGLISH, MANIPURI_LATIN, route_query
+from prompt_builder import chat_options, system_message
 from translator import (
     indic_translate,
     transliterate_to_roman,
     transliterate_to_script,
-    en2mni_model,
-    en2mni_tokenizer,
-    mni2en_model,
-    mni2en_tokenizer,
 )
 
-def is_romanized_manipuri(text):
-    manipuri_clues = ['hou', 'eikhoigi', 'nattraga', 'phangjaba', 'houjik']
-    return any(clue in text.lower() for clue in manipuri_clues)
-
-def generate_answer_ollama(context_chunks, query, metadata=None, model='llama3'):
+def generate_answer_ollama(context_chunks, query, metadata=None, model='llama3', session_id=None):
     context_text = "\n".join([f"Page {chunk['page_num']}: {chunk['text']}" for chunk in context_chunks])
     metadata = metadata or {}
 
     original_query = query
-    detected_lang = 'en'
-    
-    try:
-        detected_lang = detect(query)
-    except:
-        pass
+    detected_lang = route_query(query, session_id)
 
-   
-    if is_romanized_manipuri(query) or detected_lang not in ['en']:
-       
-        mm_text = transliterate_to_script(query)
-        query = indic_translate(mm_text, source_lang='mni', target_lang='eng', model=mni2en_model, tokenizer=mni2en_tokenizer)
-        detected_lang = 'mni'
+    if detected_lang != ENGLISH:
+        # Only romanized input needs converting to Meetei Mayek first
+        mm_text = transliterate_to_script(query) if detected_lang == MANIPURI_LATIN else query
+        query = indic_translate(mm_text, source_lang='mni', target_lang='eng')
 
-   
-    prompt = (
-        f"You are a helpful assistant answering questions based on the uploaded PDF.\n\n"
-        f"Metadata:\nTitle: {metadata.get('title', 'N/A')}\nAuthor: {metadata.get('author', 'N/A')}\nSubject: {metadata.get('subject', 'N/A')}\n\n"
-        f"Context:\n{context_text}\n\n"
-        f"Question: {query}\nAnswer:"
-    )
+    # Stable instructions and metadata first, per-question context last
+    messages = [
+        system_message(metadata),
+        {"role": "user", "content": f"Context:\n{context_text}\n\nQuestion: {query}\nAnswer:"},
+    ]
 
     try:
-        response = ollama.chat(
-            model=model,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        response = ollama.chat(model=model, messages=messages, **chat_options(model))
         answer = response['message']['content']
     except Exception as e:
         answer = f"Error generating answer: {str(e)}"
 
     
-    if detected_lang == 'mni':
-        mm_back = indic_translate(answer, source_lang='eng', target_lang='mni', model=en2mni_model, tokenizer=en2mni_tokenizer)
-        answer = transliterate_to_roman(mm_back)
+    if detected_lang != ENGLISH:
+        # Answer in the script the question was asked in
+        answer = indic_translate(answer, source_lang='eng', target_lang='mni')
+        if detected_lang == MANIPURI_LATIN:
+            answer = transliterate_to_roman(answer)
 
     return answer
@@ -0,0 +1,278 @@
+# metrics.py
+"""
+In-process counters, histograms and per-request stage timings, rendered in
+the Prometheus text exposition format by render(). Values are per process.
+"""
+import contextvars
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_text(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, labelnames=()):
+        metric = Gauge(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.histogram(
+    "pdfqa_request_seconds", "Request latency by endpoint and status.", ("endpoint", "status")
+)
+stage_seconds = registry.histogram(
+    "pdfqa_stage_seconds", "Time spent in each pipeline stage.", ("stage",)
+)
+llm_first_token_seconds = registry.histogram(
+    "pdfqa_llm_first_token_seconds", "Time from request start to the first streamed token."
+)
+chunks_indexed = registry.counter("pdfqa_chunks_indexed_total", "Chunks embedded and indexed.")
+chunks_retrieved = registry.counter("pdfqa_chunks_retrieved_total", "Chunks placed in answer prompts.")
+llm_tokens = registry.counter("pdfqa_llm_tokens_total", "Tokens processed by the model.", ("kind",))
+llm_prefill_seconds = registry.histogram(
+    "pdfqa_llm_prefill_seconds", "Prompt evaluation (prefill) time reported by the model.", ("model",)
+)
+llm_prefill_saved_seconds = registry.counter(
+    "pdfqa_llm_prefill_saved_seconds_total",
+    "Prefill time saved by the model's prompt cache: cold prefill rate times prompt tokens, minus measured prefill.",
+    ("model",),
+)
+llm_cold_prefill_rate = registry.gauge(
+    "pdfqa_llm_cold_prefill_seconds_per_token", "Measured prefill time per prompt token with nothing cached.", ("model",)
+)
+cache_lookups = registry.counter("pdfqa_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+cache_stats = registry.gauge("pdfqa_cache", "Cache statistics, refreshed on every scrape.", ("cache", "stat"))
+ingest_jobs = registry.gauge("pdfqa_ingest_jobs", "Ingestion jobs by status.", ("status",))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render():
+    return registry.render()
+
+
+class Trace:
+    """
+    Stage timings of one request, in milliseconds; a stage entered several
+    times accumulates.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def breakdown(self):
+        with self._lock:
+            stages = dict(self.stages)
+        return {"stages_ms": stages, "elapsed_ms": (time.perf_counter() - self.started) * 1000}
+
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace():
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a block as `stage`: always into pdfqa_stage_seconds, and into the
+    current request's Trace when there is one.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, elapsed)
+
+
+class PrefillMeter:
+    """
+    Prefill time saved by Ollama's prompt cache, from measured durations.
+
+    The server counts the whole prompt in prompt_eval_count but only spends
+    prompt_eval_duration on the part after the prefix it had cached. A
+    request whose system message this process has not sent to the model
+    among its last `slots` distinct ones had nothing of ours cached, so its
+    seconds per prompt token is a cold sample; the model's cold rate is a
+    moving average of those. Any other request saved the cold rate times
+    its prompt tokens minus its measured prefill (never less than zero).
+    """
+
+    def __init__(self, slots=4, smoothing=0.2):
+        self.slots = slots
+        self.smoothing = smoothing
+        self._recent = {}
+        self._cold_rate = {}
+        self._lock = threading.Lock()
+
+    def cold_rate(self, model):
+        with self._lock:
+            return self._cold_rate.get(model)
+
+    def observe(self, model, messages, prompt_tokens, seconds):
+        """
+        Record one response; returns the prefill seconds it saved.
+        """
+        first = messages[0]["content"] if messages else ""
+        key = hashlib.sha256(first.encode("utf-8")).digest()
+        with self._lock:
+            recent = self._recent.setdefault(model, OrderedDict())
+            warm = key in recent
+            recent[key] = None
+            recent.move_to_end(key)
+            while len(recent) > self.slots:
+                recent.popitem(last=False)
+            rate = self._cold_rate.get(model)
+            if not warm:
+                sample = seconds / prompt_tokens
+                rate = sample if rate is None else rate + self.smoothing * (sample - rate)
+                self._cold_rate[model] = rate
+                return 0.0
+        if rate is None:
+            return 0.0
+        return max(0.0, rate * prompt_tokens - seconds)
+
+
+prefill_meter = PrefillMeter()
+
+
+def record_llm_response(response, messages=None, trace=None):
+    """
+    Token counts and prefill time from Ollama's final (or only) response
+    message, as measured by the server, plus the prefill time its prompt
+    cache saved (see PrefillMeter) when the request's `messages` are given.
+    """
+    prompt_tokens = response.get('prompt_eval_count')
+    if prompt_tokens:
+        llm_tokens.inc(prompt_tokens, kind="prompt")
+    if response.get('eval_count'):
+        llm_tokens.inc(response['eval_count'], kind="completion")
+
+    duration = response.get('prompt_eval_duration')
+    if not duration:
+        return
+    model = response.get('model') or ""
+    seconds = duration / 1e9
+    llm_prefill_seconds.observe(seconds, model=model)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add("llm_prefill", seconds)
+    if messages is not None and prompt_tokens:
+        saved = prefill_meter.observe(model, messages, prompt_tokens, seconds)
+        llm_prefill_saved_seconds.inc(saved, model=model)
+        llm_cold_prefill_rate.set(prefill_meter.cold_rate(model), model=model)
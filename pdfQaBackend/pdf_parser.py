@@ -1,5 +1,13 @@
 
-import fitz  
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+
+import fitz
+
+from config import PARSE_WORKERS, PARSE_PAGES_PER_TASK, PARSE_MIN_PAGES_FOR_POOL
+from chunker import page_blocks, chunk_blocks
 
 # def extract_metadata(doc):
 #     meta = doc.metadata
@@ -38,25 +46,126 @@ def fallback_title_from_page(doc):
     return "Unknown Title"
 
 
-def parse_pdf(file_path):
+def _parse_page_range(file_path, start, end):
+    # Runs in a worker process, which needs its own fitz document
     doc = fitz.open(file_path)
-    chunks = []
-    fallback_title = fallback_title_from_page(doc)
-
-    for page_num, page in enumerate(doc):
-        blocks = page.get_text("dict")['blocks']
-        for block in blocks:
-            if block['type'] == 0:
-                for line in block['lines']:
-                    text = ' '.join([span['text'].strip() for span in line['spans']])
-                    if len(text) > 30:
-                        chunks.append({
-                            "text": text,
-                            "page_num": page_num + 1
-                        })
+    try:
+        blocks = []
+        for page_num in range(start, end):
+            blocks.extend(page_blocks(doc[page_num], page_num))
+        return blocks
+    finally:
+        doc.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("fork"))
+        return _pool
+
+
+def start_pool():
+    """
+    Fork the parse workers now rather than on the first large upload. Call
+    it before the process starts any threads: a child forked while another
+    thread holds a lock can deadlock on it. (forkserver and spawn avoid that
+    but re-import the main module in every worker, and app.py starts the
+    ingest workers at import.) A fork-context pool launches all its workers
+    on the first submit and keeps them.
+    """
+    if PARSE_WORKERS > 1:
+        _get_pool().submit(int).result()
+
+
+def open_document(file_path, data=None):
+    """
+    Open a PDF from its bytes when they are already in memory, else from its path.
+    """
+    if data is not None:
+        return fitz.open(stream=data, filetype="pdf")
+    return fitz.open(file_path)
+
 
+def iter_pdf_blocks(file_path, page_count, workers=PARSE_WORKERS, pages_per_task=PARSE_PAGES_PER_TASK, doc=None):
+    """
+    Yield text blocks (see chunker.page_blocks) in page order. Large documents are split into page ranges
+    that are parsed in a process pool; at most two ranges per worker are in
+    flight so memory stays bounded while the consumer keeps up. Small
+    documents are parsed in this process, from `doc` when it is already open.
+    """
+    if workers <= 1 or page_count < PARSE_MIN_PAGES_FOR_POOL:
+        if doc is None:
+            yield from _parse_page_range(file_path, 0, page_count)
+            return
+        for page_num in range(page_count):
+            yield from page_blocks(doc[page_num], page_num)
+        return
+
+    pool = _get_pool()
+    ranges = iter(range(0, page_count, pages_per_task))
+    pending = deque()
+    try:
+        for start in ranges:
+            pending.append(pool.submit(_parse_page_range, file_path, start, min(start + pages_per_task, page_count)))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            blocks = pending.popleft().result()
+            start = next(ranges, None)
+            if start is not None:
+                pending.append(pool.submit(_parse_page_range, file_path, start, min(start + pages_per_task, page_count)))
+            yield from blocks
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def document_info(doc):
     metadata = extract_metadata(doc)
     if metadata.get("title") in ["", None, "Unknown"]:
-        metadata["title"] = fallback_title
-    return chunks, metadata
+        metadata["title"] = fallback_title_from_page(doc)
+    metadata["page_count"] = doc.page_count
+    return metadata
+
+
+def read_document_info(file_path):
+    with fitz.open(file_path) as doc:
+        return document_info(doc), doc.page_count
+
 
+def parse_pdf_stream(file_path, data=None, metadata_fn=document_info):
+    """
+    Streaming variant of parse_pdf: metadata is read up front from the first
+    page, and chunks are yielded as page ranges finish parsing so embedding
+    can start before the whole document is parsed.
+
+    The document is opened once, from `data` if the bytes are at hand; that
+    one handle serves `metadata_fn(doc)` and the page text of documents too
+    small for the process pool, and is closed once the chunks run out.
+    """
+    doc = open_document(file_path, data)
+    try:
+        metadata = metadata_fn(doc)
+        page_count = doc.page_count
+    except BaseException:
+        doc.close()
+        raise
+    return _closing(chunk_blocks(iter_pdf_blocks(file_path, page_count, doc=doc)), doc), metadata
+
+
+def _closing(chunks, doc):
+    try:
+        yield from chunks
+    finally:
+        doc.close()
+
+
+def parse_pdf(file_path):
+    chunks, metadata = parse_pdf_stream(file_path)
+    return list(chunks), metadata
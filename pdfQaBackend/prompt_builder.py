@@ -0,0 +1,55 @@
+# prompt_builder.py
+"""
+Chat prompts laid out for Ollama's prompt cache. The server keeps the KV
+cache of recent requests and only evaluates the part of a new prompt after
+the longest prefix it has already seen, so the parts that change least come
+first:
+
+1. system message: instructions, document metadata and the pinned document
+   summary (identical for every question about a document)
+2. conversation history, trimmed in whole blocks (see trim_history)
+3. the new user message: retrieved context, then the question
+"""
+from config import HISTORY_TOKEN_BUDGET, HISTORY_TRIM_BLOCK, LLM_DEFAULT_NUM_CTX, LLM_KEEP_ALIVE, LLM_NUM_CTX
+from session_store import estimate_tokens, trim_history
+
+SYSTEM_PROMPT = "You are an expert PDF question answering assistant."
+_METADATA_FIELDS = (("title", "Title"), ("author", "Author"), ("subject", "Subject"), ("page_count", "Pages"))
+
+
+def system_message(metadata=None, summary=None):
+    """
+    System message for questions about one document; only fields that are
+    actually known are included, so it stays the same across questions.
+    """
+    parts = [SYSTEM_PROMPT]
+    metadata = metadata or {}
+    known = [
+        f"{label}: {metadata[field]}" for field, label in _METADATA_FIELDS
+        if metadata.get(field) not in (None, "", "Unknown")
+    ]
+    if known:
+        parts.append("Document:\n" + "\n".join(known))
+    if summary:
+        parts.append(f"Document summary:\n{summary}")
+    return {"role": "system", "content": "\n\n".join(parts)}
+
+
+def build_prompt(context, question, chat_history, metadata=None, summary=None):
+    system = system_message(metadata, summary)
+    user_message = {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
+    # History gets whatever is left of the budget after the current turn
+    budget = HISTORY_TOKEN_BUDGET - estimate_tokens(user_message["content"])
+    return trim_history([system] + chat_history, budget, block=HISTORY_TRIM_BLOCK) + [user_message]
+
+
+def chat_options(model):
+    """
+    Keyword arguments for ollama chat calls to `model`: keep it loaded and
+    always ask for the same context size, since a different num_ctx makes
+    the server reload the model and drop its prompt cache.
+    """
+    return {
+        "keep_alive": LLM_KEEP_ALIVE,
+        "options": {"num_ctx": LLM_NUM_CTX.get(model, LLM_DEFAULT_NUM_CTX)},
+    }
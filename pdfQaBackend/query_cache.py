@@ -0,0 +1,160 @@
+# query_cache.py
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_PER_DOCUMENT, QUERY_CACHE_TTL, QUERY_CACHE_SIMILARITY
+from lexical_index import identifier_terms
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)*")
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", query.lower())).strip()
+
+
+def options_key(options):
+    # Retrieval settings (see app.retrieval_options) as part of the cache key
+    return tuple(sorted((options or {}).items()))
+
+
+def query_anchors(query):
+    # Identifiers and numbers the question is about; embeddings barely tell
+    # "page 3" from "page 4", so semantic hits must agree on these exactly
+    return frozenset(identifier_terms(query)), tuple(sorted(_NUMBER.findall(query)))
+
+
+class QueryCache:
+    """
+    Answer cache for questions against a document. Level one matches the
+    normalized question text exactly; level two compares the question's
+    embedding with earlier questions on the same document and reuses the
+    answer when cosine similarity is at least `threshold` and both questions
+    mention the same identifiers and numbers. Both levels only match
+    questions asked with the same retrieval `options`. Entries are not
+    tied to a conversation, so callers only use the cache for questions that
+    have no session history.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES, max_per_document=QUERY_CACHE_MAX_PER_DOCUMENT,
+                 ttl=QUERY_CACHE_TTL, threshold=QUERY_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.max_per_document = max_per_document
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._by_document = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def lookup(self, doc_id, query, embed, options=None):
+        """
+        Return (entry, level, query_vec); level is "exact", "semantic" or None.
+        `embed(text)` is only called when the semantic level is actually
+        consulted: after an exact miss, and only if the document has earlier
+        questions about the same identifiers and numbers. query_vec is None
+        when the question was not embedded, leaving retrieval free to skip
+        the embedding model too.
+        """
+        key = (doc_id, options_key(options), normalize_query(query))
+        now = time.time()
+        anchors = query_anchors(query)
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self.exact_hits += 1
+                return entry, "exact", None
+            keys = [
+                k for k in list(self._by_document.get(doc_id, ()))
+                if k[1] == key[1] and self._live(k, now) is not None and self._entries[k]["anchors"] == anchors
+            ]
+            if not keys:
+                self.misses += 1
+                return None, None, None
+            # Entries stored without a vector are embedded the first time
+            # they are compared against
+            unembedded = [(k, self._entries[k]["query"]) for k in keys if self._entries[k]["unit"] is None]
+
+        query_vec = embed(query)
+        unit = _unit(query_vec)
+        units = {k: _unit(embed(text)) for k, text in unembedded}
+        with self._lock:
+            for k, entry_unit in units.items():
+                if k in self._entries:
+                    self._entries[k]["unit"] = entry_unit
+            keys = [k for k in keys if k in self._entries]
+            if keys:
+                matrix = np.stack([self._entries[k]["unit"] for k in keys])
+                scores = matrix @ unit
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return self._entries[keys[best]], "semantic", query_vec
+            self.misses += 1
+        return None, None, query_vec
+
+    def put(self, doc_id, query, query_vec, answer, chunks, options=None):
+        # query_vec may be None when the question was never embedded
+        key = (doc_id, options_key(options), normalize_query(query))
+        entry = {
+            "answer": answer,
+            "chunks": chunks,
+            "query": query,
+            "unit": _unit(query_vec) if query_vec is not None else None,
+            "anchors": query_anchors(query),
+            "created": time.time(),
+        }
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            doc_keys = self._by_document.setdefault(doc_id, OrderedDict())
+            doc_keys[key] = None
+            while len(doc_keys) > self.max_per_document:
+                self._remove(next(iter(doc_keys)))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry["created"] > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        doc_keys = self._by_document.get(key[0])
+        if doc_keys is not None:
+            doc_keys.pop(key, None)
+            if not doc_keys:
+                del self._by_document[key[0]]
+
+
+def _unit(vec):
+    vec = np.asarray(vec, dtype='float32').reshape(-1)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+query_cache = QueryCache()
@@ -1,39 +1,147 @@
 
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 import os
 import json
+from index_cache import index_cache
+from metrics import span
+from config import EMBED_STREAM_WINDOW, CHUNK_SIZE, HYBRID_CANDIDATES, RRF_K
+from lexical_index import LexicalIndex, identifier_terms, reciprocal_rank_fusion
+from chunker import chunk_text
+from embedding_service import embedding_service
+from index_factory import build_index, search
+from chunk_store import ChunkStore, write_chunk_store
 
-embedding_model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def build_faiss_index(chunks, session_id):
-    texts = [chunk['text'] for chunk in chunks]
-    embeddings = embedding_model.encode(texts, convert_to_numpy=True)
 
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
+def build_faiss_index(chunks, session_id, window=EMBED_STREAM_WINDOW, on_progress=None):
+    """
+    Embed and index `chunks`, which may be any iterable (e.g. the generator from
+    pdf_parser.parse_pdf_stream); windows of chunks are encoded as they arrive,
+    and `on_progress(n)` is told how many are embedded after each window.
+    Returns the chunks as a list.
+    """
+    all_chunks = []
+    parts = []
+    for batch in _batched(chunks, window):
+        with span("embed"):
+            parts.append(embedding_service.encode_cached([chunk['text'] for chunk in batch]))
+        all_chunks.extend(batch)
+        if on_progress is not None:
+            on_progress(len(all_chunks))
+    chunks = all_chunks
 
-    os.makedirs("indexes", exist_ok=True)
-    faiss.write_index(index, f"indexes/{session_id}.index")
+    if parts:
+        embeddings = np.vstack(parts)
+    else:
+        embeddings = np.zeros((0, embedding_service.dimension), dtype='float32')
 
-    with open(f"indexes/{session_id}_meta.json", 'w') as f:
-        json.dump(chunks, f)
-        
-def chunk_pdf_text(text, chunk_size=500):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size):
-        chunk = ' '.join(words[i:i + chunk_size])
-        chunks.append({"text": chunk})
+    with span("index_build"):
+        index = build_index(embeddings)
+
+        os.makedirs("indexes", exist_ok=True)
+        faiss.write_index(index, f"indexes/{session_id}.index")
+
+        write_chunk_store(f"indexes/{session_id}.chunks", chunks)
+        LexicalIndex.build([chunk['text'] for chunk in chunks]).save(f"indexes/{session_id}.bm25.npz")
+    index_cache.invalidate(session_id)
+    index_cache.invalidate(f"{session_id}:bm25")
     return chunks
 
 
-def retrieve_chunks(query, session_id, top_k=5):
-    index = faiss.read_index(f"indexes/{session_id}.index")
-    with open(f"indexes/{session_id}_meta.json", 'r') as f:
-        metadata = json.load(f)
+def chunk_pdf_text(text, chunk_size=CHUNK_SIZE):
+    return list(chunk_text(text, chunk_size))
+
+
+def load_chunks(session_id):
+    return load_index(session_id)[1]
+
+
+def load_index(session_id):
+    index_path = f"indexes/{session_id}.index"
+    store_path = f"indexes/{session_id}.chunks"
+
+    if os.path.exists(store_path):
+        def loader():
+            return faiss.read_index(index_path), ChunkStore(store_path)
+        # The chunk store is memory-mapped, so only the index counts against the cache budget
+        return index_cache.get(session_id, (index_path, store_path), loader, charged_paths=(index_path,))
+
+    # Indexes built before the chunk store existed keep their JSON metadata
+    meta_path = f"indexes/{session_id}_meta.json"
+
+    def legacy_loader():
+        index = faiss.read_index(index_path)
+        with open(meta_path, 'r') as f:
+            return index, json.load(f)
+
+    return index_cache.get(session_id, (index_path, meta_path), legacy_loader)
+
+
+def load_lexical_index(session_id):
+    path = f"indexes/{session_id}.bm25.npz"
+    if not os.path.exists(path):
+        return None
+    return index_cache.get(f"{session_id}:bm25", (path,), lambda: LexicalIndex.load(path))
+
+
+def retrieve_chunks(query, session_id, top_k=5, nprobe=None, ef_search=None, query_vec=None,
+                    mode="hybrid", dense_weight=1.0, lexical_weight=1.0):
+    """
+    Retrieve the best `top_k` chunks. In "hybrid" mode dense and BM25
+    candidates are fused with reciprocal-rank fusion using the given
+    weights; a query whose identifiers (part or section numbers) all appear
+    in the top lexical hit is answered lexically without encoding it.
+    "dense" and "lexical" use a single retriever.
+    """
+    ids, metadata = retrieve_chunk_ids(
+        query, session_id, top_k, nprobe=nprobe, ef_search=ef_search, query_vec=query_vec,
+        mode=mode, dense_weight=dense_weight, lexical_weight=lexical_weight,
+    )
+    return [metadata[i] for i in ids]
+
+
+def retrieve_chunk_ids(query, session_id, top_k=5, nprobe=None, ef_search=None, query_vec=None,
+                       mode="hybrid", dense_weight=1.0, lexical_weight=1.0):
+    """
+    Like retrieve_chunks, but returns (ids, chunks): the ranked chunk
+    positions and the document's full chunk sequence, so callers can look
+    at neighbouring chunks.
+    """
+    index, metadata = load_index(session_id)
+    lexical = load_lexical_index(session_id) if mode != "dense" else None
+    if lexical is None:
+        mode = "dense"
+
+    candidates = top_k * HYBRID_CANDIDATES
+    lexical_ids = []
+    if mode != "dense":
+        with span("lexical_search"):
+            lexical_ids, _ = lexical.search(query, candidates)
+        lexical_ids = lexical_ids.tolist()
+        identifiers = identifier_terms(query)
+        if mode == "lexical" or (
+            identifiers and lexical_ids and lexical.contains_all(lexical_ids[0], identifiers)
+        ):
+            return lexical_ids[:top_k], metadata
+
+    if query_vec is None:
+        with span("embed_query"):
+            query_vec = embedding_service.encode_query(query)
+    with span("dense_search"):
+        _, I = search(index, query_vec, candidates if mode == "hybrid" else top_k, nprobe=nprobe, ef_search=ef_search)
+    dense_ids = [int(i) for i in I[0] if i >= 0]
+    if mode == "dense":
+        return dense_ids[:top_k], metadata
 
-    query_vec = embedding_model.encode([query], convert_to_numpy=True)
-    _, I = index.search(query_vec, top_k)
-    return [metadata[i] for i in I[0]]
+    fused = reciprocal_rank_fusion([dense_ids, lexical_ids], [dense_weight, lexical_weight], RRF_K)
+    return fused[:top_k], metadata
@@ -0,0 +1,132 @@
+# reranker.py
+import re
+import threading
+
+from config import (
+    CONTEXT_CANDIDATES, CONTEXT_DEDUPE_OVERLAP, CONTEXT_EXPAND_NEIGHBORS, CONTEXT_TOKEN_BUDGET,
+    RERANK_ENABLED, RERANK_MODEL,
+)
+from metrics import span
+from rag_engine import retrieve_chunk_ids
+from session_store import estimate_tokens
+
+_WORD = re.compile(r"\w+")
+
+
+class CrossEncoderReranker:
+    """
+    sentence-transformers CrossEncoder loaded on first use. If it cannot be
+    loaded, scores() returns None and callers keep the retrieval order.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL):
+        self.model_name = model_name
+        self.available = True
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None and self.available:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, max_length=256, device='cpu')
+                except Exception as e:
+                    print("Reranker unavailable:", e)
+                    self.available = False
+            return self._model
+
+    def scores(self, query, texts):
+        model = self._load()
+        if model is None:
+            return None
+        return [float(s) for s in model.predict([(query, text) for text in texts], batch_size=32)]
+
+
+reranker = CrossEncoderReranker()
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def dedupe(candidates, threshold=CONTEXT_DEDUPE_OVERLAP):
+    """
+    Drop (id, chunk) candidates whose words are mostly (`threshold` of the
+    smaller set) shared with a higher-ranked candidate, and empty ones.
+    """
+    kept = []
+    kept_words = []
+    for chunk_id, chunk in candidates:
+        words = _words(chunk['text'])
+        if not words:
+            continue
+        if any(len(words & other) >= threshold * min(len(words), len(other)) for other in kept_words):
+            continue
+        kept.append((chunk_id, chunk))
+        kept_words.append(words)
+    return kept
+
+
+def pack(candidates, chunks, top_k, token_budget, expand=CONTEXT_EXPAND_NEIGHBORS, exclude=()):
+    """
+    Take up to `top_k` candidates in rank order that fit in `token_budget`
+    (a long chunk is skipped so a shorter, lower-ranked one can still fit),
+    then spend the remaining budget on the chunks next to them, nearest and
+    best-ranked first, staying within each chunk's section and skipping ids
+    in `exclude`. Returns chunks in document order.
+    """
+    chosen = {}
+    used = 0
+    for chunk_id, chunk in candidates:
+        if len(chosen) >= top_k:
+            break
+        cost = estimate_tokens(chunk['text'])
+        if used + cost > token_budget:
+            continue
+        chosen[chunk_id] = chunk
+        used += cost
+    if not chosen and candidates:
+        # Even the best chunk is over budget on its own; send a truncated copy
+        chunk_id, chunk = candidates[0]
+        chosen[chunk_id] = dict(chunk, text=chunk['text'][:token_budget * 4])
+        used = token_budget
+
+    primary = list(chosen)
+    for distance in range(1, expand + 1):
+        for chunk_id in primary:
+            for neighbour_id in (chunk_id - distance, chunk_id + distance):
+                if neighbour_id in chosen or neighbour_id in exclude or not 0 <= neighbour_id < len(chunks):
+                    continue
+                neighbour = chunks[neighbour_id]
+                if neighbour.get('section') != chunks[chunk_id].get('section'):
+                    continue
+                cost = estimate_tokens(neighbour['text'])
+                if used + cost <= token_budget:
+                    chosen[neighbour_id] = neighbour
+                    used += cost
+    return [chosen[chunk_id] for chunk_id in sorted(chosen)]
+
+
+def select_context(query, doc_id, top_k=5, query_vec=None, token_budget=CONTEXT_TOKEN_BUDGET,
+                   rerank=None, expand=CONTEXT_EXPAND_NEIGHBORS, **retrieval):
+    """
+    Context chunks for a question about one document. Over-fetches
+    top_k * CONTEXT_CANDIDATES candidates with retrieve_chunk_ids (which
+    takes the remaining keyword arguments), drops near-duplicates,
+    reranks with the cross-encoder when `rerank` (default RERANK_ENABLED)
+    is set, and packs the result with pack().
+    """
+    ids, chunks = retrieve_chunk_ids(query, doc_id, top_k * CONTEXT_CANDIDATES, query_vec=query_vec, **retrieval)
+    candidates = dedupe([(chunk_id, chunks[chunk_id]) for chunk_id in ids])
+
+    if (RERANK_ENABLED if rerank is None else rerank) and len(candidates) > 1:
+        with span("rerank"):
+            scores = reranker.scores(query, [chunk['text'] for _, chunk in candidates])
+        if scores is not None:
+            order = sorted(range(len(candidates)), key=scores.__getitem__, reverse=True)
+            candidates = [candidates[j] for j in order]
+
+    # Near-duplicates that were dropped shouldn't come back as neighbours
+    dropped = set(ids) - {chunk_id for chunk_id, _ in candidates}
+    return pack(candidates, chunks, top_k, token_budget, expand, exclude=dropped)
@@ -0,0 +1,246 @@
+# summarizer.py
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import ollama
+
+from chunker import count_tokens
+from config import SUMMARY_CONCURRENCY, SUMMARY_FOLDER, SUMMARY_GROUP_TOKENS, SUMMARY_MIN_TOKENS, SUMMARY_MODEL
+from prompt_builder import chat_options
+from rag_engine import load_chunks
+
+MAP_PROMPT = (
+    "Summarize the following excerpt from {context}. Keep the key facts, figures, names and "
+    "conclusions; do not add anything that is not in the text.\n\n{text}\n\nSummary:"
+)
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive parts of {context}. Combine them into one "
+    "coherent summary that keeps the key facts and follows the order of the original.\n\n{text}\n\nSummary:"
+)
+
+# Every summarization call in the process goes through this pool, so the
+# number of concurrent requests to Ollama stays bounded across requests
+_pool = ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY, thread_name_prefix="summary")
+_inflight = {}
+_inflight_lock = threading.Lock()
+# Cache key of the latest whole-document summary, pinned into QA prompts
+PINNED_KEY = "document"
+
+
+class SummaryCache:
+    """
+    Partial summaries per document, keyed by a hash of the prompt that
+    produced them and appended to summaries/{document_id}.jsonl. Document ids
+    are content hashes, so entries stay valid for as long as the file exists.
+    """
+
+    def __init__(self, folder=SUMMARY_FOLDER):
+        self.folder = folder
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def _path(self, doc_id):
+        return os.path.join(self.folder, f"{doc_id}.jsonl")
+
+    def _entries(self, doc_id):
+        entries = self._documents.get(doc_id)
+        if entries is None:
+            entries = {}
+            try:
+                with open(self._path(doc_id), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue  # torn final line from an interrupted write
+                        entries[record["key"]] = record["summary"]
+            except FileNotFoundError:
+                pass
+            self._documents[doc_id] = entries
+        return entries
+
+    def get(self, doc_id, key):
+        with self._lock:
+            return self._entries(doc_id).get(key)
+
+    def put(self, doc_id, key, summary):
+        with self._lock:
+            self._entries(doc_id)[key] = summary
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self._path(doc_id), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"key": key, "summary": summary}) + "\n")
+
+
+summary_cache = SummaryCache()
+
+
+def _summarize(doc_id, prompt):
+    """
+    Future for the summary produced by `prompt`, served from the cache or
+    shared with an identical call that is already running.
+    """
+    key = hashlib.sha256(f"{SUMMARY_MODEL}\0{prompt}".encode('utf-8')).hexdigest()
+    cached = summary_cache.get(doc_id, key)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _inflight[key] = _pool.submit(_call_model, doc_id, key, prompt)
+            future.add_done_callback(lambda _: _inflight.pop(key, None))
+        return future
+
+
+def _call_model(doc_id, key, prompt):
+    response = ollama.chat(model=SUMMARY_MODEL, messages=[
+        {"role": "system", "content": "You are a helpful assistant that summarizes PDF content."},
+        {"role": "user", "content": prompt}
+    ], **chat_options(SUMMARY_MODEL))
+    summary = response['message']['content'].strip()
+    summary_cache.put(doc_id, key, summary)
+    return summary
+
+
+def _pack(texts, limit, min_items=1):
+    # Consecutive texts grouped up to `limit` tokens; a group closes only once
+    # it holds `min_items`, so an oversized text never sits alone forever
+    groups, current, size = [], [], 0
+    for text in texts:
+        n = count_tokens(text)
+        if current and size + n > limit and len(current) >= min_items:
+            groups.append(current)
+            current, size = [], 0
+        current.append(text)
+        size += n
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _reduce_all(doc_id, jobs):
+    """
+    Reduce several lists of partial summaries at once, level by level, so the
+    calls of every list share the pool. `jobs` is a list of (texts, context);
+    returns one summary per job.
+    """
+    levels = [list(texts) for texts, _ in jobs]
+    while any(len(texts) > 1 for texts in levels):
+        pending = []
+        for texts, (_, context) in zip(levels, jobs):
+            if len(texts) <= 1:
+                pending.append(None)
+                continue
+            pending.append([
+                _summarize(doc_id, REDUCE_PROMPT.format(context=context, text="\n\n".join(group)))
+                if len(group) > 1 else _done(group[0])
+                for group in _pack(texts, SUMMARY_GROUP_TOKENS, min_items=2)
+            ])
+        levels = [
+            texts if futures is None else [f.result() for f in futures]
+            for texts, futures in zip(levels, pending)
+        ]
+    return [texts[0] if texts else "" for texts in levels]
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _sections(chunks):
+    # Runs of consecutive chunks under the same heading
+    sections = []
+    for chunk in chunks:
+        name = chunk.get('section')
+        first = chunk.get('page_start', chunk.get('page_num'))
+        last = chunk.get('page_end', first)
+        if not sections or sections[-1]['section'] != name:
+            sections.append({"section": name, "page_start": first, "page_end": last, "texts": []})
+        section = sections[-1]
+        section['texts'].append(chunk['text'])
+        if last is not None:
+            section['page_end'] = last if section['page_end'] is None else max(section['page_end'], last)
+    return sections
+
+
+def _context(section, document):
+    # Where a section sits, for the prompt: "pages 3-5 of 'Title', section 'Methods'"
+    if section['page_start'] is None:
+        context = document
+    elif section['page_start'] == section['page_end']:
+        context = f"page {section['page_start']} of {document}"
+    else:
+        context = f"pages {section['page_start']}-{section['page_end']} of {document}"
+    if section['section']:
+        context += f", section '{section['section']}'"
+    return context
+
+
+def summarize_document(doc_id, metadata=None, section=None, page_from=None, page_to=None):
+    """
+    Map-reduce summary of an indexed document, or of the sections whose
+    heading contains `section` and/or that overlap pages page_from..page_to.
+
+    Chunk groups are summarized in parallel, each section's partial summaries
+    are reduced into a section summary, and the section summaries are reduced
+    into the overall one. Every partial summary is cached per document, so
+    repeated and narrower requests reuse earlier work.
+
+    Returns {"summary": ..., "sections": [{section, page_start, page_end, summary}]};
+    the summary is empty when nothing matches.
+    """
+    metadata = metadata or {}
+    sections = _sections(load_chunks(doc_id))
+    if section:
+        sections = [s for s in sections if s['section'] and section.lower() in s['section'].lower()]
+    if page_from is not None:
+        sections = [s for s in sections if s['page_end'] is None or s['page_end'] >= page_from]
+    if page_to is not None:
+        sections = [s for s in sections if s['page_start'] is None or s['page_start'] <= page_to]
+
+    title = metadata.get('title')
+    document = f"'{title}'" if title and title != "Unknown" else "the document"
+
+    # Map: every token-bounded group of every section goes to the pool at once;
+    # sections too short to be worth a model call are used as they are
+    mapped = []
+    for s in sections:
+        context = _context(s, document)
+        text = "\n\n".join(s['texts'])
+        if count_tokens(text) < SUMMARY_MIN_TOKENS:
+            mapped.append(([_done(text)], context))
+            continue
+        mapped.append(([
+            _summarize(doc_id, MAP_PROMPT.format(context=context, text="\n\n".join(group)))
+            for group in _pack(s['texts'], SUMMARY_GROUP_TOKENS)
+        ], context))
+
+    section_summaries = _reduce_all(doc_id, [
+        ([f.result() for f in futures], context) for futures, context in mapped
+    ])
+    summary = _reduce_all(doc_id, [(section_summaries, document)])[0]
+    if not (section or page_from is not None or page_to is not None) and summary != pinned_summary(doc_id):
+        summary_cache.put(doc_id, PINNED_KEY, summary)
+
+    return {
+        "summary": summary,
+        "sections": [
+            {"section": s['section'], "page_start": s['page_start'], "page_end": s['page_end'], "summary": text}
+            for s, text in zip(sections, section_summaries)
+        ],
+    }
+
+
+def pinned_summary(doc_id):
+    """
+    Whole-document summary from the last full summarize_document() call, or
+    None; never triggers any model calls.
+    """
+    return summary_cache.get(doc_id, PINNED_KEY)
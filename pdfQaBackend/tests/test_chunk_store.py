@@ -0,0 +1,36 @@
+import pytest
+
+from chunk_store import ChunkStore, write_chunk_store
+
+CHUNKS = [
+    {"text": "Introduction", "page_num": 1, "font_size": 18.5, "bbox": [0.0, 0.0, 10.5, 2.0], "heading": True},
+    {"text": "ꯃꯤꯇꯩ ꯂꯣꯟ and mixed text", "page_num": 2, "font_size": 11.0, "bbox": [1.0, 2.0, 3.0, 4.0]},
+    {"text": "", "page_num": 3, "section": {"title": "Results", "level": 2}},
+]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "doc.chunks")
+    write_chunk_store(path, CHUNKS)
+    store = ChunkStore(path)
+
+    assert len(store) == 3
+    assert list(store) == CHUNKS
+    assert store[-1] == CHUNKS[-1]
+    assert store[1:] == CHUNKS[1:]
+    assert store.get([2, 0]) == [CHUNKS[2], CHUNKS[0]]
+    with pytest.raises(IndexError):
+        store[3]
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / "empty.chunks")
+    write_chunk_store(path, [])
+    assert list(ChunkStore(path)) == []
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.chunks"
+    path.write_bytes(b"not a chunk store")
+    with pytest.raises(ValueError):
+        ChunkStore(str(path))
@@ -0,0 +1,75 @@
+import os
+import threading
+import uuid
+
+import document_store
+from document_store import build_document, document_id_for, get_document, get_or_create_document, store_pdf
+
+
+def fake_pdf():
+    # Content-addressed store: every test gets bytes of its own
+    return f"%PDF-1.4 {uuid.uuid4()}".encode()
+
+
+def fake_build(chunks=3, calls=None):
+    def build(pdf_path, data=None):
+        if calls is not None:
+            calls.append(pdf_path)
+        return [{"text": f"chunk {i} of {os.path.basename(pdf_path)}", "page_num": i + 1} for i in range(chunks)], {
+            "title": "Test", "page_count": chunks,
+        }
+    return build
+
+
+def test_store_pdf_is_content_addressed():
+    data = fake_pdf()
+    doc_id = store_pdf(data)
+    assert doc_id == document_id_for(data)
+    assert store_pdf(data) == doc_id
+    with open(document_store.document_pdf_path(doc_id), "rb") as f:
+        assert f.read() == data
+
+
+def test_build_document_round_trip():
+    data = fake_pdf()
+    doc_id = store_pdf(data)
+    assert get_document(doc_id) is None
+
+    record = build_document(doc_id, fake_build(chunks=4))
+    assert record["document_id"] == doc_id
+    assert record["num_chunks"] == 4
+    assert record["metadata"]["title"] == "Test"
+    assert record["size_bytes"] == len(data)
+    assert get_document(doc_id) == record
+
+
+def test_get_or_create_builds_once_under_concurrency():
+    data = fake_pdf()
+    calls = []
+    records = []
+    threads = [
+        threading.Thread(target=lambda: records.append(get_or_create_document(data, fake_build(calls=calls))))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({record["document_id"] for record in records}) == 1
+
+
+def test_build_reports_progress():
+    doc_id = store_pdf(fake_pdf())
+    updates = []
+    build_document(doc_id, fake_build(chunks=5), progress=lambda **fields: updates.append(fields))
+    assert updates[0] == {"pages_total": 5}
+    assert {"pages_parsed": 5} in updates
+    assert updates[-1] == {"chunks_embedded": 5}
+
+
+def test_invalid_document_ids_are_rejected():
+    assert get_document("../../etc/passwd") is None
+    assert get_document("A" * 64) is None
+    assert not document_store.is_valid_document_id(None)
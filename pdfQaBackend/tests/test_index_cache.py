@@ -0,0 +1,71 @@
+import os
+
+from index_cache import IndexCache
+
+
+def write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return str(path)
+
+
+def test_hit_after_first_load(tmp_path):
+    cache = IndexCache(max_entries=4, max_bytes=1000)
+    path = write(tmp_path / "a.index", 10)
+    loads = []
+    loader = lambda: loads.append(1) or "a"
+
+    assert cache.get("a", (path,), loader) == "a"
+    assert cache.get("a", (path,), loader) == "a"
+    assert len(loads) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_evicts_least_recently_used_entry(tmp_path):
+    cache = IndexCache(max_entries=2, max_bytes=1000)
+    paths = {key: write(tmp_path / f"{key}.index", 10) for key in "abc"}
+    loads = []
+
+    def get(key):
+        return cache.get(key, (paths[key],), lambda: loads.append(key) or key)
+
+    get("a")
+    get("b")
+    get("a")  # b is now the least recently used
+    get("c")
+    assert cache.stats()["evictions"] == 1
+    get("a")
+    get("b")
+    assert loads == ["a", "b", "c", "b"]
+
+
+def test_byte_budget_evicts_and_skips_oversized_entries(tmp_path):
+    cache = IndexCache(max_entries=10, max_bytes=100)
+    small = write(tmp_path / "small.index", 60)
+    other = write(tmp_path / "other.index", 60)
+    huge = write(tmp_path / "huge.index", 500)
+
+    cache.get("small", (small,), lambda: "small")
+    cache.get("other", (other,), lambda: "other")
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == 60
+
+    assert cache.get("huge", (huge,), lambda: "huge") == "huge"
+    assert cache.stats()["entries"] == 1
+
+
+def test_uncharged_paths_do_not_count(tmp_path):
+    cache = IndexCache(max_entries=10, max_bytes=100)
+    index = write(tmp_path / "a.index", 40)
+    chunks = write(tmp_path / "a.chunks", 1000)
+    cache.get("a", (index, chunks), lambda: "a", charged_paths=(index,))
+    assert cache.stats() == {"entries": 1, "bytes": 40, "hits": 0, "misses": 1, "evictions": 0}
+
+
+def test_changed_file_is_reloaded(tmp_path):
+    cache = IndexCache()
+    path = write(tmp_path / "a.index", 10)
+    cache.get("a", (path,), lambda: "old")
+    write(path, 20)
+    os.utime(path, ns=(0, 0))
+    assert cache.get("a", (path,), lambda: "new") == "new"
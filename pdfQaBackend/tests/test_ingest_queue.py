@@ -0,0 +1,116 @@
+import time
+import uuid
+
+import pytest
+
+from document_store import get_document
+from ingest_queue import IngestQueue
+
+
+def fake_pdf():
+    return f"%PDF-1.4 {uuid.uuid4()}".encode()
+
+
+def build_failing(times):
+    # Builder that raises on its first `times` calls
+    calls = []
+
+    def build(pdf_path, data=None):
+        calls.append(pdf_path)
+        if len(calls) <= times:
+            raise RuntimeError(f"parse error {len(calls)}")
+        return [{"text": "only chunk", "page_num": 1}], {"page_count": 1}
+    build.calls = calls
+    return build
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(build, **kwargs):
+        return IngestQueue(str(tmp_path / "ingest.db"), build, retry_delay=0, **kwargs)
+    return make
+
+
+def test_job_runs_to_done(make_queue):
+    queue = make_queue(build_failing(0))
+    job = queue.submit(fake_pdf())
+    assert job["status"] == "queued"
+
+    queue._run(queue._claim())
+    job = queue.get(job["job_id"])
+    assert (job["status"], job["attempts"], job["chunks_embedded"], job["pages_parsed"]) == ("done", 1, 1, 1)
+    assert get_document(job["document_id"])["num_chunks"] == 1
+
+
+def test_same_pdf_shares_one_job(make_queue):
+    queue = make_queue(build_failing(0))
+    data = fake_pdf()
+    job = queue.submit(data)
+    assert queue.submit(data)["job_id"] == job["job_id"]
+    assert queue.stats() == {"queued": 1}
+
+
+def test_failed_build_is_retried(make_queue):
+    build = build_failing(1)
+    queue = make_queue(build)
+    job_id = queue.submit(fake_pdf())["job_id"]
+
+    queue._run(queue._claim())
+    job = queue.get(job_id)
+    assert (job["status"], job["error"]) == ("queued", "parse error 1")
+
+    queue._run(queue._claim())
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("done", 2, None)
+    assert len(build.calls) == 2
+
+
+def test_job_fails_after_max_attempts(make_queue):
+    queue = make_queue(build_failing(10), max_attempts=2)
+    data = fake_pdf()
+    job_id = queue.submit(data)["job_id"]
+    for _ in range(2):
+        queue._run(queue._claim())
+    assert queue._claim() is None
+
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 2, "parse error 2")
+    # A new upload of a failed PDF starts a fresh job
+    assert queue.submit(data)["job_id"] != job_id
+
+
+def test_retry_waits_for_backoff(tmp_path):
+    queue = IngestQueue(str(tmp_path / "backoff.db"), build_failing(1), retry_delay=60)
+    queue.submit(fake_pdf())
+    queue._run(queue._claim())
+    assert queue._claim() is None
+
+
+def test_expired_lease_is_reclaimed(make_queue):
+    queue = make_queue(build_failing(0), lease=60)
+    job_id = queue.submit(fake_pdf())["job_id"]
+
+    claimed = queue._claim()
+    assert (claimed["job_id"], claimed["status"], claimed["attempts"]) == (job_id, "running", 1)
+    # The worker holding the lease is still alive
+    assert queue._claim() is None
+
+    queue._update(job_id, lease_until=time.time() - 1)
+    reclaimed = queue._claim()
+    assert (reclaimed["job_id"], reclaimed["attempts"]) == (job_id, 2)
+
+
+def test_wait_returns_when_the_worker_finishes(make_queue):
+    queue = make_queue(build_failing(0), poll_interval=0.01)
+    queue.start()
+    job = queue.wait(queue.submit(fake_pdf())["job_id"], timeout=10)
+    assert job["status"] == "done"
+
+
+def test_prune_deletes_old_finished_jobs(make_queue):
+    queue = make_queue(build_failing(0), retention=60)
+    job_id = queue.submit(fake_pdf())["job_id"]
+    queue._run(queue._claim())
+    queue._db().execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time() - 120, job_id))
+    queue.prune()
+    assert queue.get(job_id) is None
@@ -0,0 +1,64 @@
+import uuid
+
+import embedding_service as embedding
+
+from lexical_index import LexicalIndex, identifier_terms, reciprocal_rank_fusion, tokenize
+from rag_engine import build_faiss_index, retrieve_chunk_ids
+
+TEXTS = [
+    "The pump housing is made of cast iron.",
+    "Replace filter AB-1234 every six months.",
+    "The pump pump pump delivers water to the tank.",
+    "Section 3.2.1 lists the warranty terms.",
+]
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Filter AB-1234, see 3.2.1") == ["filter", "ab-1234", "ab", "1234", "see", "3.2.1", "3", "2", "1"]
+    assert identifier_terms("Where is MCA491P or section 3.2.1 or the pump?") == ["mca491p", "3.2.1"]
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    index = LexicalIndex.build(TEXTS)
+    ids, scores = index.search("pump", 10)
+    assert ids.tolist() == [2, 0]
+    assert scores[0] > scores[1] > 0
+
+    # "cast" appears once, "the" everywhere; the rare term decides the ranking
+    ids, _ = index.search("the cast", 10)
+    assert ids[0] == 0
+    assert index.search("nothing matches", 10)[0].tolist() == []
+    assert index.search("1234", 1)[0].tolist() == [1]
+
+
+def test_save_and_load(tmp_path):
+    index = LexicalIndex.build(TEXTS)
+    path = str(tmp_path / "doc.bm25.npz")
+    index.save(path)
+    loaded = LexicalIndex.load(path)
+    for query in ("pump", "ab-1234", "warranty terms"):
+        assert loaded.search(query, 3)[0].tolist() == index.search(query, 3)[0].tolist()
+    assert loaded.contains_all(1, ["ab-1234", "filter"])
+    assert not loaded.contains_all(0, ["ab-1234"])
+
+
+def test_reciprocal_rank_fusion():
+    # Documents ranked well by both lists beat a single first place
+    assert reciprocal_rank_fusion([[1, 2, 3], [2, 3, 1]], [1.0, 1.0], 60)[0] == 2
+    assert reciprocal_rank_fusion([[1, 2], [2, 1]], [2.0, 1.0], 60) == [1, 2]
+    assert reciprocal_rank_fusion([[1], [4]], [1.0, 0.0], 60) == [1, 4]
+
+
+def test_identifier_query_is_answered_lexically(monkeypatch):
+    session_id = uuid.uuid4().hex
+    build_faiss_index([{"text": text} for text in TEXTS], session_id)
+
+    def no_encode(query):
+        raise AssertionError("query was embedded")
+    monkeypatch.setattr(embedding.embedding_service, "encode_query", no_encode)
+    ids, chunks = retrieve_chunk_ids("When do I replace AB-1234?", session_id, top_k=2)
+    assert ids[0] == 1
+    assert chunks[ids[0]]["text"] == TEXTS[1]
+    assert retrieve_chunk_ids("pump", session_id, top_k=2, mode="lexical")[0] == [2, 0]
+    monkeypatch.undo()
+    assert len(retrieve_chunk_ids("pump", session_id, top_k=2, mode="hybrid")[0]) == 2
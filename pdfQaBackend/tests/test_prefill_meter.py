@@ -0,0 +1,56 @@
+import ollama
+import pytest
+
+from fake_ollama import FakeOllama
+from metrics import PrefillMeter
+from prompt_builder import build_prompt, chat_options
+
+SUMMARY = " ".join(f"Section {i} describes the pump maintenance schedule." for i in range(60))
+
+
+@pytest.fixture
+def fake():
+    # Prefill cost dominated by prompt length, no generation delay
+    server = FakeOllama(port=0, prefill_ms=1, prefill_us_per_token=200, token_ms=0, tokens=4).start()
+    yield server
+    server.stop()
+
+
+def ask(client, meter, question, history=()):
+    messages = build_prompt("Page 1: the pump", question, list(history), {"title": "Manual"}, SUMMARY)
+    response = client.chat(model="llama3", messages=messages, **chat_options("llama3"))
+    saved = meter.observe(
+        response["model"], messages, response["prompt_eval_count"], response["prompt_eval_duration"] / 1e9
+    )
+    return messages, response, saved
+
+
+def test_follow_up_questions_save_prefill(fake):
+    client = ollama.Client(host=fake.url)
+    meter = PrefillMeter()
+
+    messages, first, saved = ask(client, meter, "How often is the pump serviced?")
+    assert saved == 0.0
+    assert meter.cold_rate("llama3") == pytest.approx(
+        first["prompt_eval_duration"] / 1e9 / first["prompt_eval_count"]
+    )
+
+    history = [messages[-1], {"role": "assistant", "content": first["message"]["content"]}]
+    _, second, saved = ask(client, meter, "And who does it?", history)
+    # Only the new turn is evaluated, but the whole prompt is counted
+    assert second["prompt_eval_count"] > first["prompt_eval_count"]
+    assert second["prompt_eval_duration"] < first["prompt_eval_duration"]
+    assert saved > 0.5 * meter.cold_rate("llama3") * second["prompt_eval_count"]
+
+
+def test_new_system_message_is_a_cold_sample():
+    meter = PrefillMeter(slots=2)
+    system = lambda name: [{"role": "system", "content": name}]
+    assert meter.observe("m", system("a"), 100, 1.0) == 0.0
+    assert meter.observe("m", system("a"), 100, 0.2) == pytest.approx(0.8)
+    assert meter.observe("m", system("b"), 100, 3.0) == 0.0
+    assert meter.cold_rate("m") == pytest.approx(0.01 + 0.2 * (0.03 - 0.01))
+    # Never reports negative savings
+    assert meter.observe("m", system("b"), 10, 5.0) == 0.0
+    # Models keep separate rates
+    assert meter.cold_rate("other") is None
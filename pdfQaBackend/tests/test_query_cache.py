@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from query_cache import QueryCache, normalize_query, options_key
+
+
+def embed_counter(vectors):
+    # embed() that records what it was asked to encode
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return np.asarray(vectors.get(text, [0.0, 1.0]), dtype="float32")
+    return embed, calls
+
+
+def test_normalized_question_hits_without_embedding():
+    cache = QueryCache()
+    cache.put("doc", "What is the budget?", None, "42", [])
+    embed, calls = embed_counter({})
+
+    entry, level, query_vec = cache.lookup("doc", "  what is the BUDGET ", embed)
+    assert (entry["answer"], level, query_vec) == ("42", "exact", None)
+    assert calls == []
+
+
+def test_key_includes_document_and_retrieval_options():
+    cache = QueryCache(threshold=2.0)  # no semantic hits
+    options = {"mode": "lexical", "token_budget": 500}
+    cache.put("doc", "What is the budget?", None, "lexical answer", [], options=options)
+    embed, _ = embed_counter({})
+
+    assert cache.lookup("doc", "What is the budget?", embed)[1] is None
+    assert cache.lookup("other", "What is the budget?", embed, options=options)[1] is None
+    assert cache.lookup("doc", "What is the budget?", embed, options={"mode": "dense"})[1] is None
+    # Key order of the options does not matter
+    reordered = {"token_budget": 500, "mode": "lexical"}
+    assert cache.lookup("doc", "What is the budget?", embed, options=reordered)[0]["answer"] == "lexical answer"
+    assert options_key(options) == options_key(reordered)
+    assert options_key(None) == options_key({}) == ()
+
+
+def test_semantic_hit_requires_same_options():
+    vectors = {"What is the budget?": [1.0, 0.0], "Tell me the budget": [0.99, 0.05]}
+    embed, _ = embed_counter(vectors)
+    cache = QueryCache(threshold=0.9)
+    cache.put("doc", "What is the budget?", embed("What is the budget?"), "42", [], options={"mode": "dense"})
+
+    entry, level, query_vec = cache.lookup("doc", "Tell me the budget", embed, options={"mode": "dense"})
+    assert (entry["answer"], level) == ("42", "semantic")
+    assert query_vec is not None
+    assert cache.lookup("doc", "Tell me the budget", embed)[1] is None
+
+
+def test_semantic_hit_requires_same_numbers():
+    embed = lambda text: np.array([1.0, 0.0], dtype="float32")
+    cache = QueryCache(threshold=0.9)
+    cache.put("doc", "What is on page 3?", embed(""), "page 3", [])
+    assert cache.lookup("doc", "What is on page 4?", embed)[1] is None
+    assert cache.lookup("doc", "Whats on page 3", embed)[1] == "semantic"
+
+
+def test_per_document_limit_and_expiry(monkeypatch):
+    cache = QueryCache(max_per_document=2, ttl=60)
+    embed, _ = embed_counter({})
+    for i in range(3):
+        cache.put("doc", f"question {i}", None, str(i), [])
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup("doc", "question 0", embed)[0] is None
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert cache.lookup("doc", "question 2", embed)[0] is None
+
+
+def test_normalize_query():
+    assert normalize_query("What's  the\tbudget?") == "what s the budget"
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from session_store import create_session_store, estimate_tokens, trim_history
+
+
+def turn(i):
+    return [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**limits):
+        return create_session_store(request.param, path=str(tmp_path / "sessions.db"), **limits)
+    return make
+
+
+def test_round_trip(make_store):
+    store = make_store()
+    assert store.get_history("s") == []
+    store.append("s", turn(1))
+    store.append("s", turn(2))
+    assert store.get_history("s") == turn(1) + turn(2)
+    assert store.get_history("other") == []
+
+    store.clear("s")
+    assert store.get_history("s") == []
+
+
+def test_keeps_the_newest_messages_in_whole_blocks(make_store):
+    store = make_store(max_messages=5, trim_block=4)
+    for i in range(4):
+        store.append("s", turn(i))
+    # 8 messages, 3 over the limit: a whole block of 4 is dropped
+    assert store.get_history("s") == turn(2) + turn(3)
+
+
+def test_expired_sessions_start_over(make_store, monkeypatch):
+    store = make_store(ttl=60)
+    store.append("s", turn(1))
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert store.get_history("s") == []
+    store.append("s", turn(2))
+    assert store.get_history("s") == turn(2)
+
+
+def test_memory_store_evicts_least_recently_used_session():
+    store = create_session_store("memory", max_sessions=2)
+    store.append("a", turn(1))
+    store.append("b", turn(1))
+    store.get_history("a")
+    store.append("c", turn(1))
+    assert store.get_history("a") == turn(1)
+    assert store.get_history("b") == []
+    assert store.get_history("c") == turn(1)
+
+
+def test_sqlite_store_evicts_least_recently_used_session(tmp_path):
+    store = create_session_store("sqlite", path=str(tmp_path / "sessions.db"), max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        store.append(session_id, turn(1))
+    store._evict(time.time())
+    assert store.get_history("a") == []
+    assert store.get_history("c") == turn(1)
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    create_session_store("sqlite", path=path).append("s", turn(1))
+    assert create_session_store("sqlite", path=path).get_history("s") == turn(1)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_session_store("redis")
+
+
+def test_trim_history_keeps_recent_messages_within_budget():
+    messages = [{"role": "system", "content": "x" * 40}] + turn(1) + turn(2) + turn(3)
+    budget = sum(estimate_tokens(m["content"]) for m in messages[:1] + messages[-4:])
+    assert trim_history(messages, budget) == messages[:1] + turn(2) + turn(3)
+    assert trim_history(messages, 10 ** 6) == messages
+
+
+def test_trim_history_keeps_system_messages_and_drops_orphaned_replies():
+    messages = [{"role": "system", "content": "rules"}] + turn(1) + turn(2)
+    budget = sum(estimate_tokens(m["content"]) for m in messages[:1] + messages[-3:])
+    # The budget reaches back to "answer 1", which would open the history
+    assert trim_history(messages, budget) == messages[:1] + turn(2)
+    assert trim_history(messages, 0) == messages[:1]
+
+
+def test_trim_history_drops_whole_blocks():
+    messages = turn(1) + turn(2) + turn(3)
+    budget = sum(estimate_tokens(m["content"]) for m in messages[-4:])
+    assert trim_history(messages, budget) == turn(2) + turn(3)
+    # Two messages over budget still drop a whole block of 4
+    assert trim_history(messages, budget, block=4) == turn(3)
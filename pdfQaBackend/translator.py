@@ -1,55 +1,233 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import gc
+import re
+import threading
+import time
+from collections import OrderedDict
+
 from aksharamukha import transliterate
-import torch
 
-# Load IndicTrans2 models
-en2mni_tokenizer = AutoTokenizer.from_pretrained(
-    "ai4bharat/indictrans2-en-indic-1B", trust_remote_code=True
-)
-en2mni_model = AutoModelForSeq2SeqLM.from_pretrained(
-    "ai4bharat/indictrans2-en-indic-1B", trust_remote_code=True
+from config import (
+    TRANSLATOR_IDLE_UNLOAD, TRANSLATION_BATCH_SIZE, TRANSLATION_NUM_BEAMS,
+    TRANSLATION_MAX_NEW_TOKENS, TRANSLATION_CACHE_SIZE,
 )
 
-mni2en_tokenizer = AutoTokenizer.from_pretrained(
-    "ai4bharat/indictrans2-indic-en-1B", trust_remote_code=True
-)
-mni2en_model = AutoModelForSeq2SeqLM.from_pretrained(
-    "ai4bharat/indictrans2-indic-en-1B", trust_remote_code=True
-)
+# IndicTrans2 checkpoints, loaded on first use
+TRANSLATION_MODELS = {
+    "en2mni": "ai4bharat/indictrans2-en-indic-1B",
+    "mni2en": "ai4bharat/indictrans2-indic-en-1B",
+}
+
+
+class ModelRegistry:
+    """
+    Lazily loads (tokenizer, model) pairs on first use and unloads models that
+    have been idle for `idle_unload` seconds. Models loaded with preload()
+    are pinned: under a pre-forking server they are shared copy-on-write with
+    the workers, so they are never unloaded.
+    """
+
+    def __init__(self, model_ids, idle_unload=TRANSLATOR_IDLE_UNLOAD):
+        self.model_ids = model_ids
+        self.idle_unload = idle_unload
+        self._models = {}
+        self._last_used = {}
+        self._pinned = set()
+        self._locks = {name: threading.Lock() for name in model_ids}
+        self._reaper = None
+        self._reaper_lock = threading.Lock()
+
+    def get(self, name):
+        entry = self._models.get(name)
+        if entry is None:
+            with self._locks[name]:
+                entry = self._models.get(name)
+                if entry is None:
+                    entry = self._models[name] = self._load(name)
+                    self._start_reaper()
+        self._last_used[name] = time.monotonic()
+        return entry
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def _load(self, name):
+        # transformers/torch are only imported once a translation is needed
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+        model_id = self.model_ids[name]
+        tokenizer = AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
+        # low_cpu_mem_usage maps safetensors weights instead of copying them
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            model_id, trust_remote_code=True, low_cpu_mem_usage=True
+        )
+        model.eval()
+        return tokenizer, model
+
+    def preload(self, names=None):
+        """
+        Load models now and pin them. Call before the server forks workers.
+        """
+        for name in names or self.model_ids:
+            self.get(name)
+            self._pinned.add(name)
+
+    def warm_up(self, names=None):
+        """
+        Load models in a background thread so the first Manipuri query
+        doesn't pay the load time.
+        """
+        def run():
+            for name in names or self.model_ids:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Translator warm-up failed for {name}:", e)
+
+        thread = threading.Thread(target=run, name="translator-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def unload_idle(self):
+        now = time.monotonic()
+        for name in list(self._models):
+            if name in self._pinned:
+                continue
+            with self._locks[name]:
+                if name in self._models and now - self._last_used.get(name, now) > self.idle_unload:
+                    del self._models[name]
+        gc.collect()
+
+    def _start_reaper(self):
+        if not self.idle_unload or self._reaper is not None:
+            return
+        with self._reaper_lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="translator-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(self.idle_unload / 4, 1))
+            self.unload_idle()
+
+
+registry = ModelRegistry(TRANSLATION_MODELS)
+
+
+class _SegmentCache:
+    # LRU of translated segments keyed by (direction, target language, text)
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+segment_cache = _SegmentCache(TRANSLATION_CACHE_SIZE)
+
+# Sentence ends: Latin punctuation, the Bengali danda and the Meetei Mayek cheikhei
+_SENTENCE_END = re.compile(r"(?<=[.!?\u0964\uABEB])\s+")
+
+
+def split_sentences(text):
+    """
+    Split text into paragraphs and each paragraph into sentences, so each
+    `generate` input stays well inside the model's length limit. Returns a
+    list of sentence lists, one per paragraph.
+    """
+    return [
+        [s for s in _SENTENCE_END.split(paragraph.strip()) if s]
+        for paragraph in text.split("\n")
+    ]
+
+
+def translate_batch(texts, direction, target_lang, num_beams=TRANSLATION_NUM_BEAMS):
+    """
+    Translate a list of segments with one model. Cached segments are reused,
+    duplicates are translated once, and the rest go through `generate` in
+    length-sorted batches.
+    """
+    import torch
+
+    results = [None] * len(texts)
+    pending = {}
+    for i, text in enumerate(texts):
+        cached = segment_cache.get((direction, target_lang, text))
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.setdefault(text, []).append(i)
+
+    if pending:
+        tokenizer, model = registry.get(direction)
+        bos_id = tokenizer.lang_code_to_id[target_lang]
+        todo = sorted(pending, key=len)
+        with torch.inference_mode():
+            for start in range(0, len(todo), TRANSLATION_BATCH_SIZE):
+                batch = todo[start:start + TRANSLATION_BATCH_SIZE]
+                inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True)
+                output = model.generate(
+                    input_ids=inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    forced_bos_token_id=bos_id,
+                    num_beams=num_beams,
+                    do_sample=False,
+                    max_new_tokens=TRANSLATION_MAX_NEW_TOKENS,
+                )
+                for text, translated in zip(batch, tokenizer.batch_decode(output, skip_special_tokens=True)):
+                    segment_cache.put((direction, target_lang, text), translated)
+                    for i in pending[text]:
+                        results[i] = translated
+    return results
+
+
+def _translate_text(text, direction, target_lang, num_beams):
+    paragraphs = split_sentences(text)
+    flat = [sentence for paragraph in paragraphs for sentence in paragraph]
+    translated = iter(translate_batch(flat, direction, target_lang, num_beams))
+    return "\n".join(" ".join(next(translated) for _ in paragraph) for paragraph in paragraphs)
 
 
-def translate_to_target(text, target_lang="mni"):
+def translate_to_target(text, target_lang="mni", num_beams=TRANSLATION_NUM_BEAMS):
     """
     Translate from English to Manipuri (or other target language)
     """
-    inputs = en2mni_tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-    output = en2mni_model.generate(
-        input_ids=inputs["input_ids"],
-        attention_mask=inputs["attention_mask"],
-        forced_bos_token_id=en2mni_tokenizer.lang_code_to_id[target_lang]
-    )
-    return en2mni_tokenizer.batch_decode(output, skip_special_tokens=True)[0]
+    return _translate_text(text, "en2mni", target_lang, num_beams)
 
 
-def translate_to_english(text):
+def translate_to_english(text, num_beams=TRANSLATION_NUM_BEAMS):
     """
     Translate from Manipuri to English (auto-handles source language as 'mni')
     """
-    inputs = mni2en_tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-    output = mni2en_model.generate(
-        input_ids=inputs["input_ids"],
-        attention_mask=inputs["attention_mask"],
-        forced_bos_token_id=mni2en_tokenizer.lang_code_to_id["en"]
-    )
-    return mni2en_tokenizer.batch_decode(output, skip_special_tokens=True)[0]
+    return _translate_text(text, "mni2en", "en", num_beams)
 
 
-def is_transliterated_manipuri(text):
+def indic_translate(text, source_lang="mni", target_lang="eng"):
     """
-    Check if the given text appears to be Manipuri written in Roman script.
+    Translate between English and Manipuri in either direction.
     """
-    common_words = ["houjikti", "nahakki", "eemagi", "khallabani", "nattraga"]
-    return any(word in text.lower() for word in common_words)
+    if source_lang in ("en", "eng"):
+        return translate_to_target(text, target_lang)
+    return translate_to_english(text)
 
 
 def transliterate_to_script(text, script="MeeteiMayek"):
@@ -4,12 +4,27 @@ import faiss
 import numpy as np
 import os
 import json
+import hashlib
 from typing import List, Dict
 import streamlit as st
 import ollama
 
-def parse_pdf(file_path:str)->List[Dict]:
-    doc=fitz.open(file_path)
+# Image extraction (background thread, content-hash dedupe, size-capped
+# scratch folder) is shared with the PDF QA backend, so run the app with it
+# on the import path:
+#   PYTHONPATH=pdfQaBackend streamlit run pdf_QA/pdf_qa_app.py
+from image_extractor import ImageExtractor
+
+IMAGE_DIR = "extracted_images"
+
+@st.cache_resource
+def image_extractor() -> ImageExtractor:
+    # One extractor (and worker thread) per process, not per script rerun
+    return ImageExtractor(folder=IMAGE_DIR)
+
+def parse_pdf(pdf_bytes:bytes)->List[Dict]:
+    # Parsed straight from the uploaded bytes; nothing is written to disk
+    doc=fitz.open(stream=pdf_bytes, filetype="pdf")
     parsed_chunks=[]
 
     for page_num,page in enumerate(doc):
@@ -28,17 +43,16 @@ def parse_pdf(file_path:str)->List[Dict]:
                                 "page_num":page_num+1,
                                 "font":span['font']
                             })
-        
-        for img_index, img in enumerate(page.get_images(full=True)):
-            xref=img[0]
-            image=doc.extract_image(xref)
-            img_bytes=image['image']
-            img_ext=image['ext']
-            with open(f"extracted_image_{page_num + 1}_{img_index + 1}.{img_ext}","wb") as img_out:
-                img_out.write(img_bytes)
-    
+
+    doc.close()
     return parsed_chunks
 
+def extract_images(pdf_bytes:bytes) -> bool:
+    # Extracted from the uploaded bytes, keyed by content hash; returns False
+    # if this PDF is already done or queued
+    doc_id=hashlib.sha256(pdf_bytes).hexdigest()[:32]
+    return image_extractor().submit(doc_id, data=pdf_bytes)
+
 def build_faiss_index(chunks:List[Dict],index_path:str="faiss.index",metadata_path:str="metadata.json"):
     texts=[chunk['text'] for chunk in chunks]
     embeddings=embedding_model.encode(texts,convert_to_numpy=True)
@@ -52,14 +66,21 @@ def build_faiss_index(chunks:List[Dict],index_path:str="faiss.index",metadata_pa
 
     print("Saved FAISS index and metadata")
 
-def retrieve_chunks(query: str, index_path: str, metadata_path: str, top_k: int = 5) -> List[Dict]:
+@st.cache_resource(max_entries=8)
+def load_index(index_path: str, metadata_path: str, version: tuple):
+    # `version` is only part of the cache key so a rebuilt index is reloaded
     index = faiss.read_index(index_path)
     with open(metadata_path, 'r', encoding='utf-8') as f:
         metadata = json.load(f)
+    return index, metadata
+
+def retrieve_chunks(query: str, index_path: str, metadata_path: str, top_k: int = 5) -> List[Dict]:
+    version = tuple(os.stat(p).st_mtime_ns for p in (index_path, metadata_path))
+    index, metadata = load_index(index_path, metadata_path, version)
 
     query_vec = embedding_model.encode([query], convert_to_numpy=True)
     D, I = index.search(query_vec, top_k)
-    results = [metadata[i] for i in I[0]]
+    results = [metadata[i] for i in I[0] if i >= 0]
     return results
 
 def generate_answer_ollama(context: List[Dict], query: str, model: str = "llama3") -> str:
@@ -73,16 +94,16 @@ st.title("📄 PDF Question Answering System")
 pdf_file = st.file_uploader("Upload a PDF", type="pdf")
 
 if pdf_file:
-    with open("uploaded.pdf", "wb") as f:
-        f.write(pdf_file.read())
-
-    st.success("PDF uploaded and saved.")
+    st.success("PDF uploaded.")
+    want_images = st.checkbox("Also extract embedded images")
 
     if st.button("Parse and Index PDF"):
         st.info("Parsing PDF...")
-        chunks = parse_pdf("uploaded.pdf")
+        chunks = parse_pdf(pdf_file.getvalue())
         build_faiss_index(chunks)
         st.success("PDF indexed successfully.")
+        if want_images and extract_images(pdf_file.getvalue()):
+            st.info(f"Extracting images in the background into {IMAGE_DIR}/")
 
 query = st.text_input("Ask a question (English or Manipuri supported)")
 